@@ -3,24 +3,44 @@ import json
 import numpy as np
 import pandas
 from cr.testing.result import Result
-from cr.testing.output import Output, OutputType
+from cr.testing.output import Output, OutputType, SourceReference
 from plotly.graph_objects import Figure
 from cr.documentation import Doc
 
 
+# The attributes written of Results and Outputs, as vars() gave them before they were
+# kept in __slots__, so the attributes kept internally since, such as the columns of
+# a ResultTable or the computation of a lazy Output, are not written
+_RESULT_ATTRIBUTES = ('_outputs', '_recording_uid', '_cr_doc')
+_OUTPUT_ATTRIBUTES = ('_value', '_output_type', '_recording_uid', '_output_key', '_cr_doc')
+
+
+def _attributes(obj, names) -> dict:
+    attributes = {}
+    for name in names:
+        try:
+            # Not getattr, as an Output passes unknown attributes on to its value
+            attributes[name] = object.__getattribute__(obj, name)
+        except AttributeError:
+            pass
+    return {key: value for key, value in attributes.items() if not callable(value)}
+
+
 class JsonEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, np.ndarray):
             return obj.tolist()
+        elif isinstance(obj, SourceReference):
+            return obj.resolve().tolist()
         elif isinstance(obj, Result):
-            return vars(obj)
+            return _attributes(obj, _RESULT_ATTRIBUTES)
         elif isinstance(obj, Output):
             obj_dict = {'value': obj.value,
                         'formatted_value': obj.formatted_value,
                         'output_type': obj.output_type,
                         'has_source': obj.has_source
                         }
-            obj_dict.update(vars(obj))
+            obj_dict.update(_attributes(obj, _OUTPUT_ATTRIBUTES))
             return obj_dict
         elif isinstance(obj, OutputType):
             return {'name': obj.name}
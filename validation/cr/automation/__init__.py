@@ -1,4 +1,6 @@
 from .recording import record, avoid_recording, get_active_tape, get_session_tape, set_active_tape
 from .recordable import recordable
 from .runner import Runner
-from .taper import Tape
\ No newline at end of file
+from .taper import Tape
+from .batch import BatchRunner
+from .store import ResultStore, StoredBaseline, open_store
@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import List, Sequence, Union
+import json
+
+from .fusion import fusion_groups, run_fused
+from .recording import is_recording
+from .runner import Runner
+from .taper import Tape
+
+
+def _source_key(source: dict) -> str:
+    # Two ingestions are the same if they are recorded with the same function and
+    # args, the id is ignored as the runner assigns the id of the tape anyway
+    kwargs = {key: value for key, value in source.get('kwargs', {}).items() if key != 'id_'}
+    return json.dumps({**source, 'kwargs': kwargs}, sort_keys=True, default=str)
+
+
+class BatchRunner(object):
+    """
+        Replays many tapes that share source data. A dataset ingested with the same
+        source definition is only ingested once and shared by all tapes, which in
+        turn shares identical segmentations, as a DataSet reuses its segmentations.
+        The tests of all tapes are scheduled on one pool of workers.
+    """
+
+    def __init__(self, tapes: Sequence[Union[dict, str, Path, Tape]],
+                 current_datasets: dict = None, max_workers: int = 4):
+        if not current_datasets:
+            current_datasets = {}
+        # Every runner gets its own mapping, as dataset ids are only unique per tape
+        self.runners = [Runner(tape, dict(current_datasets)) for tape in tapes]
+        self.max_workers = max_workers
+        self._ingested = {}
+
+    def prepare(self):
+        """ Ingest and segment the datasets of every tape, sharing identical ones """
+        shared = {}
+        for runner in self.runners:
+            for dataset_id, definition in runner.dataset_definitions.items():
+                if dataset_id in runner.datasets or not isinstance(definition['source'], dict):
+                    continue
+                shared.setdefault(_source_key(definition['source']), []).append((runner, dataset_id))
+
+        for key, users in shared.items():
+            if key not in self._ingested:
+                # A shared dataset holds the columns of every tape using it
+                columns = set()
+                for runner, dataset_id in users:
+                    required = runner.required_columns(dataset_id)
+                    if required is None:
+                        columns = None
+                        break
+                    columns.update(required)
+                runner, dataset_id = users[0]
+                self._ingested[key] = runner.ingest_dataset(
+                    runner.dataset_definitions[dataset_id], dataset_id, columns)
+            for runner, dataset_id in users:
+                runner.datasets[dataset_id] = self._ingested[key]
+
+        # Segments are resolved up front, such that workers only read the datasets
+        for runner in self.runners:
+            for dataset_id, definition in runner.dataset_definitions.items():
+                if 'parent' in definition:
+                    runner.get_dataset(dataset_id)
+        return self
+
+    def run(self) -> List[dict]:
+        """ Run all tests of all tapes and return the results per tape """
+        self.prepare()
+
+        tasks = []
+        for runner in self.runners:
+            fused = set()
+            for group in fusion_groups(runner.tests).values():
+                tasks.append(partial(run_fused, runner, group))
+                fused.update(group)
+            tasks.extend(
+                partial(runner.run, uid) for uid in runner.tests if uid not in fused)
+
+        # The recording state is global, so recorded tests are run one at a time
+        max_workers = 1 if is_recording() else self.max_workers
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for future in [executor.submit(task) for task in tasks]:
+                future.result()
+
+        return [runner.run_many(fuse=False) for runner in self.runners]
+
+    def __iter__(self):
+        return iter(self.runners)
+
+    def __len__(self):
+        return len(self.runners)
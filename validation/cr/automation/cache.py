@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Iterable
+import logging
+
+from cr.data.dataset import DataSet, Segment
+
+logger = logging.getLogger(__name__)
+
+
+def _lineage(dataset: DataSet):
+    while True:
+        yield dataset
+        if not isinstance(dataset, Segment):
+            return
+        dataset = dataset.parent
+
+
+class DatasetCache(MutableMapping):
+    """
+        The datasets of a Runner, keyed by their id on the tape, within a budget of
+        max_bytes. When the budget is exceeded the least recently used segments are
+        evicted first, then the least recently used ingested datasets. Evicted
+        datasets are rebuilt by the Runner from their definitions when needed again.
+        Datasets given at construction are pinned, as they cannot be rebuilt.
+    """
+
+    def __init__(self, datasets: dict = None, max_bytes: int = None):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = {}
+        self._evicted = set()
+        self.evictions = 0
+        self.rebuilds = 0
+
+        if datasets:
+            for key, dataset in datasets.items():
+                self[key] = dataset
+        self._pinned = set(self._entries.keys())
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self._nbytes.values())
+
+    def __getitem__(self, key):
+        dataset = self._entries[key]
+        self._entries.move_to_end(key)
+        return dataset
+
+    def __setitem__(self, key, dataset):
+        if key in self._evicted:
+            self._evicted.discard(key)
+            self.rebuilds += 1
+            logger.info(f"Rebuilt evicted dataset {key}")
+        self._entries[key] = dataset
+        self._entries.move_to_end(key)
+        # Objects passed by the caller need not be datasets
+        self._nbytes[key] = getattr(dataset, "nbytes", 0)
+
+    def __delitem__(self, key):
+        del self._entries[key]
+        del self._nbytes[key]
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def shrink(self, keep: Iterable[str] = ()):
+        """ Evict datasets until within budget, never evicting keep or their parents """
+        if self.max_bytes is None or self.nbytes <= self.max_bytes:
+            return
+
+        kept = [ancestor for key in keep if key in self._entries
+                for ancestor in _lineage(self._entries[key])]
+
+        # Least recently used first, segments before ingested datasets
+        candidates = [key for key, dataset in self._entries.items()
+                      if isinstance(dataset, Segment)]
+        candidates += [key for key, dataset in self._entries.items()
+                       if not isinstance(dataset, Segment)]
+        for key in candidates:
+            if self.nbytes <= self.max_bytes:
+                break
+            if key in self._pinned or key not in self._entries:
+                continue
+            dataset = self._entries[key]
+            if isinstance(dataset, Segment):
+                # A segmentation is rebuilt as a whole, so it is evicted as a whole
+                group = [entry for entry in self._entries.values()
+                         if getattr(entry, 'segmentation', None) is dataset.segmentation]
+            else:
+                group = [dataset]
+            if any(other is entry for other in kept for entry in group):
+                continue
+            self._evict(group)
+
+    def _evict(self, datasets):
+        # Evict the datasets and everything segmented from them
+        keys = [key for key, entry in self._entries.items()
+                if any(ancestor is dataset for ancestor in _lineage(entry)
+                       for dataset in datasets)]
+        freed = sum(self._nbytes[key] for key in keys)
+        for key in keys:
+            del self[key]
+            self._evicted.add(key)
+
+        # Let the parent forget the segmentation, such that it can be garbage collected
+        for dataset in datasets:
+            if isinstance(dataset, Segment) and dataset.segmentation in dataset.parent.segmentations:
+                dataset.parent.segmentations.remove(dataset.segmentation)
+
+        self.evictions += len(keys)
+        logger.info(f"Evicted {len(keys)} datasets ({', '.join(keys)}) freeing {freed} bytes, "
+                    f"now using {self.nbytes} of {self.max_bytes} bytes")
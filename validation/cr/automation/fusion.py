@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from functools import partial
+from typing import Dict, List, Tuple
+
+from cr.calculation.profile import shared_profile
+
+# Recorded functions, keyed by (module, name), that can be fused together with other
+# functions of the same family when they are computed on the same SourcedArray
+FUSABLE_FUNCTIONS = {
+    ("cr.testing.metric.simple", name): "vector profile" for name in (
+        "missing", "unique_values", "mode", "median", "percentile", "minimum_value",
+        "maximum_value")
+}
+
+# The fused kernel of each family, a context manager sharing the intermediate
+# results of a vector between all functions called on it
+FUSION_KERNELS = {
+    "vector profile": shared_profile
+}
+
+
+def _vector_definition(definition: dict):
+    """ The definition of the SourcedArray a test is computed on, if any """
+    if definition.get('args'):
+        candidate = definition['args'][0]
+    else:
+        candidate = definition.get('kwargs', {}).get('v')
+    if isinstance(candidate, dict) and candidate.get('cr_type') == 'sourcedarray':
+        return candidate
+    return None
+
+
+def _bind_vector(definition: dict, vector) -> dict:
+    """ Copy the test definition with the SourcedArray replaced by vector """
+    definition = definition.copy()
+    if definition.get('args'):
+        definition['args'] = [vector] + list(definition['args'][1:])
+    else:
+        definition['kwargs'] = {**definition['kwargs'], 'v': vector}
+    return definition
+
+
+def fusion_groups(tests: dict, uids: List[str] = None) -> Dict[Tuple[str, str, str], List[str]]:
+    """
+        Group the tests by the (dataset id, column) they are computed on and by
+        their family. Only groups of more than one test are returned.
+    """
+    if uids is None:
+        uids = list(tests.keys())
+
+    groups = OrderedDict()
+    for uid in uids:
+        definition = tests[uid]
+        family = FUSABLE_FUNCTIONS.get((definition['module'], definition['name']))
+        if family is None:
+            continue
+        vector = _vector_definition(definition)
+        if vector is None:
+            continue
+        groups.setdefault((vector['dataset'], vector['name'], family), []).append(uid)
+    return {key: group for key, group in groups.items() if len(group) > 1}
+
+
+def run_fused(runner, uids: List[str] = None) -> List[str]:
+    """
+        Run the fusable tests among uids through their fused kernel, such that
+        the vector is only resolved, masked, sorted and counted once per group.
+        The results are stored in the runner under their own uids, and the uids
+        that were run are returned.
+    """
+    fused = []
+    for (dataset_id, column, family), group in fusion_groups(runner.tests, uids).items():
+        vector = runner.get_dataset(dataset_id)[column]
+        with FUSION_KERNELS[family](vector):
+            for uid in group:
+                definition = _bind_vector(runner.tests[uid], vector)
+                runner._run_once(uid, partial(runner._run_callable, definition, recording_uuid=uid))
+                fused.append(uid)
+    return fused
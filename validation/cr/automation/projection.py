@@ -0,0 +1,66 @@
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+# Recorded ingestion functions, keyed by (module, name), that can read a subset of
+# the columns through a columns kwarg
+PROJECTABLE_FUNCTIONS = {
+    ("cr.data.ingestion", "from_parquet"),
+    ("cr.data.ingestion", "from_parquet_dataset"),
+}
+
+
+def is_projectable(source) -> bool:
+    """ Whether the recorded ingestion can be limited to a subset of the columns """
+    if not isinstance(source, dict):
+        return False
+    if (source.get('module'), source.get('name')) not in PROJECTABLE_FUNCTIONS:
+        return False
+    # Columns chosen when recording are kept as is
+    kwargs = source.get('kwargs', {})
+    return 'columns' not in kwargs and 'columns' not in (kwargs.get('ingestion_kwargs') or {})
+
+
+def _root_of(dataset_definitions: dict, dataset_id: str) -> str:
+    while 'parent' in dataset_definitions[dataset_id]:
+        dataset_id = dataset_definitions[dataset_id]['parent']
+    return dataset_id
+
+
+def _references(definition) -> Iterator[Tuple[str, str, Optional[str]]]:
+    """ Yield (cr_type, dataset id, column) of every dataset referenced in definition """
+    if isinstance(definition, list):
+        for item in definition:
+            yield from _references(item)
+    elif isinstance(definition, dict):
+        if definition.get('cr_type') == 'sourcedarray':
+            yield 'sourcedarray', definition['dataset'], definition['name']
+        elif definition.get('cr_type') == 'dataset':
+            yield 'dataset', definition['dataset'], None
+        else:
+            for value in definition.values():
+                yield from _references(value)
+
+
+def required_columns(tests: dict, dataset_definitions: dict) -> Dict[str, Optional[Set[str]]]:
+    """
+        The columns of each ingested dataset used by the tests, including the columns
+        segmented by. If a test is given a whole dataset or segment every column of
+        its ingested dataset is required, which is given as None.
+    """
+    columns = {dataset_id: set() for dataset_id, definition in dataset_definitions.items()
+               if 'parent' not in definition}
+
+    for definition in dataset_definitions.values():
+        if 'parent' in definition:
+            by = definition['segmentation']['by']
+            root = _root_of(dataset_definitions, definition['parent'])
+            if columns[root] is not None:
+                columns[root].update(by if isinstance(by, list) else [by])
+
+    for definition in tests.values():
+        for cr_type, dataset_id, column in _references(definition):
+            root = _root_of(dataset_definitions, dataset_id)
+            if cr_type == 'dataset':
+                columns[root] = None
+            elif columns[root] is not None:
+                columns[root].add(column)
+    return columns
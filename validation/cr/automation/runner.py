@@ -1,20 +1,33 @@
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from datetime import date
 from importlib import import_module
 from pathlib import Path
-from typing import List, Union
+from typing import AsyncIterator, List, Tuple, Union
 from functools import partial
+import asyncio
+import threading
 import yaml
 
 from cr.data.segmentation.segmentation import SegmentationMethod
 from .recording import is_recording
 from .taper import Tape
+from .fusion import run_fused
+from .cache import DatasetCache
+from .projection import is_projectable, required_columns
+from .store import ResultStore, open_store, stored_keys
 
 class Runner():
-    def __init__(self, tape:Union[dict, str, Path, Tape] , current_datasets:dict=None):
-        if not current_datasets:
-            current_datasets = {}
-
-        self.datasets = current_datasets
+    def __init__(self, tape:Union[dict, str, Path, Tape] , current_datasets:dict=None,
+                 memory_budget:int=None, project_columns:bool=True,
+                 result_store:Union[str, Path, ResultStore]=None, model:str=None):
+        # The datasets are cached within memory_budget bytes, if given
+        self.datasets = DatasetCache(current_datasets, max_bytes=memory_budget)
+        # Guards the datasets when tests are run from several threads
+        self._lock = threading.RLock()
+        # Guards the results, and the tests being run by a thread, which other
+        # threads wait for instead of running them again
+        self._runs_lock = threading.Lock()
+        self._running = {}
 
         if isinstance(tape, Tape):
             # If we are getting a tape with stored objects
@@ -35,7 +48,24 @@ class Runner():
         if not hasattr(self, "_runs"):
             self._runs = {}
 
+        # Only the columns used by the tape are read, when the source allows it
+        self.project_columns = project_columns
+        self._required_columns = None
+
+        # The results run are stored as a run of model in result_store, if given
+        if result_store is not None and not isinstance(result_store, ResultStore):
+            result_store = open_store(result_store)
+        self.result_store = result_store
+        self.model = model
+        self._store_run = None
+
     def _run_callable(self, definition, recording_uuid=None, dry_run=False):
+        if self.result_store is not None:
+            with self.result_store.storing_to(self._get_store_run()):
+                return self._call(definition, recording_uuid, dry_run)
+        return self._call(definition, recording_uuid, dry_run)
+
+    def _call(self, definition, recording_uuid=None, dry_run=False):
         func = self._deserialized_function(definition)
         args = self.get_args(definition.pop('args', []))
         kwargs = self.get_kwargs(definition.pop('kwargs', {}))
@@ -49,11 +79,120 @@ class Runner():
         return func(*args, **kwargs)
 
     def run(self, uid:str, dry_run:bool=False):
-        if uid in self._runs and not dry_run:
+        if dry_run:
+            self._add_run(uid, self._run_callable(self.tests[uid].copy(), recording_uuid=uid, dry_run=True),
+                          store=False)
             return self._runs[uid]
+        return self._run_once(uid, lambda: self._run_callable(self.tests[uid].copy(), recording_uuid=uid))
+
+    def _run_once(self, uid:str, compute):
+        """ The result of uid, computed by compute unless it is run or being run already """
+        with self._runs_lock:
+            if uid in self._runs:
+                return self._runs[uid]
+            future = self._running.get(uid)
+            if future is None:
+                future = self._running[uid] = Future()
+                running = True
+            else:
+                running = False
+        if not running:
+            return future.result()
+
+        try:
+            result = compute()
+            self._add_run(uid, result)
+            future.set_result(result)
+            return result
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        finally:
+            with self._runs_lock:
+                del self._running[uid]
+
+    def _add_run(self, uid:str, result, store:bool=True):
+        with self._runs_lock:
+            self._runs[uid] = result
+        if store and self.result_store is not None:
+            self.result_store.record(
+                self._get_store_run(), result, stored_keys(self.tests, self.dataset_definitions, uid),
+                model=self.model, test=uid)
+
+    def _get_store_run(self) -> int:
+        # The run is started in the store when the first test is run
+        with self._lock:
+            if self._store_run is None:
+                self._store_run = self.result_store.start_run(self.model)
+            return self._store_run
+
+    def save_results(self, path:Union[str, Path], resolve_lazy:bool=True):
+        """ Write the results run so far to a Parquet file, see cr.testing.serialization """
+        from cr.testing.serialization import write_results
+        with self._runs_lock:
+            runs = dict(self._runs)
+        write_results(path, runs, resolve_lazy)
+
+    def load_results(self, path:Union[str, Path], allow_pickle:bool=False):
+        """
+            Read results written by save_results, such that these are not run again.
+            Pickled outputs are only read with allow_pickle, for files you trust.
+        """
+        from cr.testing.serialization import read_results
+        results = read_results(path, allow_pickle)
+        with self._runs_lock:
+            self._runs.update(results)
+        return self
 
-        self._runs[uid] = self._run_callable(self.tests[uid].copy(), recording_uuid=uid, dry_run=dry_run)
-        return self._runs[uid]
+    def run_many(self, uids:List[str]=None, fuse:bool=True) -> dict:
+        if uids is None:
+            uids = list(self.tests.keys())
+
+        # Tests on the same SourcedArray are run together through a fused kernel
+        if fuse:
+            run_fused(self, [uid for uid in uids if uid not in self._runs])
+
+        return {uid: self.run(uid) for uid in uids}
+
+    async def stream(self, uids:List[str]=None, max_concurrency:int=4,
+                     executor:Executor=None) -> AsyncIterator[Tuple[str, object]]:
+        """
+            Run the tests in an executor and yield (uid, result) as each completes.
+            At most max_concurrency tests run at once and new tests are only started
+            when the consumer asks for the next result. Closing or cancelling the
+            iteration cancels the tests that have not started yet.
+        """
+        if uids is None:
+            uids = list(self.tests.keys())
+        # The recording state is global, so recorded tests are run one at a time
+        if is_recording():
+            max_concurrency = 1
+
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+        loop = asyncio.get_running_loop()
+        remaining = iter(uids)
+        running = {}
+        try:
+            while True:
+                while len(running) < max_concurrency:
+                    uid = next(remaining, None)
+                    if uid is None:
+                        break
+                    running[loop.run_in_executor(executor, self.run, uid)] = uid
+                if not running:
+                    break
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    yield running.pop(future), future.result()
+        finally:
+            for future in running:
+                future.cancel()
+            if own_executor:
+                executor.shutdown(wait=False)
 
     def _deserialize_definition(self, definition):
         if isinstance(definition, list):
@@ -99,21 +238,24 @@ class Runner():
         return {key:self._deserialize_definition(value) for key, value in kwargs.items()}
 
     def get_dataset(self, dataset_id):
-        if dataset_id not in self.datasets:
-            datasets = self.recreate_datasets(dataset_id)
-            definition = self.dataset_definitions[dataset_id]
-            
-            # If it is a segment, we need to ensure we target the parent id
-            # as per the taped data
-            if 'parent' in definition:
-                parent_key = definition['parent']
-                parent_id = self.datasets[parent_key].id
-                for dataset in datasets:
-                    self.datasets[dataset.id.replace(parent_id, parent_key)] = dataset
-            else:
-                for dataset in datasets:
-                    self.datasets[dataset.id] = dataset
-        return self.datasets[dataset_id]
+        with self._lock:
+            if dataset_id not in self.datasets:
+                datasets = self.recreate_datasets(dataset_id)
+                definition = self.dataset_definitions[dataset_id]
+
+                # If it is a segment, we need to ensure we target the parent id
+                # as per the taped data
+                if 'parent' in definition:
+                    parent_key = definition['parent']
+                    parent_id = self.datasets[parent_key].id
+                    for dataset in datasets:
+                        self.datasets[dataset.id.replace(parent_id, parent_key)] = dataset
+                else:
+                    for dataset in datasets:
+                        self.datasets[dataset.id] = dataset
+            dataset = self.datasets[dataset_id]
+            self.datasets.shrink(keep=[dataset_id])
+            return dataset
 
     def recreate_datasets(self, dataset_id):
         # The dataset is already instantiated
@@ -125,7 +267,7 @@ class Runner():
         
         # If it's a source dataset ingest it
         if isinstance(definition['source'], dict):
-            return [self.ingest_dataset(definition, dataset_id)]
+            return [self.ingest_dataset(definition, dataset_id, self.required_columns(dataset_id))]
 
         # Otherwise get the parent and resolve the Segmentation
         parent = self.get_dataset(definition['parent'])
@@ -136,8 +278,19 @@ class Runner():
 
         return parent.segment(segmentation_definition['by'], segmentation_method)
 
-    def ingest_dataset(self, definition, id_):
-        dataset = self._run_callable(definition['source'].copy())
+    def required_columns(self, dataset_id):
+        """ The columns of the ingested dataset used by the tape, None if all are """
+        if not self.project_columns:
+            return None
+        if self._required_columns is None:
+            self._required_columns = required_columns(self.tests, self.dataset_definitions)
+        return self._required_columns.get(dataset_id)
+
+    def ingest_dataset(self, definition, id_, columns=None):
+        source = definition['source'].copy()
+        if columns is not None and is_projectable(source):
+            source['kwargs'] = {**source.get('kwargs', {}), 'columns': sorted(columns)}
+        dataset = self._run_callable(source)
         # TODO: A bit dirty - is there an alternative way to ensure ID is maintained?
         dataset._id = id_
         return dataset
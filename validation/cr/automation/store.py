@@ -0,0 +1,317 @@
+"""
+    A persistent store of the scalar outputs of the tests run by Runners, across
+    validation runs, in a SQLite database. Every output is keyed by the model, a
+    fingerprint of the ingested dataset, the test function, the segment and the output
+    key, such that e.g. a metric of a segment over the last runs is a single indexed
+    query. Results held in ResultTables are stored per cell, by row and column name.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterator, Optional, Tuple, Union
+import hashlib
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from cr.plotting.plotly import metric_plots
+from cr.testing.output import OutputType
+from cr.testing.result import Result, ResultTable, ScalarResult
+from .projection import _references, _root_of
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run INTEGER PRIMARY KEY AUTOINCREMENT,
+    model TEXT NOT NULL,
+    created TEXT NOT NULL,
+    label TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    run INTEGER NOT NULL REFERENCES runs(run),
+    model TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    function TEXT NOT NULL,
+    segment TEXT NOT NULL,
+    output TEXT NOT NULL,
+    "row" TEXT NOT NULL,
+    "column" TEXT NOT NULL,
+    test TEXT NOT NULL,
+    arguments TEXT NOT NULL,
+    value REAL,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS results_metric
+    ON results(function, segment, output, "row", "column", model, run);
+CREATE INDEX IF NOT EXISTS results_dataset ON results(dataset, run);
+"""
+
+_stores: Dict[str, 'ResultStore'] = {}
+_stores_lock = Lock()
+
+# The store and run the test being run is stored to, whose baselines are earlier runs
+_current_run: ContextVar = ContextVar('current_run', default=None)
+
+
+def open_store(path: Union[str, Path]) -> 'ResultStore':
+    """ The ResultStore at path, shared by everything opening it in this process """
+    key = str(Path(path).resolve())
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ResultStore(path)
+        return _stores[key]
+
+
+def _segment_path(dataset_definitions: dict, dataset_id: str) -> str:
+    """ The segment ids from the ingested dataset down to dataset_id, joined by / """
+    segments = []
+    while 'parent' in dataset_definitions[dataset_id]:
+        segment = dataset_definitions[dataset_id]['segment']
+        segments.append(segment if isinstance(segment, str) else json.dumps(segment, default=str))
+        dataset_id = dataset_definitions[dataset_id]['parent']
+    return '/'.join(reversed(segments))
+
+
+def _dataset_fingerprint(definition: dict) -> str:
+    """
+        A hash of the recorded ingestion, ignoring the id, and of the size and
+        modification time of the files it reads, as far as these exist.
+    """
+    source = definition['source']
+    if not isinstance(source, dict):
+        source = {'name': definition.get('name')}
+    kwargs = {key: value for key, value in source.get('kwargs', {}).items() if key != 'id_'}
+    files = []
+    for value in [*source.get('args', []), *kwargs.values()]:
+        if isinstance(value, str) and Path(value).exists():
+            stat = Path(value).stat()
+            files.append([value, stat.st_size, stat.st_mtime_ns])
+    key = json.dumps({**source, 'kwargs': kwargs, 'files': files}, sort_keys=True, default=str)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _canonical(definition, tests: dict, dataset_definitions: dict):
+    # Dataset and result ids differ between tapes, the segments and functions do not
+    if isinstance(definition, list):
+        return [_canonical(item, tests, dataset_definitions) for item in definition]
+    if isinstance(definition, dict):
+        if definition.get('cr_type') in ('dataset', 'sourcedarray'):
+            return {'cr_type': definition['cr_type'],
+                    'segment': _segment_path(dataset_definitions, definition['dataset']),
+                    'name': definition.get('name')}
+        if definition.get('cr_type') == 'result':
+            source = tests.get(definition['source_uid'], {})
+            return {'cr_type': 'result', 'function': f"{source.get('module')}.{source.get('name')}"}
+        return {key: _canonical(value, tests, dataset_definitions)
+                for key, value in definition.items()}
+    return definition
+
+
+def stored_keys(tests: dict, dataset_definitions: dict, uid: str) -> dict:
+    """ The dataset, function, segment and arguments a test of a tape is stored by """
+    definition = tests[uid]
+    dataset_ids = list(dict.fromkeys(
+        dataset_id for _, dataset_id, _ in _references(definition)))
+    roots = list(dict.fromkeys(_root_of(dataset_definitions, dataset_id)
+                               for dataset_id in dataset_ids))
+    arguments = {key: definition[key] for key in ('args', 'kwargs') if key in definition}
+    return dict(
+        dataset=','.join(_dataset_fingerprint(dataset_definitions[root]) for root in roots),
+        function=f"{definition['module']}.{definition['name']}",
+        segment=','.join(dict.fromkeys(
+            _segment_path(dataset_definitions, dataset_id) for dataset_id in dataset_ids)),
+        arguments=json.dumps(_canonical(arguments, tests, dataset_definitions),
+                             sort_keys=True, default=str),
+    )
+
+
+def _scalar(value) -> Optional[Tuple[Optional[float], Optional[str]]]:
+    if isinstance(value, (bool, int, float, np.bool_, np.integer, np.floating)):
+        return float(value), None
+    if isinstance(value, str):
+        return None, value
+    return None
+
+
+def _scalar_outputs(result: Result) -> Iterator[Tuple[str, Optional[float], Optional[str]]]:
+    # Lazy outputs are not computed to be stored
+    for key, output in result._outputs.items():
+        if output._output_type == OutputType.UNRESOLVED:
+            continue
+        scalar = _scalar(output.value)
+        if scalar is not None:
+            yield (key, *scalar)
+
+
+def _result_rows(result: Result) -> Iterator[Tuple[str, str, str, Optional[float], Optional[str]]]:
+    """ Yield (output, row, column, value, text) of every scalar output of result """
+    for key, value, text in _scalar_outputs(result):
+        yield key, '', '', value, text
+    if not isinstance(result, ResultTable):
+        return
+
+    row_names = [str(name) for name in result.row_names]
+    column_names = [str(name) for name in result.column_names]
+    if result._outputs['results']._output_type == OutputType.UNRESOLVED:
+        # A table built from columns is stored from its columns
+        for key, column in result._attributes.items():
+            column = np.asarray(column)
+            if column.dtype.kind not in 'biufU':
+                continue
+            is_text = column.dtype.kind == 'U'
+            for (i, j), item in np.ndenumerate(column.reshape(len(row_names), -1)):
+                yield (key, row_names[i], column_names[j],
+                       None if is_text else float(item), str(item) if is_text else None)
+        return
+
+    cells = np.asarray(result.results, dtype=object).reshape(len(row_names), -1)
+    for (i, j), cell in np.ndenumerate(cells):
+        if isinstance(cell, Result):
+            for key, value, text in _scalar_outputs(cell):
+                yield key, row_names[i], column_names[j], value, text
+
+
+class ResultStore(object):
+    """
+        The scalar outputs of validation runs in a SQLite database at path. A run is
+        started with start_run and every result recorded to it is stored under the keys
+        of its test, see stored_keys. The store can be shared by the threads of a Runner.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._lock = Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def start_run(self, model: str = '', label: Optional[str] = None) -> int:
+        """ Start a run of model and return its id """
+        with self._lock, self._connection:
+            run = self._connection.execute(
+                "INSERT INTO runs (model, created, label) VALUES (?, ?, ?)",
+                (model or '', datetime.now().isoformat(timespec='seconds'), label)).lastrowid
+        return run
+
+    @contextmanager
+    def storing_to(self, run: int):
+        """ Within the context, baselines read from this store are read from before run """
+        token = _current_run.set((self, run))
+        try:
+            yield
+        finally:
+            _current_run.reset(token)
+
+    def record(self, run: int, result: Result, keys: dict, model: str = '', test: str = ''):
+        """ Store the scalar outputs of result in run, under keys as given by stored_keys """
+        if not isinstance(result, Result):
+            return
+        rows = [(run, model or '', keys['dataset'], keys['function'], keys['segment'], output,
+                 row, column, test, keys['arguments'], value, text)
+                for output, row, column, value, text in _result_rows(result)]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _where(self, function, output, segment, model, test, arguments, row, column,
+               before=None) -> Tuple[str, list]:
+        clauses, params = ["r.function = ?", "r.output = ?"], [function, output]
+        for name, value in (('segment', segment), ('"row"', row), ('"column"', column),
+                            ('model', model), ('test', test), ('arguments', arguments)):
+            if value is not None:
+                clauses.append(f"r.{name} = ?")
+                params.append(value)
+        if before is not None:
+            clauses.append("r.run < ?")
+            params.append(before)
+        return ' AND '.join(clauses), params
+
+    def history(self, function: str, output: str = 'value', segment: Optional[str] = '',
+                model: Optional[str] = None, test: Optional[str] = None,
+                arguments: Optional[str] = None, row: Optional[str] = '',
+                column: Optional[str] = '', last: Optional[int] = None) -> pd.DataFrame:
+        """
+            The stored values of an output of a test function, over the last runs if
+            given, oldest first. function is given as module.name and a key given as None
+            matches any value, e.g. every segment.
+        """
+        where, params = self._where(function, output, segment, model, test, arguments, row, column)
+        query = (f"SELECT r.run, s.created, s.label, r.model, r.dataset, r.segment, r.test, "
+                 f"r.arguments, r.\"row\", r.\"column\", r.value, r.text "
+                 f"FROM results r JOIN runs s ON s.run = r.run WHERE {where}")
+        if last is not None:
+            query += (f" AND r.run >= (SELECT MIN(run) FROM (SELECT DISTINCT r.run FROM results r "
+                      f"WHERE {where} ORDER BY r.run DESC LIMIT ?))")
+            params = [*params, *params, last]
+        with self._lock:
+            df = pd.read_sql_query(query + " ORDER BY r.run", self._connection, params=params)
+        return df
+
+    def baseline(self, function: str, output: str = 'value', segment: Optional[str] = '',
+                 model: Optional[str] = None, test: Optional[str] = None,
+                 arguments: Optional[str] = None, row: Optional[str] = '',
+                 column: Optional[str] = '', before: Optional[int] = None):
+        """
+            The value of an output in the latest run, before the run a Runner is storing
+            the current test to unless given, or None if it has not been stored.
+        """
+        if before is None:
+            current = _current_run.get()
+            before = current[1] if current is not None and current[0] is self else None
+        where, params = self._where(function, output, segment, model, test, arguments, row, column,
+                                    before)
+        with self._lock:
+            found = self._connection.execute(
+                f"SELECT r.value, r.text FROM results r WHERE {where} "
+                f"ORDER BY r.run DESC LIMIT 1", params).fetchone()
+        if found is None:
+            return None
+        return found[1] if found[0] is None else found[0]
+
+    def runs(self) -> pd.DataFrame:
+        with self._lock:
+            return pd.read_sql_query("SELECT * FROM runs ORDER BY run", self._connection)
+
+    def figure_trend(self, function: str, output: str = 'value', segment: Optional[str] = '',
+                     last: Optional[int] = None, **keys):
+        """ A figure of the history of an output, a line per segment, row and column """
+        df = self.history(function, output, segment, last=last, **keys)
+        traces = {}
+        for (segment_, row, column), group in df.groupby(['segment', 'row', 'column'], sort=False):
+            name = ' '.join(str(part) for part in (segment_, row, column) if part) or output
+            traces[name] = (group['created'] + ' (' + group['run'].astype(str) + ')', group['value'])
+        return metric_plots.figure_trend(traces, title=f"{function.rsplit('.', 1)[-1]} {output}")
+
+
+class StoredBaseline(ScalarResult):
+    """
+        A baseline read from a ResultStore, e.g. the auc_initial of auc_delta, as the
+        value of an output in the latest earlier run, or default if none is stored. It
+        is recorded by its query, so a replayed tape compares to the runs before it.
+    """
+    __slots__ = ('_query',)
+
+    def __init__(self, store: Union[str, Path], function: str, output: str = 'value',
+                 segment: Optional[str] = '', model: Optional[str] = None,
+                 test: Optional[str] = None, default: float = np.nan):
+        self._query = dict(store=str(store), function=function, output=output,
+                           segment=segment, model=model, test=test, default=default)
+        value = open_store(store).baseline(function, output, segment, model, test)
+        super().__init__(output, default if value is None else value)
+
+    def to_dict(self):
+        # Keys matching any value are left out, as None is not recorded
+        return {key: value for key, value in self._query.items() if value is not None}
+
+    @classmethod
+    def from_dict(cls, dict):
+        return cls(**dict)
@@ -40,6 +40,13 @@ def migration_matrix(
                          f"\n{' '*len('ValueError:')} "
                          f"len(start)={len(start)}, len(end)={len(end)}")
 
+    df = _migration_pairs(start, end, drop_nan)
+    df_count = pd.crosstab(df['START'], df['END'], normalize=False, dropna=False)
+    return _migration_from_count(df_count, drop_nan, order, include_all)
+
+
+def _migration_pairs(start, end, drop_nan=True) -> pd.DataFrame:
+    # The (START, END) pairs to count, without missing or with these as 'nan'
     if drop_nan:
         df = pd.DataFrame(data={'START': start, 'END': end}).dropna()
         if not np.issubdtype(df['START'].dtype, np.number):
@@ -52,9 +59,11 @@ def migration_matrix(
                 not np.issubdtype(df['END'].dtype, np.number)):
             df.replace(
                 to_replace=('nan', 'None', '', '<NA>'), value='nan', inplace=True)
+    return df
 
-    df_count = pd.crosstab(df['START'], df['END'], normalize=False, dropna=False)
 
+def _migration_from_count(df_count: pd.DataFrame, drop_nan=True, order=None, include_all=False):
+    # The migration probabilities and counts of the counted pairs, in order
     if order is not None:
         if not drop_nan:
             if 'nan' in df_count.index or 'nan' in df_count.columns:
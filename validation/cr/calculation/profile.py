@@ -0,0 +1,181 @@
+from contextlib import contextmanager
+from functools import cached_property
+from typing import Dict, Tuple
+import threading
+
+import numpy as np
+
+# String markers that are treated as missing for non-numeric vectors
+MISSING_STRINGS = ('nan', 'None', '', '<NA>')
+
+# Profiles shared between metrics, keyed by id of the profiled vector. A fused group
+# of metrics runs on a single thread, so profiles are shared per thread
+_local = threading.local()
+
+
+def _shared_profiles() -> Dict[int, 'VectorProfile']:
+    if not hasattr(_local, 'profiles'):
+        _local.profiles = {}
+    return _local.profiles
+
+
+def _unique_from_sorted(sorted_values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Same output as np.unique(..., return_counts=True) without sorting again
+    if sorted_values.size == 0:
+        return sorted_values, np.zeros(0, dtype=np.int64)
+    is_first = np.empty(sorted_values.shape, dtype=bool)
+    is_first[0] = True
+    np.not_equal(sorted_values[1:], sorted_values[:-1], out=is_first[1:])
+    first_index = np.flatnonzero(is_first)
+    counts = np.diff(np.append(first_index, sorted_values.size))
+    return sorted_values[is_first], counts
+
+
+class VectorProfile(object):
+    """
+        The intermediate results several simple metrics need from the same vector,
+        i.e. the NaN mask, the sorted non-missing values and the unique values with
+        counts. Each intermediate is computed lazily and at most once.
+
+        Nominal vectors carrying a dictionary encoding, i.e. codes and categories,
+        are profiled from the codes: counts by bincount and missing markers looked up
+        once per category, without converting the vector to fixed-width unicode.
+    """
+    def __init__(self, v):
+        self.source = v
+        self.v = v if isinstance(v, np.ndarray) else np.asarray(v)
+
+    @property
+    def size(self):
+        return len(self.v)
+
+    @property
+    def is_numeric(self):
+        return np.issubdtype(self.v.dtype, np.number)
+
+    @property
+    def is_temporal(self):
+        return np.issubdtype(self.v.dtype, np.datetime64)
+
+    @property
+    def is_encoded(self):
+        codes = getattr(self.source, 'codes', None)
+        return codes is not None and len(codes) == self.size
+
+    # Numeric (and temporal) vectors, where missing is NaN/NaT
+    @cached_property
+    def nan_mask(self) -> np.ndarray:
+        return np.isnan(self.v)
+
+    @cached_property
+    def missing_count(self) -> int:
+        return self.nan_mask.sum()
+
+    @cached_property
+    def non_missing(self) -> np.ndarray:
+        return self.v[~self.nan_mask]
+
+    @cached_property
+    def sorted(self) -> np.ndarray:
+        return np.sort(self.non_missing)
+
+    @cached_property
+    def unique(self) -> Tuple[np.ndarray, np.ndarray]:
+        return _unique_from_sorted(self.sorted)
+
+    # Nominal vectors, where missing is one of the MISSING_STRINGS
+    @cached_property
+    def unicode(self) -> np.ndarray:
+        return self.v.astype(np.unicode_)
+
+    @cached_property
+    def unicode_missing_mask(self) -> np.ndarray:
+        return np.isin(self.unicode, MISSING_STRINGS)
+
+    @cached_property
+    def unicode_missing_count(self) -> int:
+        if self.is_encoded:
+            counts = self._category_counts
+            return counts[0] + counts[1:][self._category_missing].sum()
+        return self.unicode_missing_mask.sum()
+
+    @property
+    def unicode_non_missing_count(self) -> int:
+        return self.size - self.unicode_missing_count
+
+    @cached_property
+    def unicode_non_missing(self) -> np.ndarray:
+        return self.unicode[~self.unicode_missing_mask]
+
+    @property
+    def unicode_first_non_missing(self):
+        """ The first non-missing value in the order of the vector """
+        if self.is_encoded:
+            # The missing code -1 indexes the appended True
+            missing = np.append(self._category_missing, True)[self.source.codes]
+            return self._category_unicode[self.source.codes[np.argmin(missing)]]
+        return self.unicode_non_missing[0]
+
+    def unicode_nth(self, n: int):
+        """ The n'th of the sorted non-missing values """
+        if self.is_encoded:
+            values, counts = self.unicode_unique
+            return values[np.searchsorted(np.cumsum(counts), n, side='right')]
+        return self.unicode_sorted[n]
+
+    @cached_property
+    def unicode_sorted(self) -> np.ndarray:
+        return np.sort(self.unicode_non_missing)
+
+    @cached_property
+    def unicode_unique(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self.is_encoded:
+            counts = self._category_counts[1:]
+            present = ~self._category_missing & (counts > 0)
+            # Distinct categories may share a string, e.g. 1 and '1'
+            values, inverse = np.unique(self._category_unicode[present], return_inverse=True)
+            return values, np.bincount(inverse, weights=counts[present],
+                                       minlength=len(values)).astype(np.int64)
+        return _unique_from_sorted(self.unicode_sorted)
+
+    # Dictionary encoded nominal vectors
+    @cached_property
+    def _category_counts(self) -> np.ndarray:
+        # The count of the missing code -1 first, then of each category
+        return np.bincount(np.asarray(self.source.codes, dtype=np.int64) + 1,
+                           minlength=len(self.source.categories) + 1)
+
+    @cached_property
+    def _category_unicode(self) -> np.ndarray:
+        return np.asarray(self.source.categories).astype(np.unicode_)
+
+    @cached_property
+    def _category_missing(self) -> np.ndarray:
+        return np.isin(self._category_unicode, MISSING_STRINGS)
+
+
+def vector_profile(v) -> VectorProfile:
+    """ Get the shared profile of v if one is active, otherwise a fresh profile """
+    shared = _shared_profiles().get(id(v))
+    if shared is not None and shared.source is v:
+        return shared
+    return VectorProfile(v)
+
+
+@contextmanager
+def shared_profile(v):
+    """ Share a single VectorProfile of v between all metrics called on v """
+    key = id(v)
+    profiles = _shared_profiles()
+    previous = profiles.get(key)
+    if previous is not None and previous.source is v:
+        # Already shared by an outer scope
+        yield previous
+        return
+
+    profile = VectorProfile(v)
+    profiles[key] = profile
+    try:
+        yield profile
+    finally:
+        del profiles[key]
@@ -0,0 +1,149 @@
+"""
+    Accumulators computing statistics of a vector given in chunks, e.g. the row groups
+    of a ParquetDataSet, such that the vector never has to be held in memory at once.
+"""
+from typing import Callable, Dict, Iterable, Literal, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from cr.calculation.performance.migration_matrix import _migration_pairs, _migration_from_count
+from cr.calculation.profile import MISSING_STRINGS
+from cr.calculation.representativeness import psi_sub_term
+
+Chunks = Iterable[np.ndarray]
+
+
+def _is_numeric(values: np.ndarray) -> bool:
+    return np.issubdtype(values.dtype, np.number) or np.issubdtype(values.dtype, np.datetime64)
+
+
+def _missing_mask(values: np.ndarray) -> np.ndarray:
+    # As the simple metrics: NaN and NaT for numbers and dates, else MISSING_STRINGS
+    if _is_numeric(values):
+        return np.isnan(values)
+    return np.isin(values.astype(np.unicode_), MISSING_STRINGS)
+
+
+def summary(chunks: Chunks) -> Dict[str, float]:
+    """
+        The count, missing count, sum and mean of the chunks. The sum and mean are
+        NaN, as np.nansum and np.nanmean, if no value is present or the vector is not
+        numeric.
+    """
+    count, missing, non_missing_sum, numeric = 0, 0, 0.0, True
+    for values in chunks:
+        values = np.asarray(values)
+        mask = _missing_mask(values)
+        count += values.size
+        missing += int(mask.sum())
+        numeric = numeric and np.issubdtype(values.dtype, np.number)
+        if numeric:
+            non_missing_sum += values[~mask].sum()
+
+    present = count - missing
+    return {
+        'count': count,
+        'missing': missing,
+        'sum': non_missing_sum if numeric and present else np.nan,
+        'mean': non_missing_sum / present if numeric and present else np.nan,
+    }
+
+
+def finite_summary(chunks: Chunks) -> Dict[str, float]:
+    """ The counts of missing, -inf, +inf and finite values, and the range of the finite values """
+    out = {'count': 0, 'missing': 0, 'neg_inf': 0, 'pos_inf': 0, 'finite': 0,
+           'min': np.inf, 'max': -np.inf}
+    for values in chunks:
+        values = np.asarray(values, dtype=np.float64)
+        finite = np.isfinite(values)
+        out['count'] += values.size
+        out['missing'] += int(np.isnan(values).sum())
+        out['neg_inf'] += int((values == -np.inf).sum())
+        out['pos_inf'] += int((values == np.inf).sum())
+        out['finite'] += int(finite.sum())
+        if finite.any():
+            out['min'] = min(out['min'], values[finite].min())
+            out['max'] = max(out['max'], values[finite].max())
+    return out
+
+
+def histogram(chunks: Chunks, bin_edges: np.ndarray) -> np.ndarray:
+    """ The np.histogram counts of the finite values of the chunks """
+    counts = np.zeros(max(len(bin_edges) - 1, 0), dtype=np.int64)
+    for values in chunks:
+        values = np.asarray(values, dtype=np.float64)
+        counts += np.histogram(values[np.isfinite(values)], bin_edges)[0]
+    return counts
+
+
+def psi_numerical(
+        a: Callable[[], Chunks],
+        b: Callable[[], Chunks],
+        buckets: Union[int, Sequence[float]] = 5,
+        bucket_type: Optional[Literal['bins']] = 'bins',
+) -> Tuple[float, Dict]:
+    """
+        As cr.calculation.psi_numerical, scanning the chunks of a and b twice: for the
+        range of the values and for the histograms. a and b return a new iterable of
+        the chunks on every call. Quantile buckets need every value, so are not supported.
+    """
+    if bucket_type == 'quantiles' and not isinstance(buckets, (Sequence, np.ndarray)):
+        raise ValueError("Quantile buckets cannot be computed in chunks")
+
+    summaries = finite_summary(a()), finite_summary(b())
+    len_a, len_b = (max(summary['count'], 1) for summary in summaries)
+    non_finite = {'relative_frequency': {
+        key: {'a': summaries[0][key] / len_a, 'b': summaries[1][key] / len_b}
+        for key in ('missing', 'neg_inf', 'pos_inf')
+    }}
+    non_finite['psi_summands'] = {
+        key: psi_sub_term(**non_finite['relative_frequency'][key])
+        for key in ('missing', 'neg_inf', 'pos_inf')
+    }
+
+    has_finite = summaries[0]['finite'] > 0 and summaries[1]['finite'] > 0
+    if has_finite:
+        if isinstance(buckets, (Sequence, np.ndarray)):
+            bin_edges = np.array(buckets)
+        else:
+            bin_edges = np.linspace(summaries[0]['min'], summaries[0]['max'], buckets + 1)
+        bin_edges[0] = min(summaries[0]['min'], summaries[1]['min'])
+        bin_edges[-1] = max(summaries[0]['max'], summaries[1]['max'])
+    else:
+        bin_edges = np.array([])
+
+    percents = np.array([histogram(a(), bin_edges) / len_a, histogram(b(), bin_edges) / len_b])
+    psi_summands = np.array([psi_sub_term(a, b) for (a, b) in percents.T])
+    psi_total = sum(psi_summands) + sum([*non_finite['psi_summands'].values()])
+    dict_intermediate = {
+        'bin_edges': bin_edges,
+        'relative_frequency': {'a': percents[0, :], 'b': percents[1, :]},
+        'psi_summands': psi_summands,
+        'non_finite': non_finite
+    }
+    if not has_finite:
+        psi_total = np.nan
+    return psi_total, dict_intermediate
+
+
+def migration_matrix(
+        chunks: Iterable[Tuple[np.ndarray, np.ndarray]],
+        drop_nan=True,
+        order=None,
+        include_all=False,
+):
+    """
+        As cr.calculation.migration_matrix for chunks of (start, end), accumulating
+        the migration counts chunk by chunk.
+    """
+    df_count = None
+    for start, end in chunks:
+        df = _migration_pairs(start, end, drop_nan)
+        chunk_count = pd.crosstab(df['START'], df['END'], normalize=False, dropna=False)
+        df_count = chunk_count if df_count is None else df_count.add(chunk_count, fill_value=0)
+    if df_count is None:
+        df_count = pd.crosstab(pd.Series([], name='START', dtype=object),
+                               pd.Series([], name='END', dtype=object))
+    df_count = df_count.fillna(0).astype(np.int64)
+    return _migration_from_count(df_count, drop_nan, order, include_all)
@@ -1 +1 @@
-from .dataset import DataSet, SourcedArray, Segment, Segmentation
+from .dataset import DataSet, ArrowDataSet, ParquetDataSet, SourcedArray, Segment, Segmentation
@@ -1,23 +1,43 @@
 from __future__ import annotations
-from typing import Callable, Hashable, Union, Optional, List, Literal, Sequence
+from typing import Callable, Dict, Hashable, Iterator, Union, Optional, List, Literal, Sequence
 from cr.data.segmentation.segmentation import SegmentationMethod, CompositeSegmentationMethod
 import numpy as np
+import pandas as pd
 
 
 class SourcedArray(np.ndarray):
-    def __new__(cls, array, dataset, name):
+    def __new__(cls, array, dataset, name, codes=None, categories=None):
         # Input array is an already formed ndarray instance
         # We first cast to be our class type
         obj = np.asarray(array).view(cls)
         # add the new attribute to the created instance
         obj.dataset = dataset
         obj.name = name
+        # The dictionary encoding of a categorical column, array == categories[codes]
+        # with -1 as missing
+        obj.codes = codes
+        obj.categories = categories
+        # Only an array made by the dataset holds the values of the column itself
+        obj.is_column = True
         return obj
 
+    @classmethod
+    def from_values(cls, values, dataset, name) -> SourcedArray:
+        """ A SourcedArray of the values of a column, keeping the codes of a Categorical """
+        if isinstance(values, pd.Categorical):
+            return cls(np.asarray(values), dataset, name, codes=values.codes,
+                       categories=np.asarray(values.categories))
+        return cls(values, dataset, name)
+
     def __array_finalize__(self, obj):
         if obj is None: return
         self.dataset = getattr(obj, 'dataset', None)
         self.name = getattr(obj, 'name', None)
+        # Views and slices do not match the codes, so these are not passed on
+        self.codes = None
+        self.categories = None
+        # Nor do the values of arrays derived from the column, e.g. 1 - column
+        self.is_column = False
 
 class DataSet(object):
 
@@ -25,6 +45,8 @@ class DataSet(object):
         self._id = id
         self._root_dataframe = df
         self._segmentations = []
+        # The bytes of the DataFrame, which does not change, computed once when first asked
+        self._df_nbytes = None
 
     @property
     def id(self):
@@ -42,10 +64,36 @@ class DataSet(object):
     def segmentations(self):
         return self._segmentations
 
+    @property
+    def nbytes(self) -> int:
+        """ The bytes held by the dataset """
+        if self._df_nbytes is None:
+            self._df_nbytes = int(self._df.memory_usage(deep=True).sum())
+        return self._df_nbytes
+
     def __getitem__(self, id: Hashable) -> np.ndarray:
         if isinstance(id, (list, tuple)):
-            return [SourcedArray(self._df[id_].values, dataset=self, name=id_) for id_ in id]
-        return SourcedArray(self._df[id].values, dataset=self, name=id)
+            return [SourcedArray.from_values(self._df[id_].values, dataset=self, name=id_) for id_ in id]
+        return SourcedArray.from_values(self._df[id].values, dataset=self, name=id)
+
+    def iter_chunks(self, columns: List[Hashable]) -> Iterator[Dict[Hashable, np.ndarray]]:
+        """ Iterate the values of columns in chunks of observations, a single chunk in memory """
+        yield {column: np.asarray(self[column]) for column in columns}
+
+    def _iter_chunks_at(self, columns: List[Hashable], indexes) -> Iterator[Dict[Hashable, np.ndarray]]:
+        # The chunks of the observations at indexes, used by the segments of the dataset
+        yield {column: np.asarray(self[column])[indexes] for column in columns}
+
+    def _take(self, id: Hashable, indexes, dataset: DataSet) -> SourcedArray:
+        # The values of column id at indexes, sourced from dataset
+        values = self[id]
+        codes = values.codes[indexes] if values.codes is not None else None
+        return SourcedArray(np.asarray(values)[indexes], dataset=dataset, name=id,
+                            codes=codes, categories=values.categories)
+
+    def _segment(self, by, method: SegmentationMethod):
+        # The segment ids and indexes of the segmentation by method
+        return method.segment(self[by])
 
     def segment(self, by: str, method: SegmentationMethod) -> Segmentation:
         segmentation = [segmentation for segmentation in self.segmentations if
@@ -81,6 +129,178 @@ class DataSet(object):
     def __str__(self):
         return f"{self.__repr__()}: {self.observations} observations and {self._df.shape[1]} variables"
 
+def _arrow_to_values(column) -> Union[np.ndarray, pd.Categorical]:
+    """ The values of an Arrow column as ingested, i.e. with strings as str """
+    series = column.to_pandas()
+    # Dictionary encoded columns are kept as Categoricals
+    if series.dtype == object:
+        series = series.astype(str)
+    return series.values
+
+
+class ArrowDataSet(DataSet):
+    """
+        A DataSet over an Arrow table, typically memory-mapped from an Arrow IPC
+        (Feather V2) file, such that processes opening the same file share one
+        page-cached copy. Columns of a single chunk of numbers or timestamps without
+        nulls are handed out as read-only views of the Arrow buffers. Other columns
+        are converted once, as on ingestion, and kept.
+    """
+
+    def __init__(self, id, table):
+        super().__init__(id, None)
+        self._table = table
+        self._columns = {}
+
+    @classmethod
+    def from_ipc(cls, id, path) -> ArrowDataSet:
+        """ Memory-map an uncompressed Arrow IPC file, compressed files are read into memory """
+        import pyarrow as pa
+        table = pa.ipc.open_file(pa.memory_map(str(path), 'r')).read_all()
+        return cls(id, table)
+
+    @property
+    def _df(self):
+        # Only for compatibility, as converting copies the whole table
+        if self._root_dataframe is None:
+            self._root_dataframe = self._table.to_pandas()
+        return self._root_dataframe
+
+    @property
+    def observations(self):
+        return self._table.num_rows
+
+    @property
+    def nbytes(self) -> int:
+        """ The bytes held by the dataset, memory-mapped buffers are page cache and not counted """
+        nbytes = sum(values.nbytes for values in self._columns.values()
+                     if not isinstance(values, np.ndarray) or values.flags.owndata)
+        if self._root_dataframe is not None:
+            if self._df_nbytes is None:
+                self._df_nbytes = int(self._root_dataframe.memory_usage(deep=True).sum())
+            nbytes += self._df_nbytes
+        return int(nbytes)
+
+    def _column(self, name: Hashable) -> np.ndarray:
+        if name not in self._columns:
+            import pyarrow as pa
+            column = self._table.column(name)
+            values = None
+            if column.num_chunks == 1 and (
+                    pa.types.is_integer(column.type) or pa.types.is_floating(column.type)
+                    or (pa.types.is_timestamp(column.type) and column.type.unit == 'ns'
+                        and column.type.tz is None)):
+                try:
+                    values = column.chunk(0).to_numpy(zero_copy_only=True)
+                except pa.ArrowInvalid:
+                    # Nulls have to be converted into NaN or NaT
+                    pass
+            if values is None:
+                values = _arrow_to_values(column)
+            self._columns[name] = values
+        return self._columns[name]
+
+    def __getitem__(self, id: Hashable) -> np.ndarray:
+        if isinstance(id, (list, tuple)):
+            return [SourcedArray.from_values(self._column(id_), dataset=self, name=id_) for id_ in id]
+        return SourcedArray.from_values(self._column(id), dataset=self, name=id)
+
+    def __str__(self):
+        return f"{self.__repr__()}: {self.observations} observations and {self._table.num_columns} variables"
+
+
+class ParquetDataSet(DataSet):
+    """
+        An out-of-core DataSet over the row groups of a Parquet file, for data larger
+        than memory. Nothing is held in memory: a column is read when indexed, a
+        segment only reads the row groups holding its observations, and iter_chunks
+        scans one row group at a time. Segmentations by methods segmenting each
+        observation on its own, e.g. ByGroup and Temporal, stream the by column.
+    """
+
+    def __init__(self, id, path):
+        import pyarrow.parquet as pq
+        super().__init__(id, None)
+        self.path = path
+        self._file = pq.ParquetFile(str(path))
+        metadata = self._file.metadata
+        # The first observation of every row group, and the number of observations
+        self._offsets = np.cumsum(
+            [0] + [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)])
+
+    @property
+    def _df(self):
+        # Only for compatibility, as this reads the whole file
+        return self._file.read().to_pandas()
+
+    @property
+    def observations(self):
+        return int(self._offsets[-1])
+
+    @property
+    def nbytes(self) -> int:
+        """ Nothing is held in memory """
+        return 0
+
+    @property
+    def columns(self) -> List[str]:
+        return self._file.schema_arrow.names
+
+    def _read_row_group(self, i: int, columns: List[Hashable]) -> Dict[Hashable, np.ndarray]:
+        table = self._file.read_row_group(i, columns=list(columns))
+        return {column: np.asarray(_arrow_to_values(table.column(column))) for column in columns}
+
+    def iter_chunks(self, columns: List[Hashable]) -> Iterator[Dict[Hashable, np.ndarray]]:
+        for i in range(len(self._offsets) - 1):
+            yield self._read_row_group(i, columns)
+
+    def _iter_chunks_at(self, columns: List[Hashable], indexes) -> Iterator[Dict[Hashable, np.ndarray]]:
+        # The indexes of a segment are sorted, so split them by row group
+        indexes = np.asarray(indexes)
+        bounds = np.searchsorted(indexes, self._offsets)
+        for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            if start == end:
+                continue
+            local = indexes[start:end] - self._offsets[i]
+            yield {column: values[local] for column, values in self._read_row_group(i, columns).items()}
+
+    def __getitem__(self, id: Hashable) -> np.ndarray:
+        if isinstance(id, (list, tuple)):
+            return [self[id_] for id_ in id]
+        table = self._file.read(columns=[id])
+        return SourcedArray.from_values(_arrow_to_values(table.column(id)), dataset=self, name=id)
+
+    def _take(self, id: Hashable, indexes, dataset: DataSet) -> SourcedArray:
+        chunks = [chunk[id] for chunk in self._iter_chunks_at([id], indexes)]
+        if not chunks:
+            # No observations, but of the dtype of the column
+            chunks = [self._read_row_group(0, [id])[id][:0]]
+        return SourcedArray(np.concatenate(chunks), dataset=dataset, name=id)
+
+    def _segment(self, by, method: SegmentationMethod):
+        if not isinstance(by, str) or not method._row_local:
+            return super()._segment(by, method)
+
+        if not hasattr(method, 'map') or method._always_recompute:
+            # The map only depends on the unique values
+            uniques = [pd.unique(chunk[by]) for chunk in self.iter_chunks([by])]
+            method.map = method.compute_map(np.concatenate(uniques))
+
+        segment_ids, parts = None, None
+        for offset, chunk in zip(self._offsets, self.iter_chunks([by])):
+            segment_ids, chunk_indexes = method.map.segment(chunk[by])
+            if parts is None:
+                parts = [[] for _ in segment_ids]
+            for part, indexes in zip(parts, chunk_indexes):
+                part.append(indexes[0] + offset)
+        if parts is None:
+            return [], []
+        return segment_ids, [np.concatenate(part) for part in parts]
+
+    def __str__(self):
+        return f"{self.__repr__()}: {self.observations} observations and {len(self.columns)} variables"
+
+
 class Segment(DataSet):
     def __init__(self, parent, indexes, by, segment_id):
         super().__init__(parent.id, parent._root_dataframe)
@@ -97,6 +317,37 @@ class Segment(DataSet):
     def _df(self):
         return self.parent._df.iloc[self._indexes]
 
+    @property
+    def _index_array(self) -> np.ndarray:
+        return self._indexes[0] if isinstance(self._indexes, tuple) else np.asarray(self._indexes)
+
+    @property
+    def observations(self):
+        return len(self._index_array)
+
+    def __getitem__(self, id: Hashable) -> np.ndarray:
+        if isinstance(id, (list, tuple)):
+            return [self[id_] for id_ in id]
+        # Index the column of the parent, rather than every column of the segment
+        return self.parent._take(id, self._index_array, self)
+
+    def _take(self, id: Hashable, indexes, dataset: DataSet) -> SourcedArray:
+        # Nested segments index the column of the root dataset once
+        return self.parent._take(id, self._index_array[indexes], dataset)
+
+    def iter_chunks(self, columns: List[Hashable]) -> Iterator[Dict[Hashable, np.ndarray]]:
+        return self.parent._iter_chunks_at(columns, self._index_array)
+
+    def _iter_chunks_at(self, columns: List[Hashable], indexes) -> Iterator[Dict[Hashable, np.ndarray]]:
+        return self.parent._iter_chunks_at(columns, self._index_array[indexes])
+
+    @property
+    def nbytes(self) -> int:
+        """ The bytes held by the segment itself, i.e. its indexes into the parent """
+        if isinstance(self._indexes, tuple):
+            return int(sum(np.asarray(index).nbytes for index in self._indexes))
+        return int(np.asarray(self._indexes).nbytes)
+
 class Segmentation(object):
     def __init__(self, root_dataset, by, method):
         # TODO: should a segmentation contain an 'uncovered' in cases where observations fall out of a segmentation?
@@ -121,7 +372,7 @@ class Segmentation(object):
         return self.root_dataset.composite_segmentations(self, other_segmentation)
 
     def _create_segments(self):
-        segment_ids, segment_indexes = self.method.segment(self.root_dataset[self.by])
+        segment_ids, segment_indexes = self.root_dataset._segment(self.by, self.method)
         segments = []
         for key, indexes in zip(segment_ids, segment_indexes):
             segment = Segment(
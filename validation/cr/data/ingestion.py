@@ -1,11 +1,29 @@
-from typing import Union, List
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterable, Literal, Union, List, Optional
 from uuid import uuid4
-from .dataset import DataSet
+from .dataset import ArrowDataSet, DataSet, ParquetDataSet
+from .segmentation.segmentation import SegmentationMethod
 from cr.automation.recordable import recordable
+import hashlib
+import json
+import logging
+import os
 import re
+import sys
 import pandas as pd
+from pandas.api.types import union_categoricals
 import numpy as np
 
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
 def _guess_targets(values: List[str]) -> List[str]:
     abbreviations = ["EAD", "LGD", "CR", "LGL", "CCF", "CF", "PD", "Score", "D12", "Exposure"]
     full_names = [
@@ -28,12 +46,48 @@ def _guess_targets(values: List[str]) -> List[str]:
                 potential_matches.append(raw_value)
     return potential_matches
 
-def infer_var_categories(df):
+def _fewer_distinct_than(values: pd.Series, limit: int, block_size: int = 1024) -> bool:
+    """
+        Whether values has fewer than limit distinct non-missing values, counted block
+        by block and stopping as soon as limit distinct values have been seen.
+    """
+    seen = set()
+    start = 0
+    while start < len(values):
+        seen.update(values.iloc[start:start + block_size].dropna().unique())
+        if len(seen) >= limit:
+            return False
+        start += block_size
+        # Few distinct values have to be confirmed on every row, so grow the blocks
+        block_size *= 2
+    return True
+
+
+def infer_var_categories(df, profiling: Literal['early_stop', 'sample', 'exact'] = 'early_stop',
+                         sample_size: int = 100000, max_segmentor_values: int = 12):
+    """
+        Guess the factors, segmentors and targets of df. Columns with fewer than
+        max_segmentor_values distinct values are segmentors, which profiling decides:
+            early_stop: stops counting the values of a column once it has too many
+            sample: as early_stop on a random sample of sample_size rows, which is
+                approximate as rare values may not be sampled
+            exact: counts every distinct value of every column
+    """
     expected_targets = _guess_targets(list(df.columns))
 
     expected_targets = list(dict.fromkeys(expected_targets))  # remove duplicates and
     # keep original order
-    expected_segmentors = list(df.select_dtypes(include=['datetime64']).columns) + list(df.columns[df.nunique() < 12])
+    if profiling == 'exact':
+        few_values = list(df.columns[df.nunique() < max_segmentor_values])
+    elif profiling in ('early_stop', 'sample'):
+        positions = None
+        if profiling == 'sample' and len(df) > sample_size:
+            positions = np.sort(np.random.default_rng(0).choice(len(df), sample_size, replace=False))
+        few_values = [column for column in df.columns if _fewer_distinct_than(
+            df[column] if positions is None else df[column].iloc[positions], max_segmentor_values)]
+    else:
+        raise ValueError(f"Unknown profiling {profiling}")
+    expected_segmentors = list(df.select_dtypes(include=['datetime64']).columns) + few_values
     expected_segmentors = list(dict.fromkeys(expected_segmentors))
     expected_segmentors = [segmentor for segmentor in expected_segmentors if segmentor not in expected_targets]
     expected_factors = df.select_dtypes(include=['number']).columns
@@ -42,42 +96,542 @@ def infer_var_categories(df):
 
     return expected_factors, expected_segmentors, expected_targets
 
-def _init_dataset(df, id_):
+def _normalise_strings(df):
+    # Parse object dtypes into unicode strings, with a single cast per column
+    str_cols = df.select_dtypes(include=['object']).columns
+    if len(str_cols):
+        df[str_cols] = df[str_cols].astype(str)
+    return df
+
+
+def compact_dataframe(df: pd.DataFrame, floats: bool = False, small_ints: bool = False,
+                      max_category_ratio: float = 0.5) -> pd.DataFrame:
+    """
+        Store the columns of df in a smaller dtype holding their values: integers are
+        downcast to int32 and strings repeating often enough are dictionary encoded as
+        Categoricals. With small_ints, integers, e.g. flags and ratings, are downcast
+        to int8/16 as well, which sums and products of the column may overflow. With
+        floats, floats are stored as float32. The memory saved is logged per column.
+        Ingestion with compact passes compact_floats and compact_ints as floats and small_ints.
+    """
+    before = df.memory_usage(deep=True, index=False)
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_bool_dtype(values) or pd.api.types.is_datetime64_any_dtype(values):
+            continue
+        if pd.api.types.is_integer_dtype(values):
+            if small_ints:
+                df[column] = pd.to_numeric(values, downcast='integer')
+            elif values.dtype.itemsize > 4 and (values.empty or np.iinfo(np.int32).min <= values.min()
+                                                and values.max() <= np.iinfo(np.int32).max):
+                df[column] = values.astype(np.int32)
+        elif pd.api.types.is_float_dtype(values):
+            if floats:
+                df[column] = values.astype(np.float32)
+        elif values.dtype == object and values.nunique(dropna=False) <= max_category_ratio * len(values):
+            df[column] = values.astype('category')
+
+    after = df.memory_usage(deep=True, index=False)
+    for column in df.columns:
+        if after[column] < before[column]:
+            logger.info(f"Compacted {column} to {df[column].dtype} saving "
+                        f"{(before[column] - after[column]) / 2**20:.2f} MB "
+                        f"({1 - after[column] / before[column]:.0%})")
+    logger.info(f"Compacted {before.sum() / 2**20:.2f} MB to {after.sum() / 2**20:.2f} MB")
+    return df
+
+
+def _init_dataset(df, id_, compact=False, compact_floats=False, compact_ints=False):
     # if no ID is set generate one
     if not id_:
         id_ = str(uuid4())
 
-    # Parse object dtypes into unicode strings
-    str_cols = df.select_dtypes(include=['object']).columns
-    df[str_cols] = df[str_cols].applymap(lambda x: np.unicode_(x))
-
+    df = _normalise_strings(df)
+    if compact:
+        df = compact_dataframe(df, floats=compact_floats, small_ints=compact_ints)
     return DataSet(id_, df)
 
 
+def _peak_memory() -> Optional[int]:
+    """ The peak resident memory of the process in bytes, if known on this platform """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _categorise(values: pd.Series) -> pd.Series:
+    # Strings are held as a Categorical of str, the values _normalise_strings gives
+    return values.astype(str).astype('category') if values.dtype == object else values
+
+
+def _concat_parts(parts: List[pd.Series]) -> pd.Series:
+    """ The parts of a column over the chunks as one column, with strings as one Categorical """
+    if any(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+        # A column missing in one chunk is parsed as floats in that chunk
+        parts = [part if isinstance(part.dtype, pd.CategoricalDtype) else _categorise(part.astype(object))
+                 for part in parts]
+        return pd.Series(union_categoricals([part.values for part in parts]))
+    return pd.concat(parts, ignore_index=True)
+
+
+def _concat_chunks(chunks: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """
+        Read the chunks one at a time, with the strings of each chunk dictionary encoded
+        as it is read, such that no string column is held as objects for more than a
+        chunk. The columns are then concatenated one at a time, releasing the parts of
+        each, so only the numeric columns are briefly held twice.
+    """
+    columns = {}
+    for i, chunk in enumerate(chunks):
+        for column in chunk.columns:
+            columns.setdefault(column, []).append(_categorise(chunk[column]))
+        peak = _peak_memory()
+        logger.info(f"Ingested chunk {i} of {len(chunk)} rows, "
+                    f"{chunk.memory_usage(deep=True).sum() / 2**20:.1f} MB before encoding strings"
+                    + (f", peak memory of the process {peak / 2**20:.1f} MB" if peak is not None else ""))
+    if not columns:
+        return pd.DataFrame()
+    del chunk
+    return pd.DataFrame({column: _concat_parts(columns.pop(column)) for column in list(columns)})
+
+
+def _read_csv_chunks(path: str, chunksize: int, **kwargs) -> pd.DataFrame:
+    return _concat_chunks(pd.read_csv(path, chunksize=chunksize, **kwargs))
+
+
+def _excel_chunks(path: str, chunksize: int, sheet_name: Union[str, int] = 0,
+                  dtype: dict = None) -> Iterable[pd.DataFrame]:
+    """ Stream the rows of a sheet with the read-only reader of openpyxl, chunksize rows at a time """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if isinstance(sheet_name, str) else workbook.worksheets[sheet_name]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        while True:
+            chunk = list(islice(rows, chunksize))
+            if not chunk:
+                return
+            chunk = pd.DataFrame(chunk, columns=header)
+            yield chunk.astype(dtype) if dtype else chunk.infer_objects()
+    finally:
+        workbook.close()
+
+
+def _read_excel_chunks(path: str, chunksize: int, sheet_name: Union[str, int] = 0,
+                       dtype: dict = None) -> pd.DataFrame:
+    return _concat_chunks(_excel_chunks(path, chunksize, sheet_name, dtype))
+
+
+class IngestionCache(object):
+    """
+        Stores ingested DataFrames as Parquet files in directory, keyed by a fingerprint
+        of the source: the read function, the path, its size and modification time,
+        optionally a hash of its content, and the ingestion kwargs. A changed source
+        gets a new fingerprint, so it is read again. Within max_bytes the least
+        recently used files are removed first.
+    """
+
+    def __init__(self, directory: Union[str, Path], max_bytes: int = None,
+                 hash_content: bool = False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+
+    def _files(self, path: Union[str, Path]) -> List[Path]:
+        path = Path(path)
+        return sorted(p for p in path.rglob('*') if p.is_file()) if path.is_dir() else [path]
+
+    def fingerprint(self, read_func: Callable, path: Union[str, Path], ingestion_kwargs: dict) -> str:
+        files = []
+        for file in self._files(path):
+            stat = file.stat()
+            entry = [str(file.resolve()), stat.st_size, stat.st_mtime_ns]
+            if self.hash_content:
+                digest = hashlib.sha256()
+                with open(file, 'rb') as f:
+                    for block in iter(lambda: f.read(2**20), b''):
+                        digest.update(block)
+                entry.append(digest.hexdigest())
+            files.append(entry)
+        source = dict(
+            read=f"{read_func.__module__}.{read_func.__qualname__}",
+            files=files,
+            kwargs=ingestion_kwargs,
+        )
+        return hashlib.sha256(json.dumps(source, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _entry(self, key: str) -> Path:
+        return self.directory.joinpath(f"{key}.parquet")
+
+    def load(self, key: str) -> Optional[pd.DataFrame]:
+        entry = self._entry(key)
+        if not entry.exists():
+            return None
+        try:
+            df = pd.read_parquet(entry)
+        except Exception as err:
+            logger.warning(f"Ignoring unreadable ingestion cache entry {entry}: {err}")
+            return None
+        # Mark as recently used
+        os.utime(entry)
+        logger.info(f"Loaded cached ingestion {entry}")
+        return df
+
+    def store(self, key: str, df: pd.DataFrame, path: Union[str, Path]):
+        entry = self._entry(key)
+        temporary = entry.with_suffix(f".{uuid4().hex}.tmp")
+        try:
+            df.to_parquet(temporary)
+        except Exception as err:
+            # e.g. column names which are not strings
+            logger.warning(f"Could not cache the ingestion of {path}: {err}")
+            temporary.unlink(missing_ok=True)
+            return
+        os.replace(temporary, entry)
+        entry.with_suffix('.json').write_text(json.dumps({'source': str(Path(path).resolve())}))
+        self._shrink()
+
+    @property
+    def entries(self) -> List[Path]:
+        return list(self.directory.glob('*.parquet'))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(entry.stat().st_size for entry in self.entries)
+
+    def _remove(self, entry: Path):
+        entry.unlink(missing_ok=True)
+        entry.with_suffix('.json').unlink(missing_ok=True)
+
+    def _shrink(self):
+        if self.max_bytes is None:
+            return
+        entries = sorted(self.entries, key=lambda entry: entry.stat().st_mtime)
+        nbytes = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if nbytes <= self.max_bytes:
+                break
+            nbytes -= entry.stat().st_size
+            self._remove(entry)
+            logger.info(f"Removed cached ingestion {entry} to stay within {self.max_bytes} bytes")
+
+    def invalidate(self, path: Union[str, Path] = None):
+        """ Remove the cached ingestions of path, or of every source if no path is given """
+        source = str(Path(path).resolve()) if path is not None else None
+        for entry in self.entries:
+            if source is not None:
+                metadata = entry.with_suffix('.json')
+                if not metadata.exists() or json.loads(metadata.read_text())['source'] != source:
+                    continue
+            self._remove(entry)
+
+
+_ingestion_cache = None
+
+
+def set_ingestion_cache(cache: Optional[IngestionCache]):
+    """ Cache every ingestion in cache, or stop caching with None """
+    global _ingestion_cache
+    _ingestion_cache = cache
+
+
+def get_ingestion_cache() -> Optional[IngestionCache]:
+    return _ingestion_cache
+
+
+def _read(read_func, path: str, ingestion_kwargs: dict) -> pd.DataFrame:
+    """ Read path with read_func, through the ingestion cache if one is set """
+    cache = get_ingestion_cache()
+    if cache is None:
+        return read_func(path, **ingestion_kwargs)
+
+    key = cache.fingerprint(read_func, path, ingestion_kwargs)
+    df = cache.load(key)
+    if df is None:
+        df = _normalise_strings(read_func(path, **ingestion_kwargs))
+        cache.store(key, df, path)
+    return df
+
+
 @recordable
-def _from(read_func, path: str, id_: str = None, ingestion_kwargs: dict = None) -> DataSet:
+def _from(read_func, path: str, id_: str = None, ingestion_kwargs: dict = None,
+          compact: bool = False, compact_floats: bool = False,
+          compact_ints: bool = False) -> DataSet:
     if not ingestion_kwargs:
         ingestion_kwargs = {}
-    df = read_func(path, **ingestion_kwargs)
-    return _init_dataset(df, id_)
+    df = _read(read_func, path, ingestion_kwargs)
+    return _init_dataset(df, id_, compact, compact_floats, compact_ints)
+
+
+def _from_files(read_func, path_glob: str, id_: str = None, ingestion_kwargs: dict = None,
+                partition_column: str = None, partition_format: str = None,
+                segmentation: SegmentationMethod = None, max_workers: int = 4,
+                compact: bool = False, compact_floats: bool = False,
+                compact_ints: bool = False) -> DataSet:
+    paths = sorted(glob(path_glob))
+    if not paths:
+        raise FileNotFoundError(f"No files match {path_glob}")
+    if segmentation is not None and partition_column is None:
+        raise ValueError("A segmentation of the partitions requires a partition_column")
+    if not ingestion_kwargs:
+        ingestion_kwargs = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(executor.map(lambda path: _read(read_func, path, ingestion_kwargs), paths))
+    logger.info(f"Ingested {len(paths)} files matching {path_glob}")
+
+    if partition_column is not None:
+        # The partition of each row is the name of its file
+        partitions = [Path(path).stem for path in paths]
+        if partition_format is not None:
+            partitions = list(pd.to_datetime(partitions, format=partition_format))
+        frames = [frame.assign(**{partition_column: partition})
+                  for frame, partition in zip(frames, partitions)]
+    df = pd.concat(frames, ignore_index=True)
+    dataset = _init_dataset(df, id_, compact, compact_floats, compact_ints)
+
+    if segmentation is not None:
+        dataset.segment(partition_column, segmentation)
+    return dataset
+
+
+@recordable
+def from_excel(path: str, id_: str = None, ingestion_kwargs: dict = None,
+               chunksize: int = None, dtype: dict = None, compact: bool = False,
+               compact_floats: bool = False, compact_ints: bool = False) -> DataSet:
+    """
+        With chunksize the sheet is read chunksize rows at a time, by the read-only
+        reader of openpyxl, rather than loaded as a whole workbook. The chunks are all
+        held until concatenated. Only sheet_name is used of ingestion_kwargs.
+    """
+    ingestion_kwargs = dict(ingestion_kwargs or {})
+    if chunksize:
+        chunk_kwargs = dict(chunksize=chunksize, sheet_name=ingestion_kwargs.get('sheet_name', 0),
+                            dtype=dtype)
+        return _from(_read_excel_chunks, path, id_, chunk_kwargs, compact, compact_floats, compact_ints)
+    if dtype is not None:
+        ingestion_kwargs['dtype'] = dtype
+    return _from(pd.read_excel, path, id_, ingestion_kwargs, compact, compact_floats, compact_ints)
+
+
+@recordable
+def from_csv(path: str, id_: str = None, ingestion_kwargs: dict = None,
+             chunksize: int = None, dtype: dict = None, compact: bool = False,
+             compact_floats: bool = False, compact_ints: bool = False) -> DataSet:
+    """
+        With chunksize the file is parsed chunksize rows at a time, though the
+        chunks are all held until concatenated. Give the dtype of every column, such
+        that each chunk is parsed with the same schema rather than one inferred per chunk.
+    """
+    ingestion_kwargs = dict(ingestion_kwargs or {})
+    if dtype is not None:
+        ingestion_kwargs['dtype'] = dtype
+    if chunksize:
+        return _from(_read_csv_chunks, path, id_, {**ingestion_kwargs, 'chunksize': chunksize},
+                     compact, compact_floats, compact_ints)
+    return _from(pd.read_csv, path, id_, ingestion_kwargs, compact, compact_floats, compact_ints)
+
+
+def _filter_expression(filters: list):
+    """
+        The pyarrow.dataset expression of filters in disjunctive normal form, a list of
+        (column, op, value) or a list of such lists, as accepted by pd.read_parquet
+    """
+    import pyarrow.dataset as ds
+
+    def predicate(column, op, value):
+        field = ds.field(column)
+        if op in ("=", "=="):
+            return field == value
+        if op == "!=":
+            return field != value
+        if op == "<":
+            return field < value
+        if op == "<=":
+            return field <= value
+        if op == ">":
+            return field > value
+        if op == ">=":
+            return field >= value
+        if op == "in":
+            return field.isin(list(value))
+        if op == "not in":
+            return ~field.isin(list(value))
+        raise ValueError(f"Unsupported filter operator {op!r} on {column}")
+
+    if not isinstance(filters[0][0], (list, tuple)):
+        filters = [filters]
+    disjunction = None
+    for conjunction in filters:
+        expression = None
+        for column, op, value in conjunction:
+            term = predicate(column, op, value)
+            expression = term if expression is None else expression & term
+        disjunction = expression if disjunction is None else disjunction | expression
+    return disjunction
+
+
+def _read_parquet(path: str, columns: List[str] = None, filters: list = None, **kwargs) -> pd.DataFrame:
+    # Other pandas options are left to pandas
+    if kwargs:
+        return pd.read_parquet(path, columns=columns, filters=filters, **kwargs)
+
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    if columns is not None:
+        # Keep the order of the file
+        missing = set(columns).difference(dataset.schema.names)
+        if missing:
+            raise KeyError(f"Columns {sorted(missing)} not found in {path}")
+        columns = [name for name in dataset.schema.names if name in columns]
+    # Row groups whose statistics do not match the filters are never read
+    expression = _filter_expression(filters) if filters else None
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
 
 
 @recordable
-def from_excel(*args, **kwargs) -> DataSet:
-    return _from(pd.read_excel, *args, **kwargs)
+def from_parquet(path: str, id_: str = None, ingestion_kwargs: dict = None,
+                 columns: List[str] = None, filters: list = None, compact: bool = False,
+                 compact_floats: bool = False, compact_ints: bool = False) -> DataSet:
+    """
+        Only the given columns and the rows matching filters are read. Filters are
+        given in disjunctive normal form as for pd.read_parquet, e.g.
+        [("portfolio", "==", "PRIVAT"), ("year", ">=", 2016)].
+    """
+    ingestion_kwargs = dict(ingestion_kwargs or {})
+    if columns is not None:
+        ingestion_kwargs['columns'] = columns
+    if filters is not None:
+        ingestion_kwargs['filters'] = filters
+    return _from(_read_parquet, path, id_, ingestion_kwargs, compact, compact_floats, compact_ints)
 
 
 @recordable
-def from_csv(*args, **kwargs) -> DataSet:
-    return _from(pd.read_csv, *args, **kwargs)
+def from_parquet_dataset(path_glob: str, id_: str = None, partition_column: str = None,
+                         partition_format: str = None, segmentation: SegmentationMethod = None,
+                         columns: List[str] = None, filters: list = None, max_workers: int = 4,
+                         compact: bool = False, compact_floats: bool = False,
+                         compact_ints: bool = False) -> DataSet:
+    """
+        Ingest every Parquet file matching path_glob, e.g. "extracts/*.parquet", reading
+        the files concurrently and concatenating them once. With partition_column the
+        name of its file is stored in that column for each row, parsed as a date if
+        partition_format is given, e.g. "snapshot_%Y-%m". With segmentation the
+        dataset is segmented by the partitions, e.g. by ByGroup() or Temporal("monthly").
+    """
+    ingestion_kwargs = {}
+    if columns is not None:
+        ingestion_kwargs['columns'] = [column for column in columns if column != partition_column]
+    if filters is not None:
+        ingestion_kwargs['filters'] = filters
+    return _from_files(_read_parquet, path_glob, id_, ingestion_kwargs, partition_column,
+                       partition_format, segmentation, max_workers, compact, compact_floats,
+                       compact_ints)
+
+
+@recordable
+def from_csv_dataset(path_glob: str, id_: str = None, ingestion_kwargs: dict = None,
+                     partition_column: str = None, partition_format: str = None,
+                     segmentation: SegmentationMethod = None, max_workers: int = 4,
+                     compact: bool = False, compact_floats: bool = False,
+                     compact_ints: bool = False) -> DataSet:
+    """ As from_parquet_dataset for CSV files, each read by pd.read_csv(path, **ingestion_kwargs) """
+    return _from_files(pd.read_csv, path_glob, id_, ingestion_kwargs, partition_column,
+                       partition_format, segmentation, max_workers, compact, compact_floats,
+                       compact_ints)
+
+
+def _sql_chunks(url: str, query: str, params: dict = None,
+                chunksize: int = 10000) -> Iterable[pd.DataFrame]:
+    """ Stream the rows of query through a server-side cursor, chunksize rows at a time """
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(url)
+    try:
+        with engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(
+                text(query), params or {})
+            columns = list(result.keys())
+            empty = True
+            while True:
+                rows = result.fetchmany(chunksize)
+                if not rows:
+                    break
+                empty = False
+                # Typed as pd.read_sql would, e.g. Decimal as float
+                yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+            if empty:
+                yield pd.DataFrame(columns=columns)
+    finally:
+        engine.dispose()
+
+
+def _concat_column(parts: List[pd.Series]) -> pd.Series:
+    """
+        The parts of a column over the chunks of a query as one column, typed by its
+        first chunk with a value. A chunk of only NULLs is of object dtype, and would
+        otherwise make the whole column object, so it is cast to missing values of that type.
+    """
+    typed = next((part for part in parts if part.notna().any()), None)
+    if typed is not None and typed.dtype != object:
+        dtype = np.float64 if typed.dtype.kind in "iub" else typed.dtype
+        parts = [part.astype(dtype) if part.dtype == object else part for part in parts]
+    # Columns typed differently between chunks, e.g. integers with NULLs in some, are upcast
+    return pd.concat(parts, ignore_index=True)
 
 
 @recordable
-def from_parquet(*args, **kwargs) -> DataSet:
-    return _from(pd.read_parquet, *args, **kwargs)
+def from_sql(url: str, query: str, id_: str = None, params: dict = None,
+             chunksize: int = 10000, compact: bool = False,
+             compact_floats: bool = False, compact_ints: bool = False) -> DataSet:
+    """
+        Ingest the result of query, e.g. "SELECT * FROM tenant_db.ifrs9_output WHERE
+        timestamp = :timestamp" with params {"timestamp": "2022-12-31"}, on the database
+        at the SQLAlchemy url. The rows are streamed in chunks and collected per column,
+        so there is no intermediate DataFrame of every row. The url is recorded on the
+        tape, so keep passwords out of it, e.g. in ~/.pgpass for Postgres.
+    """
+    columns = {}
+    for i, chunk in enumerate(_sql_chunks(url, query, params, chunksize)):
+        for column in chunk.columns:
+            columns.setdefault(column, []).append(chunk[column])
+        logger.info(f"Ingested chunk {i} of {len(chunk)} rows")
+    df = pd.DataFrame({column: _concat_column(parts) for column, parts in columns.items()})
+    return _init_dataset(df, id_, compact, compact_floats, compact_ints)
 
 
 @recordable
 def from_feather(*args, **kwargs) -> DataSet:
     return _from(pd.read_feather, *args, **kwargs)
 
+
+
+@recordable
+def from_parquet_out_of_core(path: str, id_: str = None) -> DataSet:
+    """
+        Open a Parquet file as a ParquetDataSet, which reads its row groups when needed
+        rather than the whole file, for files larger than memory. Write the file with
+        row groups small enough to be read one at a time, e.g. with row_group_size.
+    """
+    if not id_:
+        id_ = str(uuid4())
+    return ParquetDataSet(id_, path)
+
+
+@recordable
+def from_arrow(path: str, id_: str = None) -> DataSet:
+    """
+        Memory-map an Arrow IPC (Feather V2) file, without reading it into memory. The
+        file should be written uncompressed, e.g. df.to_feather(path, compression="uncompressed").
+    """
+    if not id_:
+        id_ = str(uuid4())
+    return ArrowDataSet.from_ipc(id_, path)
@@ -18,6 +18,9 @@ class NaNHandler(object):
     def transform(self, values):
         nans = np.isnan(values)
         if np.any(nans):
+            if not values.flags.writeable:
+                # e.g. a memory-mapped column
+                values = values.copy()
             nans_idx = np.nonzero(nans)
             if self.method == "min":
                 values[nans_idx] = np.min(values[~nans])
@@ -32,6 +32,10 @@ class ByGroup(SegmentationMethod):
 
         return MapByGroups(groups)
 
+    @property
+    def _row_local(self):
+        return True
+
     def to_dict(self):
         return {**super().to_dict(), **{"groups": self.groups}}
 
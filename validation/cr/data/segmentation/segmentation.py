@@ -3,6 +3,7 @@ import numpy as np
 import itertools
 from functools import reduce, partial
 from .maps import SegmentationMap
+from .utilities import _eq
 
 class SegmentationMethod(object):  
     """ A SegmentationMethod can both define segments and map observations into these segments"""
@@ -21,6 +22,12 @@ class SegmentationMethod(object):
         # If a segmentationmethod should always recompute it map!
         return False
 
+    @property
+    def _row_local(self):
+        # If the map only depends on the unique values and every observation is
+        # segmented on its own, such that the values can be segmented in chunks
+        return False
+
     def to_dict(self):
         return dict(map = self.map.to_dict())
 
@@ -36,6 +43,9 @@ class CompositeSegmentationMethod(SegmentationMethod):
     def __init__(self, methods:List[SegmentationMethod]):
         self.methods = methods
 
+    def __eq__(self, other):
+        return _eq(self, other, ['methods'])
+
     def segment(self, values:np.ndarray) -> Dict:
         # Take the cartesian product of the segmentation methods 
         # each methods return [(segment_id, segment_indexes), ...]
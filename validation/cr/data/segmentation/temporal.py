@@ -67,6 +67,10 @@ class Temporal(SegmentationMethod):
     def _always_recompute(self):
         return True 
 
+    @property
+    def _row_local(self):
+        return True
+
     def to_dict(self):
         return {**super().to_dict(), **{"frequency": self.frequency}}
 
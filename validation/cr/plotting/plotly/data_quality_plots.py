@@ -2,6 +2,18 @@ import numpy as np
 import plotly.graph_objects as go
 from scipy.stats.kde import gaussian_kde
 
+from .decimation import get_decimation
+
+# Vectors are binned in at most this many bins, such that figures are bounded in size
+MAX_NR_OF_BINS = 1000
+
+
+def _numpy_histogram(v):
+    counts, bin_edges = np.histogram(v, bins='auto')
+    if bin_edges.size > MAX_NR_OF_BINS + 1:
+        counts, bin_edges = np.histogram(v, bins=MAX_NR_OF_BINS)
+    return counts, bin_edges
+
 
 def figure_histogram(v, name, norm='count', plot_kde=False) -> go.Figure:
     """
@@ -17,8 +29,30 @@ def figure_histogram(v, name, norm='count', plot_kde=False) -> go.Figure:
         norm_string = 'Count'
     unique_values, unique_values_count = np.unique(v, return_counts=True)
     bar_gap = max(0.1, 1 / max(len(unique_values), 2))
-    fig = go.Figure(data=[go.Histogram(
-        x=v, histnorm=norm,
+
+    # The bins are counted here, instead of sending every value to plotly
+    if (np.issubdtype(v.dtype, np.number) and len(unique_values) > MAX_NR_OF_BINS
+            or not unique_values_as_bins(v, unique_values, unique_values_count)):
+        counts, bin_edges = _numpy_histogram(v)
+        x, width = (bin_edges[:-1] + bin_edges[1:])/2, np.diff(bin_edges)
+    else:
+        x, width, counts = unique_values, None, unique_values_count
+    total = max(np.sum(counts), 1)
+    if width is not None:
+        bin_width = width
+    elif np.issubdtype(v.dtype, np.number) and len(unique_values) > 1:
+        # Values drawn as bins are as wide as the closest values are apart
+        bin_width = np.min(np.diff(unique_values))
+    else:
+        bin_width = 1
+    y = {
+        'percent': 100*counts/total,
+        'probability': counts/total,
+        'density': counts/bin_width,
+        'probability density': counts/(total*bin_width),
+    }.get(norm, counts)
+    fig = go.Figure(data=[go.Bar(
+        x=x, y=y, width=width,
         hovertemplate=name + '=%{x}<br>' + norm_string + '=%{y}<extra></extra>')])
     # Should we add kernel density?
     if plot_kde:
@@ -74,11 +108,8 @@ def figure_bar_histogram(
         if unique_values is None and unique_values_count is None:
             unique_values, unique_values_count = np.unique(v, return_counts=True)
         x = unique_values
-    else:
-        counts, bin_edges = np.histogram(v, bins='auto')
-        max_nr_of_bins = 1000
-        if bin_edges.size > max_nr_of_bins + 1:
-            counts, bin_edges = np.histogram(v, bins=max_nr_of_bins)
+    if not unique_value_bins or len(x) > MAX_NR_OF_BINS and np.issubdtype(v.dtype, np.number):
+        counts, bin_edges = _numpy_histogram(v)
         unique_values_count = counts
         x = (bin_edges[:-1] + bin_edges[1:])/2
     norm = norm.lower()
@@ -109,8 +140,12 @@ def figure_bar_histogram(
 
 
 def scatter_kernel_density(v, name, value_name, x_range=None) -> go.Scatter:
+    # The density is evaluated in at most as many points as a curve is decimated to
+    max_points, _ = get_decimation()
     if x_range is None:
-        x_range = np.linspace(np.min(v), np.max(v), len(v))
+        x_range = np.linspace(np.min(v), np.max(v), len(v) if max_points is None else min(len(v), max_points))
+    elif max_points is not None and len(x_range) > max_points:
+        x_range = np.linspace(np.min(x_range), np.max(x_range), max_points)
     kernel = gaussian_kde(v)
     hover_template = name + '=%{x}<br>' + value_name + '=%{y}<extra></extra>'
     return go.Scatter(x=x_range,
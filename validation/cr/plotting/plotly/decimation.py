@@ -0,0 +1,76 @@
+"""
+    Decimation of the curves of figures, such as CAP, ROC and density curves, which
+    would otherwise hold a point per observation or threshold. A curve is reduced to
+    at most max_points points, keeping the points whose removal would move the curve
+    the most, until the curve drawn through the points kept is within tolerance of
+    every point removed, vertically and as a fraction of the range of the curve.
+"""
+from heapq import heappop, heappush
+from typing import Optional, Tuple
+
+import numpy as np
+
+# The defaults of every figure builder of cr.plotting.plotly, see set_decimation
+_max_points = 1000
+_tolerance = 1e-3
+
+
+def set_decimation(max_points: Optional[int] = 1000, tolerance: float = 1e-3):
+    """ Set the default decimation of curves, or disable it with max_points None """
+    global _max_points, _tolerance
+    _max_points = max_points
+    _tolerance = tolerance
+
+
+def get_decimation() -> Tuple[Optional[int], float]:
+    return _max_points, _tolerance
+
+
+def _max_error(x: np.ndarray, y: np.ndarray, start: int, end: int) -> Tuple[float, int]:
+    """ The largest vertical distance of the points in start:end to their chord, and where """
+    if end - start < 2:
+        return 0.0, start
+    xs, ys = x[start:end + 1], y[start:end + 1]
+    dx = xs[-1] - xs[0]
+    # Points on a vertical chord are placed along it by their order
+    t = (xs - xs[0]) / dx if dx != 0 else np.linspace(0, 1, xs.size)
+    errors = np.abs(ys - (ys[0] + t * (ys[-1] - ys[0])))
+    i = int(np.argmax(errors))
+    return float(errors[i]), start + i
+
+
+def decimate(x, y, max_points: Optional[int] = None,
+             tolerance: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+        The points of the curve (x, y), x sorted, to draw with at most max_points
+        points, and within tolerance of the curve unless that needs more points. When
+        max_points is reached first, the points removed are not bounded by tolerance,
+        only the furthest of them were kept. The defaults are those of set_decimation.
+        Curves with missing values are kept.
+    """
+    default_max_points, default_tolerance = get_decimation()
+    max_points = default_max_points if max_points is None else max_points
+    tolerance = default_tolerance if tolerance is None else tolerance
+
+    x, y = np.asarray(x), np.asarray(y, dtype=np.float64)
+    if max_points is None or x.size <= max_points or not np.all(np.isfinite(y)):
+        return x, y
+    x_float = x.astype(np.float64)
+    scale = (y.max() - y.min()) or 1.0
+
+    # Split the segment furthest from its chord first, until all are within tolerance
+    kept = [0, x.size - 1]
+    error, split = _max_error(x_float, y, 0, x.size - 1)
+    segments = [(-error, 0, x.size - 1, split)]
+    while segments and len(kept) < max_points:
+        error, start, end, split = heappop(segments)
+        if -error <= tolerance * scale:
+            break
+        kept.append(split)
+        for a, b in ((start, split), (split, end)):
+            error, index = _max_error(x_float, y, a, b)
+            if error > 0:
+                heappush(segments, (-error, a, b, index))
+
+    kept = np.sort(kept)
+    return x[kept], y[kept]
@@ -0,0 +1,74 @@
+"""
+    Export of many figures through long-lived kaleido renderers. Starting a renderer
+    costs far more than rendering a figure, so the figures are exported in batches by
+    a renderer that is started once, in this process or in each of a few worker
+    processes.
+"""
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import chain
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple, Union
+
+from plotly.graph_objects import Figure
+
+FigureExport = Tuple[Figure, Union[str, Path]]
+
+# The renderer of this process, started when the first figure is exported
+_renderer = None
+
+
+def get_renderer():
+    """ The kaleido renderer of this process """
+    global _renderer
+    if _renderer is None:
+        from kaleido.scopes.plotly import PlotlyScope
+        _renderer = PlotlyScope()
+    return _renderer
+
+
+def _export_batch(batch: List[Tuple[dict, str]], format: str) -> List[str]:
+    renderer = get_renderer()
+    for figure, path in batch:
+        Path(path).write_bytes(renderer.transform(figure, format=format))
+    return [path for _, path in batch]
+
+
+def _batches(figures: Iterable[FigureExport], batch_size: int) -> Iterator[List[Tuple[dict, str]]]:
+    batch = []
+    for figure, path in figures:
+        # Figures are sent to the workers as plain dicts
+        batch.append((figure.to_dict() if isinstance(figure, Figure) else figure, str(path)))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_figures(figures: Iterable[FigureExport], format: str = "png", processes: int = 0,
+                   batch_size: int = 16) -> List[str]:
+    """
+        Export every (figure, path) of figures as an image of format. With processes the
+        batches are exported by a pool of that many worker processes, each with its own
+        renderer, else by the renderer of this process. Figures are only converted when
+        their batch is sent off, so figures given by a generator are not all held at once.
+    """
+    batches = _batches(figures, batch_size)
+    if not processes:
+        return [path for batch in batches for path in _export_batch(batch, format)]
+
+    # No workers are started without figures to export
+    first = next(batches, None)
+    if first is None:
+        return []
+    paths = []
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        running = set()
+        for batch in chain([first], batches):
+            # At most two batches per worker are waiting, to bound the figures held
+            if len(running) >= 2*processes:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                paths.extend(path for future in done for path in future.result())
+            running.add(executor.submit(_export_batch, batch, format))
+        paths.extend(path for future in running for path in future.result())
+    return paths
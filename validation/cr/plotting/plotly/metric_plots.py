@@ -1,8 +1,9 @@
 import numpy as np
 import plotly.graph_objects as go
-from typing import Callable, Optional, Tuple
+from typing import Callable, Dict, Optional, Sequence, Tuple
 from sklearn.metrics import roc_curve
-import uuid
+
+from .decimation import decimate
 
 
 def figure_cap_curve(
@@ -14,15 +15,18 @@ def figure_cap_curve(
         x_axis = np.linspace(0, 1, y_axis_model.shape[0])
 
     fig = go.Figure()
-    # Add traces
+    # Add traces, with the curves decimated from a point per observation
+    x_perfect, y_perfect = decimate(x_axis, y_axis_perfect)
     fig.add_trace(go.Scatter(
-        x=x_axis, y=y_axis_perfect, mode='lines', name='Perfect model',
+        x=x_perfect, y=y_perfect, mode='lines', name='Perfect model',
         line={'dash': 'solid', 'width': 4}))
+    x_model, y_model = decimate(x_axis, y_axis_model)
     fig.add_trace(go.Scatter(
-        x=x_axis, y=y_axis_model, mode='lines', name='This model',
+        x=x_model, y=y_model, mode='lines', name='This model',
         line={'dash': 'solid', 'width': 4}))
+    x_uniform = np.asarray(x_axis)[[0, -1]]
     fig.add_trace(go.Scatter(
-        x=x_axis, y=x_axis, mode='lines', name='Uniform model',
+        x=x_uniform, y=x_uniform, mode='lines', name='Uniform model',
         line={'dash': 'dash', 'color': 'black', 'width': 4}))
     fig.update(layout_yaxis_range=[0, 1.02])
     return fig
@@ -42,7 +46,8 @@ def figure_roc_curve(
         return go.Figure()
 
     fpr, tpr, thresholds = roc_curve(outcomes, predictions, pos_label=1)
-    x_axis = np.linspace(0, 1, fpr.shape[0])
+    fpr, tpr = decimate(fpr, tpr)
+    x_axis = np.array([0.0, 1.0])
 
     fig = go.Figure()
     # Add traces
@@ -56,6 +61,21 @@ def figure_roc_curve(
     return fig
 
 
+def figure_trend(
+        traces: Dict[str, Tuple[Sequence, Sequence]],
+        title: Optional[str] = None
+) -> go.Figure:
+    """ A line per trace of its (x, y), e.g. a metric over validation runs """
+    fig = go.Figure()
+    for name, (x_axis, y_axis) in traces.items():
+        fig.add_trace(go.Scatter(
+            x=list(x_axis), y=list(y_axis), mode='lines+markers', name=name,
+            line={'dash': 'solid', 'width': 4}))
+    if title is not None:
+        fig.update_layout(title=dict(text=title))
+    return fig
+
+
 def figure_density_curve(
         density: Callable,
         cumulative_inverse: Callable,
@@ -80,9 +100,10 @@ def figure_density_curve(
     else:
         x_axis = x_axis_a
 
+    x_axis, y_axis = decimate(x_axis, density(x_axis))
     fig = go.Figure()
     fig.add_trace(go.Scatter(
-        x=x_axis, y=density(x_axis), mode='lines', name=name,
+        x=x_axis, y=y_axis, mode='lines', name=name,
         line={'dash': 'solid', 'width': 4}))
     fig.update()
     return fig
@@ -158,7 +179,9 @@ def add_color_under_curve(
         # fill='tonexty',
         # fillcolor=color,
         line=dict(width=0.0, color=color),
-        stackgroup=str(uuid.uuid1())  # define stack group. is unique so we don't stack
+        # A stack group of its own, named by the trace index, so areas don't stack and
+        # the figure is the same every time it is drawn
+        stackgroup=f'area {len(fig.data)}'
     ))
     fig.update_yaxes(range=[0, np.max(y_axis)*1.05])
 
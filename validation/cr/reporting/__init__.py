@@ -1,5 +1,5 @@
 from .report import Report, Chapter, Section
-from .writers import LatexWriter
+from .writers import LatexWriter, HtmlWriter
 
 
 def ref(output):
@@ -1,4 +1,7 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Set, Tuple
 import re
+from cr.automation.recording import is_recording
 from cr.testing.output import OutputType
 
 class ContentMapper(object):
@@ -11,10 +14,45 @@ class ContentMapper(object):
             "CTX": self.map_context,
             "RES": self.map_result
         }
+        # The results of the tests of the RES tags, as resolved up front by resolve
+        self.results = {}
 
     def map(self, content):
         return re.sub(self.regex, lambda x: self.map_content_piece(x.groups()[0]), content)
 
+    def result_sources(self, contents:Iterable[str]) -> Set[Tuple[str, str]]:
+        """ The unique (test uid, output name) of the RES tags of contents """
+        sources = set()
+        for content in contents:
+            for tag in self.regex.findall(content):
+                tag_type, _, tag = tag.partition(";")
+                full_source = tag.split(";", 1)[0]
+                if tag_type == "RES" and full_source.count(".") == 1:
+                    sources.add(tuple(full_source.split(".")))
+        return sources
+
+    def resolve(self, contents:Iterable[str], max_workers:int=4):
+        """
+            Run the tests of the RES tags of every content, e.g. every section of a
+            report, at once on max_workers threads, such that map only substitutes. The
+            outputs of the tags are resolved as well, as lazy outputs compute on first use.
+        """
+        sources = self.result_sources(contents)
+        uids = sorted({uid for uid, _ in sources} - set(self.results))
+
+        def run(uid):
+            result = self.runner.run(uid)
+            for output_name in sorted(name for source, name in sources if source == uid):
+                result[output_name].output_type
+            return result
+
+        # The recording state is global, so recorded tests are run one at a time
+        if is_recording():
+            max_workers = 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            self.results.update(zip(uids, executor.map(run, uids)))
+        return self
+
     def unknown_tag_type(tag_type, tag):
         raise Exception(f"Unable to write tag with tag_type: {tag_type}")
 
@@ -35,8 +73,11 @@ class ContentMapper(object):
         full_source, rules = tag.split(";", 1)
         test_uid, output_name = full_source.split(".")
 
-        # Recompute the output/result
-        result = self.runner.run(test_uid)
+        # Recompute the output/result, unless resolved up front
+        if test_uid in self.results:
+            result = self.results[test_uid]
+        else:
+            result = self.runner.run(test_uid)
         output = result[output_name]
 
         return self._map_output(output, test_uid, output_name, tag)
@@ -1 +1,2 @@
-from .latex.writer import LatexWriter
\ No newline at end of file
+from .latex.writer import LatexWriter
+from .html.writer import HtmlWriter
\ No newline at end of file
@@ -0,0 +1,56 @@
+from html import escape
+
+BASE_STYLE = """
+body { font-family: sans-serif; max-width: 60em; margin: 2em auto; padding: 0 1em; line-height: 1.5; }
+nav ol { padding-left: 1.5em; }
+.cr-content { white-space: pre-wrap; }
+.cr-result { font-weight: bold; }
+.cr-figure { width: 100%; height: 450px; margin: 1em 0; }
+"""
+
+# Draws the figures as they are scrolled into view, with the layout template they
+# share, which is only embedded once
+LAZY_FIGURES = """
+(function () {
+    var templates = JSON.parse(document.getElementById("cr-templates").textContent);
+    function draw(element) {
+        var figure = JSON.parse(document.getElementById(element.dataset.figure).textContent);
+        figure.layout = figure.layout || {};
+        if (element.dataset.template) {
+            figure.layout.template = templates[element.dataset.template];
+        }
+        Plotly.newPlot(element, figure.data, figure.layout, {responsive: true});
+    }
+    var figures = document.querySelectorAll(".cr-figure");
+    if (!("IntersectionObserver" in window)) {
+        figures.forEach(draw);
+        return;
+    }
+    var observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            if (entry.isIntersecting) {
+                observer.unobserve(entry.target);
+                draw(entry.target);
+            }
+        });
+    }, {rootMargin: "500px"});
+    figures.forEach(function (element) { observer.observe(element); });
+})();
+"""
+
+
+def json_script(id, content):
+    # A script element must not be closed by the JSON it holds
+    content = content.replace("</", "<\\/")
+    return f'<script type="application/json" id="{id}">{content}</script>'
+
+
+def figure(id, template=None, label=None):
+    attributes = f' data-template="{template}"' if template is not None else ""
+    label = f' id="res:{escape(label)}"' if label else ""
+    return f'<div class="cr-figure" data-figure="{id}"{attributes}{label}></div>'
+
+
+def result(value, label=None):
+    label = f' id="res:{escape(label)}"' if label else ""
+    return f'<span class="cr-result"{label}>{escape(str(value))}</span>'
@@ -0,0 +1,16 @@
+from . import snippets as snip
+
+
+class Template():
+
+    def head(self):
+        return f"<style>{snip.BASE_STYLE}</style>"
+
+    def assets(self):
+        # Asset files of cr.reporting.writers.latex.assets
+        return dict(
+            CR_LOGO="cr-logo.png",
+        )
+
+    def document_start(self):
+        return '<img src="!<ASSET;CR_LOGO>!" alt="CR" height="60">\n<h1>!<CTX;_TITLE>!</h1>'
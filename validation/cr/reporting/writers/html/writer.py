@@ -0,0 +1,169 @@
+from html import escape
+from pathlib import Path
+import importlib.resources as resources
+import json
+
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+from plotly.utils import PlotlyJSONEncoder
+
+from .template import Template
+from cr.testing.output import OutputType
+from cr.automation.runner import Runner
+from cr.reporting import Report
+from cr.reporting.mapper import ContentMapper
+from cr.reporting.writers.latex import assets
+from . import snippets as snip
+
+
+def _anchor(title, anchors:set):
+    """ The id of title, made unique among anchors, which it is added to """
+    anchor = base = escape(title.replace(" ", "_"))
+    count = 1
+    while anchor in anchors:
+        count += 1
+        anchor = f"{base}_{count}"
+    anchors.add(anchor)
+    return anchor
+
+
+class HtmlMapper(ContentMapper):
+    """
+        Maps content to HTML. The text around the tags is escaped and figures are
+        embedded as Plotly JSON, which the report draws once scrolled into view. The
+        layout template of the figures is embedded once per distinct template.
+    """
+
+    def __init__(self, runner, context, assets):
+        super().__init__(runner, context)
+        self.assets = assets
+        self.tag_maps.update({
+            "ASSET": self.map_asset,
+            "REF": self.map_cites
+        })
+        self.figures = 0
+        self.templates = {}
+
+    def map(self, content):
+        pieces = self.regex.split(content)
+        # split alternates the text between tags and the tags
+        return "".join(escape(piece) if i % 2 == 0 else self.map_content_piece(piece)
+                       for i, piece in enumerate(pieces))
+
+    def map_template(self, content):
+        """ Map HTML content, e.g. of the template, of which only the tags are substituted """
+        return super().map(content)
+
+    def map_context(self, context_tag):
+        return escape(str(super().map_context(context_tag)))
+
+    def map_asset(self, asset_tag:str):
+        return escape(self.assets.get(asset_tag, asset_tag))
+
+    def map_cites(self, cite_tag:str):
+        return f'<a href="#res:{escape(cite_tag)}">{escape(cite_tag)}</a>'
+
+    def _figure_json(self, fig):
+        figure = fig.to_plotly_json()
+        layout = dict(figure.get("layout", {}))
+        template = layout.pop("template", None)
+        template_id = None
+        if template is not None:
+            template = json.dumps(template, cls=PlotlyJSONEncoder, separators=(",", ":"))
+            template_id = self.templates.setdefault(template, str(len(self.templates)))
+        figure = json.dumps({"data": figure["data"], "layout": layout},
+                            cls=PlotlyJSONEncoder, separators=(",", ":"))
+        return figure, template_id
+
+    def _map_output(self, output, test_uid, output_name, tag):
+        label = f"{test_uid}.{output_name}"
+        if output.output_type == OutputType.FIGURE:
+            figure, template_id = self._figure_json(output.value)
+            figure_id = f"cr-figure-{self.figures}"
+            self.figures += 1
+            return snip.json_script(figure_id, figure) + snip.figure(figure_id, template_id, label)
+        return snip.result(output.value, label)
+
+    def templates_script(self):
+        """ The layout templates of the figures mapped so far, by id """
+        templates = ",".join(f'"{template_id}":{template}' for template, template_id in self.templates.items())
+        return snip.json_script("cr-templates", "{" + templates + "}")
+
+
+class HtmlWriter():
+    """
+        Writes a report as a single HTML page, report.html, for review without LaTeX
+        or rasterising figures. plotly.js is written once, next to the page, unless
+        include_plotlyjs is "inline" or "cdn".
+    """
+
+    def __init__(self, output_directory:str, template:Template=None, include_plotlyjs:str="directory",
+                 test_workers:int=4):
+        path = Path(output_directory)
+        if path.exists() and not path.is_dir():
+            raise ValueError(f"HtmlWriter needs an output directory, but got an existing path, which is not a directory: {path}")
+        path.mkdir(parents=True, exist_ok=True)
+        if include_plotlyjs not in ("directory", "inline", "cdn"):
+            raise ValueError(f"HtmlWriter got include_plotlyjs={include_plotlyjs}, which is neither 'directory', 'inline' nor 'cdn'")
+
+        self.path = path
+        if not template:
+            template = Template()
+        self.template = template
+        self.include_plotlyjs = include_plotlyjs
+        # The tests of the report are run up front by this many threads
+        self.test_workers = test_workers
+
+    def _plotlyjs(self):
+        if self.include_plotlyjs == "inline":
+            return f"<script>{get_plotlyjs()}</script>"
+        if self.include_plotlyjs == "cdn":
+            # The version bundled with plotly, as plotly-latest is frozen at 1.58
+            return f'<script src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"></script>'
+        path = self.path.joinpath("plotly.min.js")
+        if not path.exists():
+            path.write_text(get_plotlyjs(), encoding="utf-8")
+        return '<script src="plotly.min.js"></script>'
+
+    def write(self, report:Report, runner:Runner, context_updates:dict=None) -> Path:
+        # Initialize the context
+        if not context_updates:
+            context_updates = {}
+        context = {**report.context, **context_updates, **runner.get_run_context()}
+        mapper = HtmlMapper(runner, context, self.template.assets())
+
+        # Run every test of the report at once, before substituting the tags
+        mapper.resolve([section.content for chapter in report.chapters for section in chapter.sections]
+                       + [self.template.head(), self.template.document_start()], self.test_workers)
+
+        # Copy the assets next to the page
+        for path in self.template.assets().values():
+            with resources.open_binary(assets, path) as from_file:
+                self.path.joinpath(path).write_bytes(from_file.read())
+
+        toc = []
+        body = []
+        anchors = set()
+        for chapter in report.chapters:
+            anchor = _anchor(chapter.title, anchors)
+            toc.append(f'<li><a href="#{anchor}">{escape(chapter.title)}</a><ol>')
+            body.append(f'<h2 id="{anchor}">{escape(chapter.title)}</h2>')
+            for section in chapter.sections:
+                anchor = _anchor(f"{chapter.title}_{section.title}", anchors)
+                toc.append(f'<li><a href="#{anchor}">{escape(section.title)}</a></li>')
+                body.append(f'<section id="{anchor}"><h3>{escape(section.title)}</h3>'
+                            f'<div class="cr-content">{mapper.map(section.content)}</div></section>')
+            toc.append("</ol></li>")
+
+        path_report = self.path.joinpath("report.html")
+        with path_report.open("w", encoding="utf-8") as file:
+            file.write('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n')
+            file.write(f"<title>{escape(str(context.get('_TITLE', report.title)))}</title>\n")
+            file.write(self._plotlyjs())
+            file.write(mapper.map_template(self.template.head()))
+            file.write("\n</head>\n<body>\n")
+            file.write(mapper.map_template(self.template.document_start()))
+            file.write(f"\n<nav><ol>{''.join(toc)}</ol></nav>\n")
+            file.write("\n".join(body))
+            file.write(mapper.templates_script())
+            file.write(f"\n<script>{snip.LAZY_FIGURES}</script>\n</body>\n</html>\n")
+        return path_report
@@ -1,10 +1,12 @@
 from pathlib import Path
+import hashlib
+import json
 import re
 from datetime import date
 from functools import partial
 import importlib.resources as resources
 
-from cr.plotting.plotly import export_figure
+from cr.plotting.plotly.export import export_figures
 from .template import Template
 from cr.testing.output import OutputType
 from cr.automation.runner import Runner
@@ -27,10 +29,54 @@ def to_latex_path(path):
         path = str(path)
     return path.replace("\\","/")
 
+def digest(content:bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+class BuildManifest():
+    """
+        The hashes of the files written by a build, kept in the output directory. An
+        incremental build only writes the files whose hash changed since the previous
+        build, and removes the files the previous build wrote but this build did not.
+    """
+    FILE_NAME = ".cr_build.json"
+
+    def __init__(self, path:Path, incremental:bool=True):
+        self.path = path
+        manifest = path.joinpath(self.FILE_NAME)
+        self.previous = json.loads(manifest.read_text()) if incremental and manifest.exists() else {}
+        self.current = {}
+
+    def is_current(self, file:Path, content_digest:str) -> bool:
+        """ Whether file holds the content of content_digest, which it does after this build """
+        key = to_latex_path(file.relative_to(self.path))
+        self.current[key] = content_digest
+        return self.previous.get(key) == content_digest and file.exists()
+
+    def write_bytes(self, file:Path, content:bytes):
+        if not self.is_current(file, digest(content)):
+            file.write_bytes(content)
+
+    def write_text(self, file:Path, content:str, encoding:str=None):
+        if not self.is_current(file, digest(content.encode("utf-8"))):
+            file.write_text(content, encoding=encoding)
+
+    def save(self):
+        for key in set(self.previous) - set(self.current):
+            stale = self.path.joinpath(key)
+            if stale.exists():
+                stale.unlink()
+                if stale.parent != self.path and not any(stale.parent.iterdir()):
+                    stale.parent.rmdir()
+        manifest = self.path.joinpath(self.FILE_NAME)
+        if self.current != self.previous or not manifest.exists():
+            manifest.write_text(json.dumps(self.current, indent=1, sort_keys=True))
+
 class LatexMapper(ContentMapper):
 
     def __init__(self, runner, context, assets, relative_assets_path, artifacts_path, relative_artifacts_path):
         super().__init__(runner, context)
+        # The figure outputs by the path they are exported to, see export_figures
+        self.figures = {}
         self.assets = assets
         self.relative_assets_path = relative_assets_path
         self.artifacts_path = artifacts_path
@@ -52,9 +98,9 @@ class LatexMapper(ContentMapper):
 
     def _map_output(self, output, test_uid, output_name, tag):
         if output.output_type == OutputType.FIGURE:
-            fig = output.value
+            # The figure is exported with the others once every section is mapped
             path_figure = self.artifacts_path.joinpath(f"{test_uid}__{output_name}.png".replace(" ", "_"))
-            export_figure(fig, path_figure, format="png")
+            self.figures[path_figure] = output
             output_value = snip.figure(to_latex_path(self.relative_artifacts_path.joinpath(f"{test_uid}__{output_name}.png")), f"{test_uid}.{output_name}")
         else:
             output_value = str(output.value)       
@@ -64,9 +110,21 @@ class LatexMapper(ContentMapper):
 %CR:RESULT:END:{tag}
 """
 
+    def export_figures(self, processes:int=0, manifest:BuildManifest=None):
+        """
+            Export the figures of the content mapped so far, see cr.plotting.plotly.export,
+            except the figures of which manifest holds an export of the same figure JSON.
+        """
+        changed = [(output.value, path) for path, output in self.figures.items()
+                   if manifest is None or not manifest.is_current(path, digest(output.value.to_json().encode()))]
+        if changed:
+            export_figures(changed, format="png", processes=processes)
+        self.figures = {}
+
 class LatexWriter():
 
-    def __init__(self, output_directory:str, template:Template=None, overwrite="replace"):
+    def __init__(self, output_directory:str, template:Template=None, overwrite="replace",
+                 figure_processes:int=0, test_workers:int=4):
         path = Path(output_directory)
         if path.exists():
             if not path.is_dir():
@@ -75,14 +133,16 @@ class LatexWriter():
                 if overwrite == "replace":
                     rm_tree(path)
                     path.mkdir()
-                else:
-                    raise ValueError(f"LatexWriter found existing directory with items, and was set to neither 'replace' nor 'append' in arg overwrite")
+                elif overwrite != "incremental":
+                    raise ValueError(f"LatexWriter found existing directory with items, and was set to neither 'replace' nor 'incremental' in arg overwrite")
         else:
             path.mkdir()
 
         self.path = path
+        # An incremental build only rewrites what changed since the previous build
+        self.incremental = overwrite == "incremental"
         self.path_artifacts = path.joinpath("artifacts")
-        self.path_artifacts.mkdir()
+        self.path_artifacts.mkdir(exist_ok=True)
          # TODO: Move assets out of root current problem is in latex font not looking trough paths but only root
         self.path_assets = self.path.joinpath("")
         # self.path_assets.mkdir()
@@ -90,6 +150,10 @@ class LatexWriter():
         if not template:
             template = Template()
         self.template = template
+        # The figures are exported by this many processes, or by this process if 0
+        self.figure_processes = figure_processes
+        # The tests of the report are run up front by this many threads
+        self.test_workers = test_workers
             
     def write(self, report:Report, runner:Runner, context_updates:dict=None):
         # Initialize the context
@@ -103,16 +167,25 @@ class LatexWriter():
                             self.path_artifacts,
                             self.path_artifacts.relative_to(self.path)
                             )
+        manifest = BuildManifest(self.path, self.incremental)
+
+        # Run every test of the report at once, before substituting the tags
+        template_contents = [self.template.preface(), self.template.document_start()]
+        for path in self.template.assets().values():
+            if path.split(".")[-1] == "tex":
+                template_contents.append(resources.read_text(assets, path))
+        mapper.resolve([section.content for chapter in report.chapters for section in chapter.sections]
+                       + template_contents, self.test_workers)
 
         # Export sections and overall content
         chapters = {}
         for chapter in report.chapters:
             path_chapter = self.path.joinpath(chapter.title.replace(" ", "_"))
-            path_chapter.mkdir()
+            path_chapter.mkdir(exist_ok=True)
             chapters[chapter.title] = {}
             for section in chapter.sections:
                 path_section = path_chapter.joinpath(section.title.replace(" ","_") + ".tex") 
-                path_section.write_text(mapper.map(section.content))
+                manifest.write_text(path_section, mapper.map(section.content))
                 chapters[chapter.title][section.title] = to_latex_path(path_section.relative_to(self.path))
 
         # Export asset files
@@ -120,28 +193,32 @@ class LatexWriter():
             # Copy binary files otherwise parse content
             extension = path.split(".")[-1]
             if extension != "tex":
-                with self.path_assets.joinpath(path).open("wb") as to_file:
-                    with resources.open_binary(assets, path) as from_file:
-                        to_file.write(from_file.read())
+                with resources.open_binary(assets, path) as from_file:
+                    manifest.write_bytes(self.path_assets.joinpath(path), from_file.read())
             else:
-                with self.path_assets.joinpath(path).open("w", encoding="utf-8") as to_file:
-                    with resources.open_text(assets, path) as from_file:
-                        to_file.write(mapper.map(from_file.read()))
+                with resources.open_text(assets, path) as from_file:
+                    manifest.write_text(self.path_assets.joinpath(path), mapper.map(from_file.read()),
+                                        encoding="utf-8")
 
 
         # Generate the overall report structure 
-        with self.path.joinpath("structure.tex").open('w') as file:
-            for title, sections in chapters.items():
-                file.write(f"\chapter{{{title}}}")
-                for section_title, section_path in sections.items():
-                    file.write(f"\section{{{section_title}}}")
-                    file.write(f"\input{{{section_path}}}")
+        structure = ""
+        for title, sections in chapters.items():
+            structure += f"\chapter{{{title}}}"
+            for section_title, section_path in sections.items():
+                structure += f"\section{{{section_title}}}"
+                structure += f"\input{{{section_path}}}"
+        manifest.write_text(self.path.joinpath("structure.tex"), structure)
 
         # Generate main report file, preface and similar
-        with self.path.joinpath("report.tex").open('w') as file:
-            file.write(mapper.map(self.template.preface()))
-            file.write(r"\begin{document}")
-            file.write(mapper.map(self.template.document_start()))
-            file.write(r"\input{structure.tex}")
-            file.write(r"\end{document}")
-
+        manifest.write_text(self.path.joinpath("report.tex"), "".join([
+            mapper.map(self.template.preface()),
+            r"\begin{document}",
+            mapper.map(self.template.document_start()),
+            r"\input{structure.tex}",
+            r"\end{document}",
+        ]))
+
+        # Export every figure of the mapped content at once
+        mapper.export_figures(self.figure_processes, manifest)
+        manifest.save()
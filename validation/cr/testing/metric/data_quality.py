@@ -8,7 +8,15 @@ from cr.automation import recordable
 from cr.documentation import doc
 from cr.plotting.plotly import data_quality_plots as dqp
 import cr.testing.metric.simple as simple
-from cr.testing.result import ResultTable, ScalarRAGResult, ScalarResult
+from cr.calculation.profile import shared_profile, vector_profile
+from cr.testing.output import SourceReference
+from cr.testing.result import Result, ResultTable, ScalarRAGResult, ScalarResult, _scalar_color
+
+
+def _apply_metrics(metric_functions, vector):
+    # The metrics share the NaN mask, sorting and unique counts of the vector
+    with shared_profile(vector):
+        return [metric_function(vector) for metric_function in metric_functions]
 
 
 @doc("""Asymmetric Tukey's fence is an outlier method based on deviation from the mean.
@@ -69,6 +77,48 @@ def outliers_tukey_fences(v, k=3, amber=0.1, red=0.15):
              "constant": k})
 
 
+def _outlier_outputs(result: Result) -> dict:
+    # The outputs read by the histograms and aggregates, and the Result as returned
+    outputs = {key: result[key].value for key in ('value', 'color', 'lower_bound', 'upper_bound')
+               if result[key] is not None}
+    return dict(outputs, name=result.name.value, result=result)
+
+
+def _data_quality_row(vector, outlier_function, missing_amber, missing_red) -> list:
+    # The outputs of the cells of a factor, which share the profile of the vector
+    with shared_profile(vector):
+        size = vector_profile(vector).size
+        missing = simple._missing_count(vector)
+        values, counts = simple._unique(vector)
+        return [
+            {'name': 'MISSING', 'value': missing, 'limit_amber': size * missing_amber,
+             'limit_red': size * missing_red,
+             'color': _scalar_color(missing, size * missing_amber, size * missing_red)},
+            {'name': 'UNIQUE', 'value': len(values), 'values': values, 'counts': counts,
+             'reference': SourceReference.of(vector)},
+            {'name': 'MINIMUM', 'value': simple._minimum(vector)},
+            {'name': 'P10', 'value': simple._percentile(vector, 10), 'q': 10},
+            {'name': 'MEDIAN', 'value': simple._median(vector)},
+            {'name': 'P90', 'value': simple._percentile(vector, 90), 'q': 90},
+            {'name': 'MAXIMUM', 'value': simple._maximum(vector)},
+            {'name': 'MEAN', 'value': simple._mean(vector)},
+            _outlier_outputs(outlier_function(vector)),
+        ]
+
+
+def _data_quality_cell(outputs: dict) -> Result:
+    outputs = {key: value for key, value in outputs.items() if value is not None}
+    if 'result' in outputs:
+        return outputs['result']
+    if outputs['name'] == 'UNIQUE':
+        return simple._unique_values_result(
+            outputs['values'], outputs['counts'], outputs['reference'])
+    outputs.pop('color', None)
+    result = simple._rag_or_not(outputs.pop('name'), outputs.pop('value'),
+                                outputs.pop('limit_amber', None), outputs.pop('limit_red', None))
+    return result.add_outputs(outputs)
+
+
 @recordable
 def data_quality_result_table(
         vectors: Union[Iterable[np.ndarray], np.ndarray],
@@ -112,22 +162,29 @@ def data_quality_result_table(
         simple.mean_value,
         outlier_function
     ]
-    results = np.array(
-        [[metric_function(vector) for metric_function in metric_functions]
-         for vector in vectors]
-    )
-    result_names = [result.name.value for result in results[0]]
-
-    rt_out = ResultTable(
-        'DATA QUALITY', list(factor_names), result_names, results).add_outputs(
-        {'vectors': vectors})
+    vectors = list(vectors)
+    cells = [_data_quality_row(vector, outlier_function, missing_amber, missing_red)
+             for vector in vectors]
+    result_names = [outputs['name'] for outputs in cells[0]]
+    columns = {}
+    for i, row in enumerate(cells):
+        for j, outputs in enumerate(row):
+            for key, value in outputs.items():
+                if key not in columns:
+                    columns[key] = np.full((len(cells), len(row)), None, dtype=object)
+                columns[key][i, j] = value
+
+    rt_out = ResultTable.from_columns(
+        'DATA QUALITY', list(factor_names), result_names, columns,
+        cell=_data_quality_cell).add_outputs(
+        {'vectors': [SourceReference.of(vector) for vector in vectors]})
 
     def histogram(rt, name):
         index_factor = rt.row_names.index(name)
         index_unique = rt.column_names.index('UNIQUE')
-        v = rt['vectors'].value[index_factor]
-        u = rt['results'].value[index_factor][index_unique]["values"].value
-        c = rt['results'].value[index_factor][index_unique]["counts"].value
+        v = np.asarray(rt['vectors'].value[index_factor])
+        u = rt.attribute_values('values')[index_factor, index_unique]
+        c = rt.attribute_values('counts')[index_factor, index_unique]
 
         hist_type = dqp.unique_values_as_bins(v, unique_values=u,
                                               unique_values_count=c)
@@ -138,15 +195,15 @@ def data_quality_result_table(
 
         if len(u) > 20:
             index_outliers = rt.column_names.index('OUTLIERS')
-            lb = rt['results'].value[index_factor][index_outliers]["lower_bound"]  # .value
-            ub = rt['results'].value[index_factor][index_outliers]["upper_bound"]  # .value
+            lb = rt.attribute_values('lower_bound')[index_factor, index_outliers]
+            ub = rt.attribute_values('upper_bound')[index_factor, index_outliers]
             dqp.add_outlier_box_to_bar_fig(fig_out, lb, ub)
 
         return fig_out
 
     def histogram_wo_outliers(rt, name):
         index_factor = rt.row_names.index(name)
-        v = rt['vectors'].value[index_factor]
+        v = np.asarray(rt['vectors'].value[index_factor])
         v_no_nan = v[~np.isnan(v)]
 
         index_outliers = rt.column_names.index('OUTLIERS')
@@ -155,8 +212,8 @@ def data_quality_result_table(
         #  v_no_nan.__le__(ub) , v_no_nan.__ge__(lb) (it might actually have to do with
         #  np.ndarray __le__ when it gets a Output() hmm.
         #  https: // numpy.org / devdocs / user / basics.dispatch.html
-        lb = rt['results'].value[index_factor][index_outliers]["lower_bound"].value
-        ub = rt['results'].value[index_factor][index_outliers]["upper_bound"].value
+        lb = rt.attribute_values('lower_bound')[index_factor, index_outliers]
+        ub = rt.attribute_values('upper_bound')[index_factor, index_outliers]
         v_wo_outliers = v_no_nan[(lb <= v_no_nan) & (v_no_nan <= ub)]
 
         u, c = np.unique(v_wo_outliers, return_counts=True)
@@ -223,19 +280,18 @@ def data_quality_result_table_nominal(
         simple.mode
     ]
     results = np.array(
-        [[metric_function(vector) for metric_function in metric_functions]
-         for vector in vectors]
+        [_apply_metrics(metric_functions, vector) for vector in vectors]
     )
     result_names = [result.name.value for result in results[0]]
 
     rt_out = ResultTable(
         'NOMINAL DATA QUALITY', list(factor_names), result_names, results).add_outputs(
-        {'vectors': vectors})
+        {'vectors': [SourceReference.of(vector) for vector in vectors]})
 
     def histogram(rt, name):
         index_factor = rt.row_names.index(name)
         index_unique = rt.column_names.index('UNIQUE')
-        v = rt['vectors'].value[index_factor]
+        v = np.asarray(rt['vectors'].value[index_factor])
         u = rt['results'].value[index_factor][index_unique]["values"].value
         c = rt['results'].value[index_factor][index_unique]["counts"].value
 
@@ -293,19 +349,18 @@ def data_quality_result_table_ordinal(
         simple.median
     ]
     results = np.array(
-        [[metric_function(vector) for metric_function in metric_functions]
-         for vector in vectors]
+        [_apply_metrics(metric_functions, vector) for vector in vectors]
     )
     result_names = [result.name.value for result in results[0]]
 
     rt_out = ResultTable(
         'ORDINAL DATA QUALITY', list(factor_names), result_names, results).add_outputs(
-        {'vectors': vectors})
+        {'vectors': [SourceReference.of(vector) for vector in vectors]})
 
     def histogram(rt, name):
         index_factor = rt.row_names.index(name)
         index_unique = rt.column_names.index('UNIQUE')
-        v = rt['vectors'].value[index_factor]
+        v = np.asarray(rt['vectors'].value[index_factor])
         u = rt['results'].value[index_factor][index_unique]["values"].value
         c = rt['results'].value[index_factor][index_unique]["counts"].value
 
@@ -329,48 +384,30 @@ def data_quality_result_table_ordinal(
 @recordable
 def aggregate_rag_result_table(result_table, split_on_column=True):
     import pandas as pd
-    from cr.testing.result import RAGResult
-    result_table_input = result_table
-    df_colors = result_table_input.to_dataframe("color", True)
-    df_values = result_table_input.to_dataframe("value", True)
+    colors = result_table.attribute_values("color")
+    mask_value_not_nan = pd.notna(result_table.attribute_values("value"))
+    # Only RAG results have a color
+    mask_rag_result = pd.notna(colors)
 
     row_names = ["GREEN", "AMBER", "RED", "nan", "TOTAL"]
-    results = []
-    column_names = []
-    # col = df_colors.columns[0]
+    if not split_on_column:
+        colors = colors.reshape(-1, 1)
+        mask_value_not_nan = mask_value_not_nan.reshape(-1, 1)
+        mask_rag_result = mask_rag_result.reshape(-1, 1)
+
+    counts = np.array(
+        [np.sum((colors == color) & mask_value_not_nan, axis=0) for color in row_names[:3]]
+        + [np.sum(~mask_value_not_nan, axis=0),
+           np.full(colors.shape[1], colors.shape[0])])
+    keep = np.any(mask_value_not_nan, axis=0) & np.any(mask_rag_result, axis=0)
     if split_on_column:
-        for col in df_colors:
-            array = df_colors[col].values
-            mask_value_not_nan = pd.notna(df_values[col])
-            metrics = result_table_input.get_result_subset(column_names=col)
-            # Convert from 2-d numpy array to list:
-            metrics = list(np.squeeze(metrics))
-            mask_rag_result = [isinstance(elem, RAGResult) for elem in metrics]
-            if not np.all(~mask_value_not_nan) and np.any(mask_rag_result):
-                results.append(
-                    [simple.count(array[(array == row_names[0]) & mask_value_not_nan]),
-                     simple.count(array[(array == row_names[1]) & mask_value_not_nan]),
-                     simple.count(array[(array == row_names[2]) & mask_value_not_nan]),
-                     simple.count(array[~mask_value_not_nan]),
-                     simple.count(array)])
-                column_names.append(col)
+        column_names = [col for col, kept in zip(result_table.column_names, keep) if kept]
     else:
-        array = df_colors.values.flatten('F')
-        mask_value_not_nan = pd.notna(df_values.values.flatten('F'))
-        metrics = result_table_input.results.value.flatten('F')
-        mask_rag_result = [isinstance(elem, RAGResult) for elem in metrics]
-        if not np.all(~mask_value_not_nan) and np.any(mask_rag_result):
-            results.append(
-                [simple.count(array[(array == row_names[0]) & mask_value_not_nan]),
-                 simple.count(array[(array == row_names[1]) & mask_value_not_nan]),
-                 simple.count(array[(array == row_names[2]) & mask_value_not_nan]),
-                 simple.count(array[~mask_value_not_nan]),
-                 simple.count(array)])
-            column_names = ['ALL']
-
-    return ResultTable(
+        column_names = ['ALL'] if keep[0] else []
+
+    return ResultTable.from_columns(
         name='AGGREGATE',
         row_names=row_names,
         column_names=column_names,
-        results=np.array(results).T)
-
+        columns={'name': 'COUNT', 'value': counts[:, keep]},
+        cell=lambda outputs: ScalarResult(**outputs))
@@ -1,4 +1,5 @@
 from cr.automation import recordable
+from cr.automation.store import open_store
 from cr.plotting.plotly import metric_plots as metric_plots, data_quality_plots as dqp
 from cr.testing.result import FigureResult
 from cr.data import Segmentation
@@ -12,6 +13,12 @@ def figure_cap_curve(y_axis_model, y_axis_perfect, x_axis=None) -> FigureResult:
                         metric_plots.figure_cap_curve(y_axis_model, y_axis_perfect, x_axis))
 
 
+@recordable
+def figure_trend(store, function, output='value', segment='', last=None) -> FigureResult:
+    return FigureResult("Trend",
+                        open_store(store).figure_trend(function, output, segment, last))
+
+
 @recordable
 def figure_histogram(v, name, norm='count', plot_kde=False) -> FigureResult:
     return FigureResult("Histogram",
@@ -4,6 +4,14 @@ from cr.plotting.plotly import metric_plots as metric_plots
 from typing import Callable, Optional
 
 
+class DistributionRAGResult(ScalarRAGResult):
+    """
+        The ScalarRAGResult of a hypothesis test, keeping the distribution of the test
+        statistic for its figure.
+    """
+    __slots__ = ('_pdf', '_cdf', '_cdf_inverse')
+
+
 def figure_distribution(
         pdf,
         cdf_inverse,
@@ -90,7 +98,7 @@ def h0_rag(
     # TODO: made pdf, cdf, cdf_inverse private attributes instead of outputs, since
     #  functions cannot be serialized at the moment.
     #  When that is fixed we can change them back to outputs.
-    out = ScalarRAGResult(
+    out = DistributionRAGResult(
         name=name, value=p_value, limit_amber=amber, limit_red=red).add_outputs(
         {"test_statistic": test_statistic,
          # "pdf": pdf,
@@ -1,6 +1,7 @@
 import cr.calculation as calculate
 from cr.automation import recordable
 from cr.plotting.plotly import metric_plots as metric_plots
+from cr.testing.output import SourceReference
 from cr.testing.result import ScalarRAGResult, Result, ScalarResult
 import cr.testing.metric.hypothesis as hypothesis
 from scipy.stats import norm
@@ -23,6 +24,11 @@ Notice the linear relationship between Gini and AUC: Gini = 2*AUC - 1 """,
 def auc(predictions, outcomes, amber=0.85, red=0.7):
     # filter away nans
     mask_is_finite = np.isfinite(predictions) & np.isfinite(outcomes)
+    # The result refers to the columns of the dataset instead of copying them
+    references = {
+        "predictions": SourceReference.of(predictions, mask_is_finite),
+        "outcomes": SourceReference.of(outcomes, mask_is_finite),
+    }
     predictions = predictions[mask_is_finite]
     outcomes = outcomes[mask_is_finite]
 
@@ -38,8 +44,7 @@ def auc(predictions, outcomes, amber=0.85, red=0.7):
 
     result_out = ScalarRAGResult("AUC", auc_value, amber, red).add_outputs({
         "std_dev": s,
-        "predictions": predictions,
-        "outcomes": outcomes
+        **references
     })
 
     def get_roc_curve(output_dict):
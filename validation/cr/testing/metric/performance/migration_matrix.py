@@ -17,21 +17,24 @@ def migration_matrix(
         order=order,
         include_all=include_all,
     )
+    return _migration_result_table(migration_prob, migration_count, row_names, column_names)
 
-    def _scalar_result_with_count(p_value, c_value):
-        return ScalarResult(name='Migration Matrix Entry', value=p_value).add_outputs({
-            "count": c_value
-        })
 
-    results = np.array(
-        [[_scalar_result_with_count(p, c) for p, c in zip(p_row, c_row)]
-         for p_row, c_row in zip(migration_prob, migration_count)]
-    )
-    return ResultTable(
+def _migration_entry(outputs: dict) -> ScalarResult:
+    return ScalarResult(name=outputs.pop('name'), value=outputs.pop('value')).add_outputs(outputs)
+
+
+def _migration_result_table(migration_prob, migration_count, row_names, column_names) -> ResultTable:
+    return ResultTable.from_columns(
         'Migration Matrix',
         row_names=list(row_names),
         column_names=list(column_names),
-        results=results,
+        columns={
+            'name': 'Migration Matrix Entry',
+            'value': migration_prob,
+            'count': migration_count,
+        },
+        cell=_migration_entry,
     )
 
 
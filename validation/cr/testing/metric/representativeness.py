@@ -24,7 +24,10 @@ def psi_numerical(a, b, amber=0.1, red=0.25, psi_args=None, title=None, name_a='
         if not psi_args:
             psi_args = {}
         psi, dict_intermediate = calculate.psi_numerical(a, b, **psi_args)
+    return _psi_numerical_result(psi, dict_intermediate, amber, red, title, name_a, name_b)
 
+
+def _psi_numerical_result(psi, dict_intermediate, amber, red, title, name_a, name_b):
     if psi is None or np.isnan(psi):
         return ScalarResult("PSI", np.nan)
 
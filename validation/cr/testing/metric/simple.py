@@ -1,7 +1,9 @@
 import numpy as np
 from typing import Optional, Union
 from cr.automation import recordable
+from cr.calculation.profile import vector_profile
 from cr.plotting.plotly import data_quality_plots as dqp
+from cr.testing.output import SourceReference
 from cr.testing.result import ScalarResult, ScalarRAGResult
 from cr.documentation import doc
 
@@ -79,71 +81,100 @@ def count(v, amber: Optional[float] = None, red: Optional[float] = None):
      })
 @recordable
 def mode(v, amber: Optional[float] = None, red: Optional[float] = None):
-    if isinstance(v, np.ndarray) and (
-            np.issubdtype(v.dtype, np.number) or np.issubdtype(v.dtype, np.datetime64)):
-        values, counts = np.unique(v[~np.isnan(v)], return_counts=True)
-        index = np.argmax(counts)
-        value = values[index]
-        mode_count = counts[index]
+    profile = vector_profile(v)
+    if profile.is_numeric or profile.is_temporal:
+        values, counts = profile.unique
     else:
-        v_unicode = v.astype(np.unicode_)
-        v_no_missing = v_unicode[~np.isin(v_unicode, ('nan', 'None', '', '<NA>'))]
-        values, counts = np.unique(v_no_missing, return_counts=True)
-        index = np.argmax(counts)
-        value = values[index]
-        mode_count = counts[index]
+        values, counts = profile.unicode_unique
+    index = np.argmax(counts)
+    value = values[index]
+    mode_count = counts[index]
     result = _rag_or_not("MODE", value, amber, red)
     return result.add_outputs({
         "count": mode_count
     })
 
 
+def _maximum(v):
+    sorted_values = vector_profile(v).sorted
+    return sorted_values[-1] if sorted_values.size else np.nan
+
+
 @recordable
 def maximum_value(v, amber: Optional[float] = None, red: Optional[float] = None):
-    return _rag_or_not("MAXIMUM", _nan_handling(np.nanmax, v), amber, red)
+    return _rag_or_not("MAXIMUM", _maximum(v), amber, red)
+
+
+def _mean(v):
+    return _nan_handling(np.nanmean, v)
 
 
 @recordable
 def mean_value(v, amber: Optional[float] = None, red: Optional[float] = None):
-    return _rag_or_not("MEAN", _nan_handling(np.nanmean, v), amber, red)
+    return _rag_or_not("MEAN", _mean(v), amber, red)
 
 
-@recordable
-def median(v, amber: Optional[float] = None, red: Optional[float] = None):
-    if isinstance(v, np.ndarray) and np.issubdtype(v.dtype, np.number):
-        value = _nan_handling(np.nanmedian, v)
+def _median(v):
+    profile = vector_profile(v)
+    if profile.is_numeric:
+        sorted_values = profile.sorted
+        value = np.median(sorted_values) if sorted_values.size else np.nan
     else:
-        v_unicode = v.astype(np.unicode_)
-        v_no_missing = v_unicode
-        if isinstance(v, np.ndarray) and not np.issubdtype(v.dtype, np.datetime64):
-            v_no_missing = v_unicode[~np.isin(v_unicode, ('nan', 'None', '', '<NA>'))]
-        n = len(v_no_missing)
+        if profile.is_temporal:
+            v_no_missing = profile.unicode
+            sorted_values = np.sort(v_no_missing)
+            n = len(v_no_missing)
+            nth = sorted_values.__getitem__
+            first = lambda: v_no_missing[0]
+        else:
+            # Does not sort the strings of a dictionary encoded vector
+            n = profile.unicode_non_missing_count
+            nth = profile.unicode_nth
+            first = lambda: profile.unicode_first_non_missing
         if n == 0:
             value = np.nan
         elif n % 2 == 1:  # if len is uneven
-            value = np.sort(v_no_missing)[n // 2]
+            value = nth(n // 2)
         elif n == 2:
-            value = v_no_missing[0]
+            value = first()
         else:
-            value = np.sort(v_no_missing)[:-1][n // 2]
-    return _rag_or_not("MEDIAN", value, amber, red)
+            # The n // 2'th of all but the last value
+            value = nth(n // 2)
+    return value
+
+
+@recordable
+def median(v, amber: Optional[float] = None, red: Optional[float] = None):
+    return _rag_or_not("MEDIAN", _median(v), amber, red)
+
+
+def _minimum(v):
+    sorted_values = vector_profile(v).sorted
+    return sorted_values[0] if sorted_values.size else np.nan
 
 
 @recordable
 def minimum_value(v, amber: Optional[float] = None, red: Optional[float] = None):
-    return _rag_or_not("MINIMUM", _nan_handling(np.nanmin, v), amber, red)
+    return _rag_or_not("MINIMUM", _minimum(v), amber, red)
+
+
+def _missing_count(v):
+    profile = vector_profile(v)
+    if profile.is_numeric or profile.is_temporal:
+        return profile.missing_count
+    return profile.unicode_missing_count
 
 
 @doc("""Number of missing values""")
 @recordable
 def missing(v, amber: Optional[float] = 0.1, red: Optional[float] = 0.15):
-    if isinstance(v, np.ndarray) and (
-            np.issubdtype(v.dtype, np.number) or np.issubdtype(v.dtype, np.datetime64)):
-        return _rag_or_not("MISSING", np.isnan(v).sum(), v.size*amber, v.size*red)
-    else:
-        v_unicode = v.astype(np.unicode_)
-        value = np.isin(v_unicode, ('nan', 'None', '', '<NA>')).sum()
-        return _rag_or_not("MISSING", value, len(v)*amber, len(v)*red)
+    size = vector_profile(v).size
+    return _rag_or_not("MISSING", _missing_count(v), size*amber, size*red)
+
+
+def _percentile(v, q: float):
+    sorted_values = vector_profile(v).sorted
+    return np.percentile(sorted_values, q) if sorted_values.size else np.nan
 
 
 @doc("""The q-th percentile (quantile)""",
@@ -153,7 +184,7 @@ def percentile(v, q: float, amber: Optional[float] = None, red: Optional[float]
     """
     q : Percentile to compute, which must be between 0 and 100 inclusive.
     """
-    result = _rag_or_not(f"P{q}", _nan_handling(np.nanpercentile, v, {'q': q}), amber, red)
+    result = _rag_or_not(f"P{q}", _percentile(v, q), amber, red)
     return result.add_outputs({'q': q})
 
 
@@ -162,6 +193,13 @@ def sum(v, amber: Optional[float] = None, red: Optional[float] = None):
     return _rag_or_not("SUM", _nan_handling(np.nansum, v), amber, red)
 
 
+def _unique(v):
+    profile = vector_profile(v)
+    if profile.is_numeric or profile.is_temporal:
+        return profile.unique
+    return profile.unicode_unique
+
+
 @doc("""The number of unique values""",
      output_docs={
          "mode": "The unique value that appears most often",
@@ -169,23 +207,26 @@ def sum(v, amber: Optional[float] = None, red: Optional[float] = None):
      })
 @recordable
 def unique_values(v, amber: Optional[float] = None, red: Optional[float] = None):
-    if isinstance(v, np.ndarray) and (
-            np.issubdtype(v.dtype, np.number) or np.issubdtype(v.dtype, np.datetime64)):
-        values, counts = np.unique(v[~np.isnan(v)], return_counts=True)
-    else:
-        v_unicode = v.astype(np.unicode_)
-        v_no_missing = v_unicode[~np.isin(v_unicode, ('nan', 'None', '', '<NA>'))]
-        values, counts = np.unique(v_no_missing, return_counts=True)
+    values, counts = _unique(v)
+    return _unique_values_result(values, counts, SourceReference.of(v), amber, red)
+
+
+def _unique_values_result(values, counts, reference, amber=None, red=None):
     result = _rag_or_not("UNIQUE", len(values), amber, red)
+
+    def histogram(reference=reference):
+        # The vector is read from its dataset, instead of kept by the result
+        v_ = np.asarray(reference)
+        return dqp.figure_bar_histogram(
+            v=v_, name='test', norm='probability',
+            unique_value_bins=dqp.unique_values_as_bins(v_, values, counts),
+            unique_values=values,
+            unique_values_count=counts)
+
     return result.add_outputs({
         "values": values,
         "counts": counts,
-        "histogram": lambda: dqp.figure_bar_histogram(
-            v=v, name='test', norm='probability',
-            unique_value_bins=dqp.unique_values_as_bins(
-                v, values, counts),
-            unique_values=values,
-            unique_values_count=counts),
+        "histogram": histogram,
         "mode": lambda vals=values, cts=counts: vals[np.argmax(cts)],
         "mode frequency": lambda cts=counts: cts[np.argmax(cts)],
     })
@@ -0,0 +1,61 @@
+"""
+    Metrics of the columns of a DataSet, computed by scanning the dataset chunk by
+    chunk. On a ParquetDataSet, or its segments, a chunk is a row group, so these
+    run on data larger than memory. On other datasets there is a single chunk.
+"""
+from typing import Optional, Sequence, Union
+
+from cr.automation import recordable
+from cr.calculation import streaming
+from cr.data import DataSet
+from cr.documentation import doc
+from cr.testing.metric.performance.migration_matrix import _migration_result_table
+from cr.testing.metric.representativeness import _psi_numerical_result
+from cr.testing.metric.simple import _rag_or_not
+from cr.testing.result import ResultTable
+
+
+def _column_chunks(dataset: DataSet, column: str):
+    return (chunk[column] for chunk in dataset.iter_chunks([column]))
+
+
+@recordable
+def count(dataset: DataSet, amber: Optional[float] = None, red: Optional[float] = None):
+    return _rag_or_not("COUNT", dataset.observations, amber, red)
+
+
+@recordable
+def sum(dataset: DataSet, column: str, amber: Optional[float] = None, red: Optional[float] = None):
+    return _rag_or_not("SUM", streaming.summary(_column_chunks(dataset, column))['sum'], amber, red)
+
+
+@recordable
+def mean_value(dataset: DataSet, column: str, amber: Optional[float] = None,
+               red: Optional[float] = None):
+    return _rag_or_not("MEAN", streaming.summary(_column_chunks(dataset, column))['mean'], amber, red)
+
+
+@doc("""Number of missing values""")
+@recordable
+def missing(dataset: DataSet, column: str, amber: Optional[float] = 0.1,
+            red: Optional[float] = 0.15):
+    summary = streaming.summary(_column_chunks(dataset, column))
+    return _rag_or_not("MISSING", summary['missing'], summary['count']*amber, summary['count']*red)
+
+
+@doc("""The PSI test gives a quantitative measure of how much the data distribution is
+changing between two datasets, here computed by scanning the datasets twice.""")
+@recordable
+def psi_numerical(a: DataSet, b: DataSet, column: str, buckets: Union[int, Sequence[float]] = 5,
+                  amber=0.1, red=0.25, title=None, name_a='a', name_b='b'):
+    psi, dict_intermediate = streaming.psi_numerical(
+        lambda: _column_chunks(a, column), lambda: _column_chunks(b, column), buckets)
+    return _psi_numerical_result(psi, dict_intermediate, amber, red, title, name_a, name_b)
+
+
+@recordable
+def migration_matrix(dataset: DataSet, start: str, end: str, drop_nan=True, order=None,
+                     include_all=False) -> ResultTable:
+    chunks = ((chunk[start], chunk[end]) for chunk in dataset.iter_chunks([start, end]))
+    return _migration_result_table(*streaming.migration_matrix(
+        chunks, drop_nan=drop_nan, order=order, include_all=include_all))
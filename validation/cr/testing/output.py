@@ -1,9 +1,18 @@
+from collections import OrderedDict
 from enum import Enum
 from functools import total_ordering
+from threading import Lock
+from typing import Hashable, Optional
+import logging
+import sys
 
 from plotly.graph_objects import Figure
 import numpy as np
 
+from cr.data.dataset import DataSet, SourcedArray
+
+logger = logging.getLogger(__name__)
+
 
 class OutputType(Enum):
     SCALAR = 1
@@ -15,6 +24,146 @@ class OutputType(Enum):
     MATRIX = 7
 
 
+class SourceReference(object):
+    """
+        The values of a column of a DataSet or Segment, optionally at a mask, held as a
+        reference to the dataset instead of as a copy. As the value of an Output the
+        values are materialised from the dataset whenever they are read.
+    """
+    __slots__ = ('dataset', 'name', '_mask', '_size')
+
+    def __init__(self, dataset: DataSet, name: Hashable, mask: Optional[np.ndarray] = None):
+        self.dataset = dataset
+        self.name = name
+        self._size = dataset.observations
+        # A bit per observation, or nothing if every observation is kept
+        self._mask = None if mask is None or np.all(mask) else np.packbits(mask)
+
+    @classmethod
+    def of(cls, vector, mask: Optional[np.ndarray] = None):
+        """
+            A reference to vector at mask if vector is a column of a dataset, as
+            taken from the dataset, else vector at mask itself. Arrays derived from
+            a column, e.g. 1 - column, keep its dataset and name but are not the column.
+        """
+        if (isinstance(vector, SourcedArray) and getattr(vector, 'is_column', False)
+                and vector.dataset is not None
+                and vector.ndim == 1 and len(vector) == vector.dataset.observations):
+            return cls(vector.dataset, vector.name, mask)
+        return vector if mask is None else vector[mask]
+
+    @property
+    def mask(self) -> Optional[np.ndarray]:
+        if self._mask is None:
+            return None
+        return np.unpackbits(self._mask, count=self._size).view(bool)
+
+    def resolve(self) -> np.ndarray:
+        values = self.dataset[self.name]
+        if self._mask is not None:
+            values = values[self.mask]
+        return values
+
+    def __array__(self, dtype=None):
+        return np.asarray(self.resolve(), dtype=dtype)
+
+    def __len__(self):
+        return self._size if self._mask is None else int(self.mask.sum())
+
+    def __repr__(self):
+        return f"SourceReference({self.dataset.id!r}, {self.name!r})"
+
+
+def _nbytes(value, _seen=None) -> int:
+    """ An estimate of the bytes held by value, where unresolved lazy outputs hold none """
+    if isinstance(value, Output):
+        if value._output_type == OutputType.UNRESOLVED:
+            return 0
+        return _nbytes(value._value, _seen)
+    if isinstance(value, SourceReference):
+        return 0 if value._mask is None else value._mask.nbytes
+    if isinstance(value, Figure):
+        return (sum(_nbytes(trace._props, _seen) for trace in value.data)
+                + _nbytes(value.layout._props or {}, _seen))
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return value.nbytes + sum(_nbytes(item, _seen) for item in value.flat)
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_nbytes(item, _seen) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_nbytes(item, _seen) for item in value)
+    if hasattr(value, '_outputs'):
+        # A Result, which may be referred to by several outputs
+        _seen = set() if _seen is None else _seen
+        if id(value) in _seen:
+            return 0
+        _seen.add(id(value))
+        return sum(_nbytes(output, _seen) for output in value._outputs.values())
+    if callable(value):
+        return 0
+    return sys.getsizeof(value)
+
+
+class OutputCache(object):
+    """
+        The resolved lazy outputs, such as figures, kept within a budget of max_bytes.
+        When the budget is exceeded the least recently read outputs are evicted, i.e.
+        made lazy again, such that they are recomputed when read again.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        # The resolved outputs and their bytes, by id, least recently read first. An
+        # output is kept until evicted, so at most max_bytes outlive their results
+        self._entries = OrderedDict()
+        # The bytes of the entries, kept as they are added and evicted
+        self._nbytes = 0
+        self._lock = Lock()
+        self.evictions = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, output: 'Output'):
+        """ Keep the resolved output, evicting the least recently read if over budget """
+        with self._lock:
+            _, previous_nbytes = self._entries.pop(id(output), (None, 0))
+            nbytes = _nbytes(output)
+            self._entries[id(output)] = (output, nbytes)
+            self._nbytes += nbytes - previous_nbytes
+            # The output added is kept, even if it exceeds the budget by itself
+            while self._nbytes > self.max_bytes and len(self._entries) > 1:
+                _, (evicted, evicted_nbytes) = self._entries.popitem(last=False)
+                evicted._evict()
+                self.evictions += 1
+                self._nbytes -= evicted_nbytes
+            nbytes = self._nbytes
+        logger.debug(f"Using {nbytes} of {self.max_bytes} bytes for {len(self)} lazy outputs")
+
+    def touch(self, output: 'Output'):
+        with self._lock:
+            if id(output) in self._entries:
+                self._entries.move_to_end(id(output))
+
+
+_output_cache = None
+
+
+def set_output_cache(cache: Optional[OutputCache]):
+    """ Keep resolved lazy outputs within the budget of cache, or keep them all with None """
+    global _output_cache
+    _output_cache = cache
+
+
+def get_output_cache() -> Optional[OutputCache]:
+    return _output_cache
+
+
 def _format_scalar(value):
     if not np.isfinite(value):
         if np.isnan(value):
@@ -68,32 +217,53 @@ def _format_scalar(value):
 
 class Output(object):
     # TODO: The meaning of some output's can be dependend on other outputs, how to handle?
+    # Outputs are created for every entry of every result, so they hold no __dict__
+    __slots__ = ('_value', '_output_type', '_compute', '_recording_uid', '_output_key',
+                 '_cr_doc')
+
     def __init__(self, value, output_type=None):
         self._value = value
-        if not output_type:
-            output_type = self._resolve_type()
+        # The function computing a lazy output, kept to recompute it once evicted
+        self._compute = None
+        # The type is resolved when first asked for, except that lazy outputs are
+        # known to be UNRESOLVED up front
+        if not output_type and callable(value):
+            output_type = OutputType.UNRESOLVED
         self._output_type = output_type
 
+    def _resolve(self):
+        if self._output_type is None or self._output_type == OutputType.UNRESOLVED:
+            self._output_type = self._resolve_type(resolve=True)
+            if self._compute is not None and _output_cache is not None:
+                _output_cache.add(self)
+
+    def _evict(self):
+        self._value = self._compute
+        self._output_type = OutputType.UNRESOLVED
+
+    @property
+    def nbytes(self) -> int:
+        """ An estimate of the bytes held by the output, none if not resolved """
+        return _nbytes(self)
+
     @property
     def value(self):
         if self._output_type == OutputType.UNRESOLVED:
-            self._output_type = self._resolve_type(resolve=True)
-            # return self._value
-        # return self._value
+            self._resolve()
+        elif self._compute is not None and _output_cache is not None:
+            _output_cache.touch(self)
+        if isinstance(self._value, SourceReference):
+            return self._value.resolve()
         # TODO: remove the following lines when an operation with SourcedArray do not
         #  return a new SourcedArray but a numpy object.
-        if self._output_type == OutputType.SCALAR:
-            if not np.isscalar(self._value):
-                return self._value[()]
-            else:
-                return self._value
+        # Zero-dimensional arrays are the only SCALAR outputs that are not scalars
+        if isinstance(self._value, np.ndarray) and self._value.ndim == 0:
+            return self._value[()]
         return self._value
 
     @property
     def formatted_value(self):
-        if self._output_type == OutputType.UNRESOLVED:
-            self._output_type = self._resolve_type(resolve=True)
-        if self._output_type == OutputType.SCALAR:
+        if self.output_type == OutputType.SCALAR:
             if not np.isreal(self.value):
                 return self.value
             else:
@@ -103,8 +273,7 @@ class Output(object):
 
     @property
     def output_type(self) -> OutputType:
-        if self._output_type == OutputType.UNRESOLVED:
-            self._output_type = self._resolve_type(resolve=True)
+        self._resolve()
         return self._output_type
 
     def _resolve_type(self, resolve: bool = False):
@@ -115,8 +284,12 @@ class Output(object):
         if callable(self._value):
             if not resolve:
                 return OutputType.UNRESOLVED
+            self._compute = self._value
             self._value = self._value()
 
+        if isinstance(self._value, SourceReference):
+            return OutputType.VECTOR
+
         if isinstance(self._value, str):
             # Unsure how to handle this? perhaps use spaces to determine?
             if len(self._value) > 16:
@@ -161,8 +334,10 @@ class Output(object):
     # TODO: Refine or trash
 
     def __getattr__(self, attr):
-        if attr in self.__dict__:
-            return self.__dict__[attr]
+        # Only reached for slots that are not set, such as the source of an output
+        # without one, and attributes of the value
+        if attr in Output.__slots__:
+            raise AttributeError(attr)
         try:
             return getattr(self.value, attr)
         except AttributeError as err:
@@ -1,9 +1,10 @@
 from collections import defaultdict
+from functools import partial
 import numpy as np
 
-from .output import Output, OutputType
-from typing import List, Callable, Optional, TypeVar
-from pandas import DataFrame
+from .output import Output, OutputType, _nbytes
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+from pandas import DataFrame, Series
 from numpy import ndarray
 ResultArray = ndarray
 
@@ -18,6 +19,10 @@ class Result(object):
         include nice to have and need to have results.
         These results can be computed lazily.
     """
+    # Results are created for every cell of a table, so the Result classes hold no
+    # __dict__, except those adding their own attributes such as the ResultTable
+    __slots__ = ('_outputs', '_recording_uid', '_cr_doc')
+
     def __init__(self):
         self._outputs = {}
 
@@ -48,11 +53,40 @@ class Result(object):
             self._outputs[key] = Output(value, output_type=None)
         return self
 
+    def memory_usage(self) -> Series:
+        """ The estimated bytes held by each output, where unresolved lazy outputs hold none """
+        return Series({key: _nbytes(output) for key, output in self._outputs.items()},
+                      dtype=np.int64)
+
+    def to_arrow(self, resolve_lazy: bool = True):
+        """ The result as an Arrow table, see cr.testing.serialization """
+        from .serialization import results_to_arrow
+        return results_to_arrow({'result': self}, resolve_lazy)
+
+    @classmethod
+    def from_arrow(cls, table, allow_pickle: bool = False):
+        from .serialization import results_from_arrow
+        result = results_from_arrow(table, allow_pickle)['result']
+        if not isinstance(result, cls):
+            raise TypeError(f"Expected a {cls.__name__} but read a {type(result).__name__}")
+        return result
+
+    def to_parquet(self, path, resolve_lazy: bool = True):
+        import pyarrow.parquet as pq
+        pq.write_table(self.to_arrow(resolve_lazy), path)
+
+    @classmethod
+    def from_parquet(cls, path, allow_pickle: bool = False):
+        import pyarrow.parquet as pq
+        return cls.from_arrow(pq.read_table(path), allow_pickle)
+
 class MockResult(Result):
     """
         The MockResult is used to imitate a result
         Any requested outputs are themselves MockResults
     """
+    __slots__ = ()
+
     def __init__(self):
         self._outputs = defaultdict(MockResult)
 
@@ -60,6 +94,8 @@ class FigureResult(Result):
     """
         Same as Result but added a Figure and a name attribute
     """
+    __slots__ = ()
+
     def __init__(self, name, figure):
         super().__init__()        
         self.add_outputs({
@@ -80,6 +116,8 @@ class ScalarResult(Result):
     """
         Same as Result but added a (scalar) value and name attribute
     """
+    __slots__ = ()
+
     def __init__(self, name, value):
         super().__init__()
         self.add_outputs({
@@ -109,7 +147,8 @@ class TestResult(Result):
         pass or fail.
         The reasoning is a string that describes the outcome of the test.
     """
-    
+    __slots__ = ()
+
     def __init__(self,
                  name: str,
                  passed: bool,
@@ -145,6 +184,8 @@ class ScalarTestResult(TestResult):
     """
         Same as TestResult but added a (scalar) value attribute
     """
+    __slots__ = ()
+
     def __init__(self,
                  name: str,
                  passed: bool,
@@ -168,6 +209,8 @@ class RAGResult(TestResult):
         problematic or critical. The result implies that green is good,
         amber is problematic and red is critical.
     """
+    __slots__ = ()
+
     def __init__(self,
                  name: str,
                  color: str,
@@ -212,9 +255,13 @@ class ScalarRAGResult(RAGResult):
     """
         The ScalarRAGResult is the RAGResult based on a scalar value.
     """
+    __slots__ = ()
+
     def __init__(self, name: str, value: float, limit_amber: float, limit_red: float):
-        color, reason = self.scalar_to_color(value, limit_amber, limit_red)
-        super().__init__(name=name, color=color, reasoning=reason)
+        color = _scalar_color(value, limit_amber, limit_red)
+        # The reasoning is only formatted when asked for
+        super().__init__(name=name, color=color, reasoning=partial(
+            _scalar_reasoning, color, value, limit_amber, limit_red))
         self.add_outputs({
             "value": value,
             "limit_red": limit_red,
@@ -234,19 +281,51 @@ class ScalarRAGResult(RAGResult):
         return self['limit_amber']
 
     def scalar_to_color(self, value, limit_amber, limit_red):
-        # Determine if higher is better then evaluate color
-        if limit_red < limit_amber:
-            if value < limit_red:
-                return "RED", f"Value ({value:.4f}) below red threshold ({limit_red})"
-            elif value < limit_amber:
-                return "AMBER", f"Value ({value:.4f}) below amber threshold ({limit_amber})"
-            return "GREEN", f"Value ({value:.4f}) above amber threshold ({limit_amber})"
-        else:
-            if value > limit_red:
-                return "RED", f"Value ({value:.4f}) above red threshold ({limit_red})"
-            elif value > limit_amber:
-                return "AMBER", f"Value ({value:.4f}) above amber threshold ({limit_amber})"
-            return "GREEN", f"Value ({value:.4f}) below amber threshold ({limit_amber})"
+        color = _scalar_color(value, limit_amber, limit_red)
+        return color, _scalar_reasoning(color, value, limit_amber, limit_red)
+
+
+def _scalar_color(value, limit_amber, limit_red) -> str:
+    # Determine if higher is better then evaluate color
+    if limit_red < limit_amber:
+        if value < limit_red:
+            return "RED"
+        elif value < limit_amber:
+            return "AMBER"
+        return "GREEN"
+    else:
+        if value > limit_red:
+            return "RED"
+        elif value > limit_amber:
+            return "AMBER"
+        return "GREEN"
+
+
+def _scalar_reasoning(color, value, limit_amber, limit_red) -> str:
+    if limit_red < limit_amber:
+        worse, better = "below", "above"
+    else:
+        worse, better = "above", "below"
+    if color == "RED":
+        return f"Value ({value:.4f}) {worse} red threshold ({limit_red})"
+    elif color == "AMBER":
+        return f"Value ({value:.4f}) {worse} amber threshold ({limit_amber})"
+    return f"Value ({value:.4f}) {better} amber threshold ({limit_amber})"
+
+
+def _plain_result(outputs: dict) -> Result:
+    return Result().add_outputs(outputs)
+
+
+def _typed(values: ndarray) -> ndarray:
+    """ The values as the array numpy infers from them, or as objects if ragged """
+    if values.dtype != object:
+        return values
+    try:
+        typed = np.array(values.tolist())
+    except ValueError:
+        return values
+    return typed if typed.shape == values.shape else values
 
 
 class ResultTable(Result):
@@ -260,19 +339,52 @@ class ResultTable(Result):
         row_names[n]      results[n, 0],   results[n, 1], ...,   results[n, k]
 
         where each entry in row_names and column_names is a string, and each entry in
-        results is a Result object
+        results is a Result object.
 
+        Alternatively the table is built from_columns, holding an array per output,
+        and the Results are only created when the results are accessed.
     """
 
     def __init__(self, name: str, row_names: List[str], column_names: List[str], results: ResultArray):
         super().__init__()
+        # The outputs of every cell, by output key, as (n, k) arrays
+        self._attributes = {}
+        # The Result of a cell given its outputs, if built from_columns
+        self._cell = None
         self.add_outputs({
             "name": name,
             "row_names": row_names,
             "column_names": column_names,
             "results": results
         })
-        
+
+    @classmethod
+    def from_columns(cls, name: str, row_names: List[str], column_names: List[str],
+                     columns: Dict[str, Any],
+                     cell: Callable[[dict], Result] = _plain_result) -> 'ResultTable':
+        """
+            Build the table from an (n, k) array per output key, e.g. 'value' and
+            'count', where scalars are broadcast to every cell. The Result of a cell
+            is created by cell, given the outputs of the cell, once the results are
+            accessed.
+        """
+        shape = (len(row_names), len(column_names))
+        table = cls(name, row_names, column_names, results=None)
+        table._attributes = {
+            key: np.broadcast_to(np.asarray(value), shape) for key, value in columns.items()}
+        table._cell = cell
+        # A callable output is resolved lazily
+        table.add_outputs({"results": table._results_from_columns})
+        return table
+
+    def _results_from_columns(self) -> ResultArray:
+        shape = (len(self.row_names.value), len(self.column_names.value))
+        results = np.empty(shape, dtype=object)
+        for index in np.ndindex(*shape):
+            results[index] = self._cell(
+                {key: column[index] for key, column in self._attributes.items()})
+        return results
+
     @property
     def name(self):
         return self['name']
@@ -291,55 +403,100 @@ class ResultTable(Result):
 
     @results.setter
     def results(self, result_updated):
+        self._attributes = {}
+        self._cell = None
         self.add_outputs({
             "results": result_updated
         })
 
+    def memory_usage(self) -> Series:
+        """
+            The estimated bytes held by each output, where unresolved lazy outputs,
+            such as figures not yet drawn or evicted, hold none. The arrays of the
+            cell outputs are included as 'attributes'.
+        """
+        usage = super().memory_usage()
+        # Broadcast columns only hold their base
+        usage['attributes'] = sum(
+            _nbytes(column if column.base is None else column.base)
+            for column in self._attributes.values())
+        return usage
+
+    def attribute_values(self, attribute="value") -> ndarray:
+        """
+            The value of the output attribute of every cell as an (n, k) array, None
+            where a cell has no such output. The array is typed if the table is built
+            from_columns, else it holds objects, and is computed once per attribute.
+        """
+        if attribute not in self._attributes:
+            results = self.results.value
+            values = np.empty(results.shape, dtype=object)
+            for index, result in np.ndenumerate(results):
+                output = result[attribute]
+                values[index] = output.value if isinstance(output, Output) else output
+            self._attributes[attribute] = values
+        return self._attributes[attribute]
+
+    def _indices(self, names, all_names):
+        if names is None:
+            return slice(None)
+        if isinstance(names, (str, float, int)):
+            names = [names]
+        return [all_names.index(name) for name in names]
+
+    def _subset_index(self, row_names=None, column_names=None) -> tuple:
+        indices_row = self._indices(row_names, self.row_names)
+        indices_column = self._indices(column_names, self.column_names)
+        if isinstance(indices_row, list) and isinstance(indices_column, list):
+            return np.ix_(indices_row, indices_column)
+        return indices_row, indices_column
+
+    def subset(self, row_names=None, column_names=None) -> 'ResultTable':
+        """
+            The table of the given rows and columns. A table built from_columns gives
+            a table of the sliced columns, so no Result is created for the cells.
+        """
+        index = self._subset_index(row_names, column_names)
+        rows = list(np.asarray(self.row_names.value, dtype=object)[index[0]].ravel())
+        columns = list(np.asarray(self.column_names.value, dtype=object)[index[1]].ravel())
+        if self._cell is None:
+            return ResultTable(self.name.value, rows, columns, self.results.value[index])
+        return ResultTable.from_columns(
+            self.name.value, rows, columns,
+            {key: column[index] for key, column in self._attributes.items()}, cell=self._cell)
+
     def get_result_subset(self, row_names=None, column_names=None) -> ResultArray:
-        indices_row = []
-        indices_column = []
-        if row_names is not None:
-            if isinstance(row_names, (str, float, int)):
-                row_names = [row_names]
-            indices_row = [self.row_names.index(name) for name in row_names]
-        if column_names is not None:
-            if isinstance(column_names, (str, float, int)):
-                column_names = [column_names]
-            indices_column = [self.column_names.index(name) for name in column_names]
-        if indices_row and indices_column:
-            return self.results[np.ix_(indices_row, indices_column)]
-        elif indices_row:
-            return self.results[indices_row, :]
-        else:  # indices_column:
-            return self.results[:, indices_column]
+        # Only the Results of the subset are created, unless every Result already is
+        if self._cell is not None and \
+                self._outputs['results']._output_type == OutputType.UNRESOLVED:
+            return self.subset(row_names, column_names).results.value
+        return self.results[self._subset_index(row_names, column_names)]
 
     def get_column_results(self, column_names, attribute="value", value=False):
         """
         If columns is a string or list of len 1 return List[Result]
         Else return List[List[Result]] with "shape" (# self.row_names, # cols)
         """
-        sub_results = self.get_result_subset(column_names=column_names)
         if value:
-            return np.array(
-                [[entry[attribute].value for entry in out_row] for out_row in sub_results])
-        else:
-            return np.array(
-                [[entry[attribute] for entry in out_row] for out_row in sub_results],
-                dtype=self.results.dtype)
+            indices_column = self._indices(column_names, self.column_names)
+            return _typed(self.attribute_values(attribute)[:, indices_column])
+        sub_results = self.get_result_subset(column_names=column_names)
+        return np.array(
+            [[entry[attribute] for entry in out_row] for out_row in sub_results],
+            dtype=self.results.dtype)
 
     def get_row_results(self, row_names, attribute="value", value=False):
         """
         If rows is a string or list of len 1 return List[Result]
         Else return List[List[Result]] with "shape" (# rows, # self.row_names)
         """
-        sub_results = self.get_result_subset(row_names=row_names)
         if value:
-            return np.array(
-                [[entry[attribute].value for entry in out_row] for out_row in sub_results])
-        else:
-            return np.array(
-                [[entry[attribute] for entry in out_row] for out_row in sub_results],
-                dtype=self.results.dtype)
+            indices_row = self._indices(row_names, self.row_names)
+            return _typed(self.attribute_values(attribute)[indices_row, :])
+        sub_results = self.get_result_subset(row_names=row_names)
+        return np.array(
+            [[entry[attribute] for entry in out_row] for out_row in sub_results],
+            dtype=self.results.dtype)
 
     def insert_column(self, column_values, column_name, idx):
         self.results = np.c_[
@@ -350,12 +507,14 @@ class ResultTable(Result):
         self.column_names.insert(idx, column_name)
 
     def to_dataframe(self, attribute="value", value=False) -> DataFrame:
-        attribute_data = [[result[attribute] for result in results]
-                          for results in self.results.value]
-        df = DataFrame(attribute_data,
-                       columns=self.column_names.value,
-                       index=self.row_names.value)
         if value:
-            df = df.applymap(lambda x: x.value if isinstance(x, Output) else x)
+            # Each column gets its own dtype, as when the values are mapped one by one
+            return DataFrame(self.attribute_values(attribute),
+                             columns=self.column_names.value,
+                             index=self.row_names.value).infer_objects()
 
-        return df
+        attribute_data = [[result[attribute] for result in results]
+                          for results in self.results.value]
+        return DataFrame(attribute_data,
+                         columns=self.column_names.value,
+                         index=self.row_names.value)
@@ -0,0 +1,272 @@
+"""
+    Columnar serialisation of Results, e.g. the results of a whole Runner, to Arrow
+    tables and Parquet files. The table has a row per output of every result:
+
+        result    the id of the result, unique within the table
+        parent    the id of the ResultTable or Result holding the result, if any
+        row       the row of the result in the results of its ResultTable, if any
+        column    the column of the result in the results of its ResultTable, if any
+        class     the class of the result, as module.name
+        uid       the recording uid of the result, if any
+        doc       the documentation of the result, if any
+        key       the key of the output, None for a result without outputs
+        kind      how the value of the output is stored
+        output_doc  the documentation of the output, if any
+
+    and the value of the output in the column of its kind: bool, int, float and string
+    for scalars, string for JSON, and blob for arrays (.npy), lists and tuples of
+    arrays (.npz), figures (zlib compressed JSON), and other values (pickled). Pickled
+    values are only read with allow_pickle, as unpickling a file can run any code.
+    The values of a SourceReference are written as an array. Results held by an
+    output, and the results of a ResultTable, are serialised as results of their own.
+    The ids of the results serialised, by their name, are kept in the metadata of the table.
+"""
+from functools import partial
+from importlib import import_module
+from typing import Dict, Optional
+import io
+import json
+import pickle
+import zlib
+
+from plotly.graph_objects import Figure
+import numpy as np
+import plotly.io as pio
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cr.documentation import Doc
+from .output import Output, OutputType, SourceReference
+from .result import Result, ResultTable
+
+_SCHEMA = pa.schema([
+    ('result', pa.int32()),
+    ('parent', pa.int32()),
+    ('row', pa.int32()),
+    ('column', pa.int32()),
+    ('class', pa.dictionary(pa.int32(), pa.string())),
+    ('uid', pa.dictionary(pa.int32(), pa.string())),
+    ('doc', pa.dictionary(pa.int32(), pa.string())),
+    ('key', pa.string()),
+    ('kind', pa.dictionary(pa.int32(), pa.string())),
+    ('output_doc', pa.string()),
+    ('bool', pa.bool_()),
+    ('int', pa.int64()),
+    ('float', pa.float64()),
+    ('string', pa.string()),
+    ('blob', pa.binary()),
+])
+
+
+def _doc_string(obj) -> Optional[str]:
+    doc = getattr(obj, '_cr_doc', None)
+    return None if doc is None else doc.doc_string
+
+
+def _array_bytes(array: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _arrays_bytes(arrays: list) -> bytes:
+    buffer = io.BytesIO()
+    np.savez(buffer, *arrays)
+    return buffer.getvalue()
+
+
+def _arrays_from_blob(blob: bytes, kind: str):
+    with np.load(io.BytesIO(blob), allow_pickle=False) as arrays:
+        items = [arrays[f"arr_{i}"] for i in range(len(arrays.files))]
+    return tuple(items) if kind == 'tuple' else items
+
+
+def _figure_from_blob(blob: bytes) -> Figure:
+    return pio.from_json(zlib.decompress(blob).decode())
+
+
+class _Writer(object):
+
+    def __init__(self, resolve_lazy: bool):
+        self.resolve_lazy = resolve_lazy
+        self.columns = {field.name: [] for field in _SCHEMA}
+        self._ids = {}
+
+    def add(self, result: Result, parent=None, row=None, column=None) -> int:
+        # A result held by several outputs is only written once
+        if id(result) in self._ids:
+            return self._ids[id(result)]
+        result_id = self._ids[id(result)] = len(self._ids)
+
+        entry = dict(
+            result=result_id, parent=parent, row=row, column=column,
+            uid=getattr(result, '_recording_uid', None), doc=_doc_string(result),
+            **{'class': f"{type(result).__module__}.{type(result).__qualname__}"})
+
+        outputs = list(result._outputs.items())
+        if not outputs:
+            self._append(entry, key=None, kind='none')
+        for key, output in outputs:
+            lazy = output._output_type == OutputType.UNRESOLVED
+            # The results of a ResultTable built from columns are always written
+            if lazy and not self.resolve_lazy and not (
+                    isinstance(result, ResultTable) and key == 'results'):
+                continue
+            self._append(entry, key=key, output_doc=_doc_string(output),
+                         **self._encode(result_id, output.value))
+        return result_id
+
+    def _append(self, entry: dict, **values):
+        for name, column in self.columns.items():
+            column.append(values.get(name, entry.get(name)))
+
+    def _encode(self, result_id: int, value) -> dict:
+        if value is None:
+            return dict(kind='none')
+        if isinstance(value, (bool, np.bool_)):
+            return dict(kind='bool', bool=bool(value))
+        if isinstance(value, (int, np.integer)):
+            return dict(kind='int', int=int(value))
+        if isinstance(value, (float, np.floating)):
+            return dict(kind='float', float=float(value))
+        if isinstance(value, str):
+            return dict(kind='string', string=str(value))
+        if isinstance(value, Figure):
+            return dict(kind='figure', blob=zlib.compress(value.to_json().encode()))
+        if isinstance(value, Result):
+            return dict(kind='result', int=self.add(value))
+        if isinstance(value, (np.ndarray, SourceReference)):
+            return self._encode_array(result_id, np.asarray(value))
+        if isinstance(value, (list, tuple)):
+            # The values referred to are written, as the datasets are not
+            value = type(value)(np.asarray(item) if isinstance(item, SourceReference) else item
+                                for item in value)
+            if value and all(isinstance(item, np.ndarray) and item.dtype != object
+                             for item in value):
+                return dict(kind='arrays', string=type(value).__name__,
+                            blob=_arrays_bytes(value))
+        try:
+            return dict(kind='json', string=json.dumps(value))
+        except (TypeError, ValueError):
+            return dict(kind='pickle', blob=pickle.dumps(value))
+
+    def _encode_array(self, result_id: int, array: np.ndarray) -> dict:
+        if array.dtype == object and array.size and all(
+                isinstance(item, Result) for item in array.flat):
+            for (row, column), item in np.ndenumerate(array.reshape(array.shape[0], -1)):
+                self.add(item, parent=result_id, row=row, column=column)
+            return dict(kind='results', string=json.dumps(array.shape))
+        if array.dtype == object:
+            # Typed if numpy can infer a type from the items
+            try:
+                typed = np.array(array.tolist())
+            except ValueError:
+                typed = array
+            if typed.dtype == object or typed.shape != array.shape:
+                return dict(kind='pickle', blob=pickle.dumps(array))
+            array = typed
+        return dict(kind='array', blob=_array_bytes(array))
+
+
+def results_to_arrow(results: Dict[str, Result], resolve_lazy: bool = True) -> pa.Table:
+    """
+        The results, by name, as an Arrow table. Lazy outputs are resolved and written,
+        or left out if not resolve_lazy and not yet resolved.
+    """
+    writer = _Writer(resolve_lazy)
+    roots = {str(name): writer.add(result) for name, result in results.items()}
+    return pa.table(
+        [pa.array(writer.columns[field.name], type=field.type.value_type).dictionary_encode()
+         if pa.types.is_dictionary(field.type)
+         else pa.array(writer.columns[field.name], type=field.type)
+         for field in _SCHEMA],
+        schema=_SCHEMA.with_metadata({'cr_results': json.dumps(roots)}))
+
+
+def _result_class(name: str):
+    module, qualname = name.rsplit('.', 1)
+    return getattr(import_module(module), qualname)
+
+
+def _decode(kind: str, row: dict, results: dict, allow_pickle: bool = False):
+    if kind == 'none':
+        return None
+    if kind in ('bool', 'int', 'float', 'string'):
+        return row[kind]
+    if kind == 'json':
+        return json.loads(row['string'])
+    if kind == 'array':
+        return np.load(io.BytesIO(row['blob']), allow_pickle=False)
+    if kind == 'arrays':
+        return _arrays_from_blob(row['blob'], row['string'])
+    if kind == 'figure':
+        # Figures are parsed lazily, when first read
+        return partial(_figure_from_blob, row['blob'])
+    if kind == 'pickle':
+        if not allow_pickle:
+            raise ValueError("Unable to read a pickled output without allow_pickle, "
+                             "only read pickled outputs of files you trust")
+        return pickle.loads(row['blob'])
+    if kind == 'result':
+        return results[row['int']]
+    raise ValueError(f"Unable to read an output of kind {kind}")
+
+
+def results_from_arrow(table: pa.Table, allow_pickle: bool = False) -> Dict[str, Result]:
+    """
+        The results, by name, of an Arrow table written by results_to_arrow. Outputs
+        pickled are only read with allow_pickle, else a ValueError is raised.
+    """
+    rows = table.to_pylist() if hasattr(table, 'to_pylist') else [
+        dict(zip(table.column_names, values))
+        for values in zip(*(column.to_pylist() for column in table.columns))]
+
+    # Create every result before filling in the outputs, as outputs refer to results
+    results = {}
+    for row in rows:
+        if row['result'] in results:
+            continue
+        cls = _result_class(row['class'])
+        result = cls.__new__(cls)
+        Result.__init__(result)
+        if isinstance(result, ResultTable):
+            result._attributes = {}
+        if row['uid'] is not None:
+            result._recording_uid = row['uid']
+        if row['doc'] is not None:
+            result._cr_doc = Doc(row['doc'])
+        results[row['result']] = result
+
+    cells: Dict[int, Dict[tuple, int]] = {}
+    for row in rows:
+        if row['parent'] is not None and row['row'] is not None:
+            cells.setdefault(row['parent'], {})[(row['row'], row['column'])] = row['result']
+
+    for row in rows:
+        if row['key'] is None:
+            continue
+        if row['kind'] == 'results':
+            shape = tuple(json.loads(row['string']))
+            value = np.empty(shape, dtype=object)
+            flat = value.reshape(shape[0], -1)
+            for (i, j), result_id in cells.get(row['result'], {}).items():
+                flat[i, j] = results[result_id]
+        else:
+            value = _decode(row['kind'], row, results, allow_pickle)
+        output = Output(value)
+        if row['output_doc'] is not None:
+            output._cr_doc = Doc(row['output_doc'])
+        results[row['result']]._outputs[row['key']] = output
+
+    roots = json.loads(table.schema.metadata[b'cr_results'])
+    return {name: results[result_id] for name, result_id in roots.items()}
+
+
+def write_results(path, results: Dict[str, Result], resolve_lazy: bool = True):
+    """ Write the results, by name, to a Parquet file """
+    pq.write_table(results_to_arrow(results, resolve_lazy), path)
+
+
+def read_results(path, allow_pickle: bool = False) -> Dict[str, Result]:
+    """ Read the results, by name, of a Parquet file written by write_results, see results_from_arrow """
+    return results_from_arrow(pq.read_table(path), allow_pickle)
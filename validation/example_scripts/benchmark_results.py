@@ -0,0 +1,42 @@
+"""
+    Microbenchmark of building results: the construction time and the allocated
+    memory blocks, bytes and garbage collected objects per 10k results.
+"""
+import gc
+import time
+import tracemalloc
+
+import numpy as np
+
+from cr.testing.result import ScalarRAGResult, ScalarResult
+
+N = 10_000
+
+
+def measure(name, build):
+    values = np.random.default_rng(0).random(N)
+    build(values[:100])
+
+    gc.collect()
+    tracked = len(gc.get_objects())
+    start = time.perf_counter()
+    results = build(values)
+    seconds = time.perf_counter() - start
+    objects = len(gc.get_objects()) - tracked
+
+    del results
+    gc.collect()
+    tracemalloc.start()
+    results = build(values)
+    blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{name:<16} {seconds * 1000:8.1f} ms {blocks:9,} blocks {size / 2**20:7.2f} MiB "
+          f"{objects:9,} gc objects per {N:,} results")
+
+
+if __name__ == "__main__":
+    measure("ScalarResult", lambda values: [ScalarResult("VALUE", value) for value in values])
+    measure("ScalarRAGResult", lambda values: [ScalarRAGResult("VALUE", value, 0.5, 0.8)
+                                               for value in values])
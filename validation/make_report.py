@@ -5,6 +5,18 @@ from cr.automation import Runner
 from cr.reporting import LatexWriter, Report
 from cr.reporting.writers.latex.template import CR, Template
 
+
+def ingest(path):
+    path = Path(path)
+    if path.suffix in [".xlsx", ".xlsm", ".xsl"]:
+        return from_excel(path)
+    elif path.suffix in [".csv"]:
+        return from_csv(path)
+    elif path.suffix in [".pq", ".parq", ".parquet"]:
+        return from_parquet(path)
+    raise Exception(f"Unable to load data with extension {path.suffix}")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate reports based on a previously recorded tape")
     parser.add_argument("tape", help="Path to a file containing the tape as yaml")
@@ -18,14 +30,7 @@ if __name__ == "__main__":
     if args.data:
         path = Path(args.data)
         # TODO: How to set dataset name?!?
-        if path.suffix in [".xlsx", ".xlsm", ".xsl"]:
-            datasets[path.stem] = from_excel(path)
-        elif path.suffix in [".csv"]:
-            datasets[path.stem] = from_csv(path)
-        elif path.suffix in [".pq", ".parq", ".parquet"]:
-            datasets[path.stem] = from_parquet(path)
-        else:
-            raise Exception(f"Unable to load data with extension {path.suffix}")
+        datasets[path.stem] = ingest(path)
 
     runner = Runner(args.tape, datasets)
     report = Report.from_yaml(args.report)
@@ -0,0 +1,37 @@
+import argparse
+from pathlib import Path
+import yaml
+from cr.automation import BatchRunner
+from cr.reporting import LatexWriter, Report
+from cr.reporting.writers.latex.template import CR, Template
+from make_report import ingest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate many reports, whose tapes share the same root data, in one run")
+    parser.add_argument("batch", help="Path to a yaml file with a list of jobs, each with a tape, a report and an output directory")
+    parser.add_argument("-d", "--data", help="Paths to files that contain the root data", nargs="*", default=[])
+    parser.add_argument("-t", "--template", help="Name of LatexTemplate to use", default="CR")
+    parser.add_argument("-w", "--workers", help="Number of workers running the tests", type=int, default=4)
+    args = parser.parse_args()
+
+    # Paths in the batch file are relative to the batch file
+    batch_path = Path(args.batch)
+    with open(batch_path, 'rb') as file:
+        jobs = yaml.safe_load(file)['jobs']
+    for job in jobs:
+        for key in ["tape", "report", "output"]:
+            job[key] = batch_path.parent.joinpath(job[key])
+
+    # The root data is ingested once and shared by all tapes
+    datasets = {}
+    for path in args.data:
+        datasets[Path(path).stem] = ingest(path)
+
+    batch = BatchRunner([job["tape"] for job in jobs], datasets, max_workers=args.workers)
+    batch.run()
+
+    for job, runner in zip(jobs, batch):
+        report = Report.from_yaml(job["report"])
+        template = CR() if args.template == "CR" else Template()
+        LatexWriter(job["output"], template).write(report, runner)
+        print(f'Created and exported report "{report.title}" to folder "{job["output"]}"')
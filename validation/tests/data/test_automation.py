@@ -1,11 +1,23 @@
+import asyncio
+import sqlite3
+import threading
+import time
 import yaml
 import numpy as np
+import pandas as pd
+import logging
 from test_dataset import df, dataset
 
-from cr.automation import recordable, record, get_session_tape, Runner, set_active_tape, Tape
+from cr.automation import recordable, record, get_session_tape, Runner, set_active_tape, Tape, BatchRunner, StoredBaseline
 from cr.testing.result import Result, MockResult
 from cr.data import DataSet
-from cr.data.segmentation import ByGroup
+from cr.data.ingestion import from_sql, from_csv, from_parquet, from_parquet_dataset
+from cr.data.segmentation import ByGroup, Temporal
+from cr.calculation.profile import shared_profile, vector_profile
+from cr.reporting.mapper import ContentMapper
+from cr.automation.fusion import fusion_groups
+from cr.testing.metric import simple
+from cr.testing.metric.performance.discriminatory_power import auc, auc_delta
 
 @recordable
 def some_function(x, y):
@@ -19,6 +31,40 @@ def some_other_function(x:Result, y):
 def some_np_function(x, y, z=1):
     return Result().add_outputs({"value": (x[0] + y[0])*z})
 
+_running = {"now": 0, "max": 0}
+_running_lock = threading.Lock()
+
+@recordable
+def some_slow_function(x, seconds):
+    with _running_lock:
+        _running["now"] += 1
+        _running["max"] = max(_running["max"], _running["now"])
+    time.sleep(seconds)
+    with _running_lock:
+        _running["now"] -= 1
+    return Result().add_outputs({"value": x})
+
+_calls = []
+
+@recordable
+def some_counted_function(x, seconds):
+    with _running_lock:
+        _calls.append(x)
+    time.sleep(seconds)
+    return Result().add_outputs({"value": x})
+
+def _tape_with_shared_dependency(dependents=4):
+    tape = Tape()
+    set_active_tape(tape)
+    try:
+        base = some_counted_function(1, 0.1, recording_uuid="base")
+        for i in range(dependents):
+            some_other_function(base, i, recording_uuid=f"dependent {i}")
+    finally:
+        set_active_tape(None)
+    _calls.clear()
+    return yaml.safe_load(tape.to_yaml())
+
 def test_recording_simple():
     with record():
         some_function(3, 4)
@@ -111,3 +157,338 @@ def test_dryrun_result_as_input():
     runner = Runner(yaml.safe_load(serialized_tape), {"dataset": dataset})
     with record():
         assert type(runner.run("test1", dry_run=True)) == MockResult
+
+def test_run_many_fused(df, dataset):
+    tape = Tape()
+    set_active_tape(tape)
+    try:
+        for column in ["factor 2", "segmentor 1"]:
+            simple.missing(dataset[column], recording_uuid=f"missing {column}")
+            simple.unique_values(dataset[column], recording_uuid=f"unique {column}")
+            simple.median(dataset[column], recording_uuid=f"median {column}")
+        simple.percentile(dataset["factor 2"], q=10, recording_uuid="p10")
+        simple.maximum_value(v=dataset["factor 2"], recording_uuid="max")
+        simple.mean_value(dataset["factor 2"], recording_uuid="mean")
+    finally:
+        set_active_tape(None)
+    serialized_tape = tape.to_yaml()
+
+    groups = fusion_groups(tape.tests)
+    assert set(groups[("dataset", "factor 2", "vector profile")]) == {
+        "missing factor 2", "unique factor 2", "median factor 2", "p10", "max"}
+    assert len(groups[("dataset", "segmentor 1", "vector profile")]) == 3
+
+    unfused = Runner(yaml.safe_load(serialized_tape), {"dataset": dataset})
+    fused = Runner(yaml.safe_load(serialized_tape), {"dataset": dataset}).run_many()
+    assert set(fused.keys()) == set(tape.tests.keys())
+    for uid, result in fused.items():
+        expected = unfused.run(uid)
+        assert result.outputs == expected.outputs
+        assert result["value"] == expected["value"]
+
+    np.testing.assert_array_equal(
+        fused["unique segmentor 1"]["values"].value, ["ERHVERV", "PRIVAT"])
+    assert fused["max"]["value"] == df["factor 2"].max()
+    assert fused["p10"]["value"] == np.percentile(df["factor 2"], 10)
+
+
+def test_profiled_metrics_match_numpy():
+    v = np.array([3.0, np.nan, 1.0, 7.0, 3.0, np.nan, 2.5])
+    assert simple.missing(v)["value"] == 2
+    assert simple.minimum_value(v)["value"] == np.nanmin(v)
+    assert simple.maximum_value(v)["value"] == np.nanmax(v)
+    assert simple.median(v)["value"] == np.nanmedian(v)
+    assert simple.percentile(v, q=90)["value"] == np.nanpercentile(v, 90)
+    values, counts = np.unique(v[~np.isnan(v)], return_counts=True)
+    np.testing.assert_array_equal(simple.unique_values(v)["values"].value, values)
+    np.testing.assert_array_equal(simple.unique_values(v)["counts"].value, counts)
+    assert np.isnan(simple.maximum_value(np.array([np.nan]))["value"].value)
+
+    s = np.array(["b", "a", "nan", "b", "None", "c"], dtype=object)
+    assert simple.missing(s)["value"] == 2
+    assert simple.mode(s)["value"] == "b"
+    assert simple.median(s)["value"] == "b"
+
+
+def test_shared_profiles_are_per_thread():
+    v = np.array([3.0, np.nan, 1.0])
+    barrier = threading.Barrier(2)
+    profiles = []
+
+    def share():
+        with shared_profile(v) as profile:
+            barrier.wait()
+            profiles.append(vector_profile(v))
+            assert vector_profile(v) is profile
+            barrier.wait()
+
+    threads = [threading.Thread(target=share) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Both threads left their scope without a KeyError, each with its own profile
+    assert len(profiles) == 2 and profiles[0] is not profiles[1]
+    assert vector_profile(v) not in profiles
+
+
+def test_dictionary_encoded_metrics_match_strings():
+    s = np.array(["b", "a", "nan", "b", "None", "c", "a", "b"], dtype=object)
+    plain = DataSet("plain", pd.DataFrame({"s": s, "g": [0, 1] * 4}))
+    encoded = DataSet("encoded", pd.DataFrame({"s": pd.Categorical(s), "g": [0, 1] * 4}))
+    assert encoded["s"].codes is not None
+    assert encoded["s"][1:].codes is None
+
+    pairs = [(plain["s"], encoded["s"])] + [
+        (p["s"], e["s"]) for p, e in zip(plain.segment("g", ByGroup()), encoded.segment("g", ByGroup()))]
+    for v_plain, v_encoded in pairs:
+        assert v_encoded.codes is not None
+        for metric in [simple.missing, simple.mode, simple.median]:
+            assert metric(v_encoded)["value"] == metric(v_plain)["value"]
+        for output in ["values", "counts"]:
+            np.testing.assert_array_equal(simple.unique_values(v_encoded)[output].value,
+                                          simple.unique_values(v_plain)[output].value)
+
+
+def test_stream_results():
+    tape = Tape()
+    set_active_tape(tape)
+    try:
+        for i in range(6):
+            some_slow_function(i, 0.05 * (6 - i), recording_uuid=f"slow {i}")
+    finally:
+        set_active_tape(None)
+    runner = Runner(yaml.safe_load(tape.to_yaml()))
+    _running["max"] = 0
+
+    async def collect():
+        return [(uid, result) async for uid, result in runner.stream(max_concurrency=3)]
+
+    streamed = asyncio.run(collect())
+    assert sorted(uid for uid, _ in streamed) == sorted(tape.tests.keys())
+    assert all(result["value"] == int(uid.split()[1]) for uid, result in streamed)
+    # The quick tests complete before the slow ones started ahead of them
+    assert streamed[0][0] != "slow 0"
+    assert _running["max"] <= 3
+
+    async def take_first():
+        async for uid, result in runner.stream(list(tape.tests.keys())):
+            return uid
+
+    assert asyncio.run(take_first()) in tape.tests
+
+def test_stream_runs_shared_dependency_once():
+    runner = Runner(_tape_with_shared_dependency())
+
+    async def collect():
+        uids = [uid for uid in runner.tests if uid != "base"]
+        return [result async for _, result in runner.stream(uids, max_concurrency=8)]
+
+    assert sorted(result["value"].value for result in asyncio.run(collect())) == [1, 2, 3, 4]
+    assert _calls == [1]
+
+
+def test_batch_runner_shares_datasets(df, tmp_path, monkeypatch):
+    path = tmp_path.joinpath("data.csv")
+    df.to_csv(path, index=False)
+
+    tapes = []
+    for i in range(2):
+        tape = Tape()
+        set_active_tape(tape)
+        try:
+            dataset = from_csv(str(path), id_=f"dataset {i}")
+            segments = dataset.segment(by="segmentor 1", method=ByGroup())
+            for segment in segments:
+                some_np_function(segment["factor 1"], segment["target 1"], z=i,
+                                 recording_uuid=f"{segment.segment_id} {i}")
+        finally:
+            set_active_tape(None)
+        tapes.append(yaml.safe_load(tape.to_yaml()))
+
+    read_csv = pd.read_csv
+    reads = []
+    monkeypatch.setattr(pd, "read_csv", lambda *args, **kwargs: reads.append(args) or read_csv(*args, **kwargs))
+
+    batch = BatchRunner(tapes, max_workers=2)
+    results = batch.run()
+    assert len(reads) == 1
+
+    runner_0, runner_1 = batch.runners
+    assert runner_0.get_dataset("dataset 0") is runner_1.get_dataset("dataset 1")
+    assert (runner_0.get_dataset("dataset 0>segmentor 1=PRIVAT")
+            is runner_1.get_dataset("dataset 1>segmentor 1=PRIVAT"))
+    assert results[1]["PRIVAT 1"]["value"] == df["factor 1"][2] + df["target 1"][2]
+
+
+def test_batch_runner_runs_shared_dependency_once():
+    results = BatchRunner([_tape_with_shared_dependency()], max_workers=8).run()
+    assert _calls == [1]
+    assert results[0]["dependent 3"]["value"] == 4
+
+def test_content_mapper_resolves_shared_dependency_once(tmp_path):
+    runner = Runner(_tape_with_shared_dependency(), result_store=tmp_path.joinpath("results.db"))
+    content = " ".join(f"!<RES;dependent {i}.value;SCALAR>!" for i in range(4))
+    mapper = ContentMapper(runner, {}).resolve([content], max_workers=8)
+
+    assert mapper.map(content) == "1 2 3 4"
+    assert _calls == [1]
+    # The dependency is stored once, as is every dependent
+    history = runner.result_store.history("test_automation.some_counted_function", segment=None)
+    assert len(history) == 1
+
+def test_memory_budget_evicts_and_rebuilds_segments(df, dataset, caplog):
+    tape = Tape()
+    set_active_tape(tape)
+    try:
+        for by in ["segmentor 1", "segmentor 2"]:
+            for segment in dataset.segment(by=by, method=ByGroup()):
+                some_np_function(segment["factor 1"], segment["target 1"],
+                                 recording_uuid=f"{by}={segment.segment_id}")
+    finally:
+        set_active_tape(None)
+    serialized_tape = tape.to_yaml()
+
+    root = DataSet("dataset", df)
+    # Room for the pinned root and a single segmentation
+    runner = Runner(yaml.safe_load(serialized_tape), {"dataset": root},
+                    memory_budget=root.nbytes + 100)
+    with caplog.at_level(logging.INFO, logger="cr.automation.cache"):
+        assert runner.run("segmentor 1=PRIVAT")["value"] == df["factor 1"][2] + df["target 1"][2]
+        runner.run("segmentor 2=2016")
+        assert runner.datasets.evictions == 2
+        assert "dataset>segmentor 1=PRIVAT" not in runner.datasets
+        assert len(root.segmentations) == 1
+        assert runner.datasets.nbytes <= runner.datasets.max_bytes
+
+        runner._runs.clear()
+        assert runner.run("segmentor 1=PRIVAT")["value"] == df["factor 1"][2] + df["target 1"][2]
+        # The segmentation is rebuilt as a whole
+        assert runner.datasets.rebuilds == 2
+    assert any("Evicted" in message for message in caplog.messages)
+    assert any("Rebuilt" in message for message in caplog.messages)
+
+
+def test_parquet_ingestion_reads_used_columns(df, tmp_path):
+    path = tmp_path.joinpath("data.parquet")
+    df.to_parquet(path, index=False, row_group_size=2)
+
+    filtered = from_parquet(str(path), filters=[("segmentor 2", ">=", 2019)])
+    assert filtered.observations == 4
+    either = from_parquet(str(path), filters=[[("segmentor 2", ">=", 2019)],
+                                              [("segmentor 1", "in", ["PRIVAT"])]])
+    expected = df[(df["segmentor 2"] >= 2019) | (df["segmentor 1"] == "PRIVAT")]
+    assert either.observations == len(expected)
+    assert list(from_parquet(str(path), columns=["factor 1", "target 1"])._df.columns) == \
+        ["target 1", "factor 1"]
+
+    tape = Tape()
+    set_active_tape(tape)
+    try:
+        dataset = from_parquet(str(path), id_="dataset")
+        for segment in dataset.segment(by="segmentor 1", method=ByGroup()):
+            some_np_function(segment["factor 1"], segment["target 1"],
+                             recording_uuid=str(segment.segment_id))
+    finally:
+        set_active_tape(None)
+    serialized_tape = yaml.safe_load(tape.to_yaml())
+
+    runner = Runner(serialized_tape)
+    assert runner.run("PRIVAT")["value"] == df["factor 1"][2] + df["target 1"][2]
+    assert list(runner.get_dataset("dataset")._df.columns) == ["target 1", "factor 1", "segmentor 1"]
+
+    runner = Runner(serialized_tape, project_columns=False)
+    runner.run("PRIVAT")
+    assert runner.get_dataset("dataset")._df.shape[1] == df.shape[1]
+
+
+def test_partitioned_parquet_ingestion(df, tmp_path):
+    for month in range(1, 4):
+        df.assign(**{"factor 1": df["factor 1"] * month}).to_parquet(
+            tmp_path.joinpath(f"2021-0{month}.parquet"), index=False)
+
+    tape = Tape()
+    set_active_tape(tape)
+    try:
+        dataset = from_parquet_dataset(str(tmp_path.joinpath("*.parquet")), id_="dataset",
+                                       partition_column="snapshot", partition_format="%Y-%m",
+                                       segmentation=Temporal("monthly"), max_workers=3)
+        assert dataset.observations == 3 * len(df)
+        segmentation, = dataset.segmentations
+        for segment in segmentation:
+            some_np_function(segment["factor 1"], segment["target 1"],
+                             recording_uuid=str(segment.segment_id))
+    finally:
+        set_active_tape(None)
+
+    runner = Runner(yaml.safe_load(tape.to_yaml()))
+    assert runner.run("2021-03")["value"] == 3 * df["factor 1"][0] + df["target 1"][0]
+    assert list(runner.get_dataset("dataset")._df.columns) == ["target 1", "factor 1", "snapshot"]
+
+
+def test_sql_ingestion(df, tmp_path):
+    path = tmp_path.joinpath("ifrs9.db")
+    with sqlite3.connect(path) as connection:
+        df.drop(columns="segmentor 3").to_sql("ifrs9_output", connection, index=False)
+    url = f"sqlite:///{path}"
+    query = 'SELECT * FROM ifrs9_output WHERE "segmentor 2" >= :year'
+
+    tape = Tape()
+    set_active_tape(tape)
+    try:
+        dataset = from_sql(url, query, id_="dataset", params={"year": 2016}, chunksize=2)
+        some_np_function(dataset["factor 1"], dataset["target 1"], recording_uuid="test")
+    finally:
+        set_active_tape(None)
+
+    expected = df[df["segmentor 2"] >= 2016].reset_index(drop=True)
+    assert dataset.observations == len(expected)
+    assert dataset._df["factor 2"].dtype == np.float64
+    np.testing.assert_array_equal(dataset["segmentor 1"], expected["segmentor 1"])
+
+    runner = Runner(yaml.safe_load(tape.to_yaml()))
+    assert runner.run("test")["value"] == expected["factor 1"][0] + expected["target 1"][0]
+    assert runner.get_dataset("dataset").observations == len(expected)
+
+
+def test_from_sql_chunk_of_nulls(tmp_path):
+    path = tmp_path.joinpath("nulls.db")
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE t (a INTEGER, b REAL, c TEXT)")
+        connection.executemany("INSERT INTO t VALUES (?, ?, ?)",
+                               [(1, 0.5, "x"), (2, 1.5, "y"), (None, None, None), (None, None, None)])
+
+    dataset = from_sql(f"sqlite:///{path}", "SELECT * FROM t ORDER BY rowid", chunksize=2)
+    assert dataset._df["a"].dtype == np.float64
+    assert dataset._df["b"].dtype == np.float64
+    np.testing.assert_array_equal(dataset["b"], [0.5, 1.5, np.nan, np.nan])
+
+
+def test_result_store_across_runs(df, tmp_path):
+    path = tmp_path.joinpath("data.csv")
+    df.to_csv(path, index=False)
+    store = tmp_path.joinpath("results.db")
+    function = "cr.testing.metric.performance.discriminatory_power.auc"
+
+    tape = Tape()
+    set_active_tape(tape)
+    try:
+        dataset = from_csv(str(path), id_="dataset")
+        for segment in dataset.segment(by="segmentor 1", method=ByGroup()):
+            current = auc(segment["target 2"], segment["target 1"],
+                          recording_uuid=f"auc {segment.segment_id}")
+            auc_delta(StoredBaseline(store, function, segment=segment.segment_id), current,
+                      recording_uuid=f"delta {segment.segment_id}")
+    finally:
+        set_active_tape(None)
+
+    runs = [Runner(yaml.safe_load(tape.to_yaml()), result_store=store, model="pd").run_many()
+            for _ in range(2)]
+    # The first run has nothing to compare to, the second compares to the first
+    assert np.isnan(runs[0]["delta PRIVAT"]["value"].value)
+    assert runs[1]["delta PRIVAT"]["value"] == 0
+
+    history = Runner(tape, result_store=store).result_store.history(
+        function, segment="PRIVAT", model="pd", last=2)
+    assert len(history) == 2
+    assert (history["value"] == runs[0]["auc PRIVAT"]["value"].value).all()
@@ -2,10 +2,16 @@ import pytest
 import numpy as np
 import pandas as pd
 import io
+import pyarrow as pa
+import logging
+import os
 from datetime import datetime
-from cr.data import DataSet
+from cr.data import DataSet, ArrowDataSet, ingestion
 from cr.data.segmentation import ByGroup, ByBins, Temporal
 from cr.data.segmentation.ordinal import get_bins_with_equally_many_observations
+from cr.data.ingestion import from_csv, infer_var_categories, from_parquet_out_of_core
+from cr.testing.metric import simple, streaming
+import cr.testing.metric as metric
 
 def get_df():
     csv_data = """
@@ -36,6 +42,14 @@ def test_indexing(dataset, df):
     np.testing.assert_array_equal(dataset['factor 1'], df["factor 1"].values)
     np.testing.assert_array_equal(dataset['segmentor 1'], df["segmentor 1"].values)
 
+def test_nbytes_computed_once(dataset, df, monkeypatch):
+    calls = []
+    memory_usage = pd.DataFrame.memory_usage
+    monkeypatch.setattr(pd.DataFrame, "memory_usage",
+                        lambda *args, **kwargs: calls.append(args) or memory_usage(*args, **kwargs))
+    assert dataset.nbytes == dataset.nbytes == int(memory_usage(df, deep=True).sum())
+    assert len(calls) == 1
+
 def test_nominal_segments_distinct(dataset, df):
     segments = dataset.segment(by="segmentor 1", method=ByGroup()).segments
     assert len(segments) == 2
@@ -134,3 +148,155 @@ def test_get_equally_spaced_bins(input_x, input_nr_of_bins, expected):
     np.testing.assert_array_equal(
         get_bins_with_equally_many_observations(input_x, input_nr_of_bins), expected)
 
+
+
+def test_arrow_dataset(df, tmp_path):
+    df["factor 3"] = [np.nan, 1., 2., 3., np.nan, 5., 6., 7.]
+    path = tmp_path.joinpath("data.arrow")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Keep NaN as a value rather than null, such that the column is not copied
+    table = table.set_column(table.schema.get_field_index("factor 3"), "factor 3",
+                             pa.array(df["factor 3"].values, from_pandas=False))
+    with pa.OSFile(str(path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    arrow_dataset = ArrowDataSet.from_ipc("dataset", path)
+    dataset = DataSet("dataset", df)
+    assert arrow_dataset.observations == dataset.observations
+    for column in df.columns:
+        np.testing.assert_array_equal(arrow_dataset[column], dataset[column])
+
+    # Views of the memory-mapped buffers
+    assert not arrow_dataset["factor 1"].flags.writeable
+    assert arrow_dataset.nbytes < dataset.nbytes
+
+    segment = arrow_dataset.segment(by="segmentor 1", method=ByGroup())["PRIVAT"]
+    assert segment.observations == 3
+    np.testing.assert_array_equal(segment["factor 1"], [9, 8, 6])
+
+    segments = arrow_dataset.segment(by="factor 3", method=ByBins(bins=[4])).segments
+    assert sum(segment.observations for segment in segments) == 8
+    assert np.isnan(arrow_dataset["factor 3"][0])
+
+
+def test_chunked_csv_ingestion(df, tmp_path, caplog):
+    df["segmentor 4"] = ["A", None, "B", "C", None, None, "D", "E"]
+    # Missing in the whole second chunk, which is parsed as floats
+    df["segmentor 5"] = ["A", "B", "C", None, None, None, "D", "E"]
+    path = tmp_path.joinpath("data.csv")
+    df.to_csv(path, index=False)
+
+    dtype = {"segmentor 1": str, "segmentor 2": np.int64}
+    with caplog.at_level(logging.INFO, logger="cr.data.ingestion"):
+        chunked = from_csv(str(path), chunksize=3, dtype=dtype)
+    whole = from_csv(str(path), dtype=dtype)
+
+    assert len([message for message in caplog.messages if "Ingested chunk" in message]) == 3
+    assert chunked.observations == whole.observations
+    for column in df.columns:
+        np.testing.assert_array_equal(chunked[column], whole[column])
+    assert list(whole["segmentor 4"][:2]) == ["A", "nan"]
+    assert list(chunked["segmentor 5"][2:5]) == ["C", "nan", "nan"]
+
+    # The strings of each chunk are dictionary encoded as it is read
+    assert chunked._df["segmentor 1"].dtype == "category"
+    pd.concat([df] * 1000).to_csv(path, index=False)
+    assert from_csv(str(path), chunksize=1000).nbytes < from_csv(str(path)).nbytes / 2
+
+
+def test_compact_ingestion(df, tmp_path, caplog):
+    path = tmp_path.joinpath("data.csv")
+    pd.concat([df] * 10).to_csv(path, index=False)
+
+    whole = from_csv(str(path))
+    with caplog.at_level(logging.INFO, logger="cr.data.ingestion"):
+        compact = from_csv(str(path), compact=True, compact_floats=True)
+
+    # Integers are not downcast further than int32 unless asked for, as sums may overflow
+    assert compact._df["target 1"].dtype == np.int32
+    assert compact._df["segmentor 2"].dtype == np.int32
+    small = from_csv(str(path), compact=True, compact_ints=True)
+    assert small._df["target 1"].dtype == np.int8 and small._df["segmentor 2"].dtype == np.int16
+    np.testing.assert_array_equal(small["target 1"], whole["target 1"])
+    assert compact._df["factor 2"].dtype == np.float32
+    assert compact._df["segmentor 1"].dtype == "category"
+    assert compact.nbytes < whole.nbytes / 2
+    assert any(message.startswith("Compacted segmentor 1") for message in caplog.messages)
+
+    np.testing.assert_array_equal(compact["segmentor 1"], whole["segmentor 1"])
+    np.testing.assert_allclose(compact["factor 2"], whole["factor 2"], rtol=1e-6)
+    segments = compact.segment(by="segmentor 1", method=ByGroup())
+    np.testing.assert_array_equal(segments["PRIVAT"]["factor 1"],
+                                  whole.segment(by="segmentor 1", method=ByGroup())["PRIVAT"]["factor 1"])
+
+
+def test_ingestion_cache(df, tmp_path, monkeypatch):
+    path = tmp_path.joinpath("data.csv")
+    df.to_csv(path, index=False)
+    read_csv = pd.read_csv
+    reads = []
+    monkeypatch.setattr(pd, "read_csv", lambda *args, **kwargs: reads.append(args) or read_csv(*args, **kwargs))
+
+    cache = ingestion.IngestionCache(tmp_path.joinpath("cache"))
+    ingestion.set_ingestion_cache(cache)
+    try:
+        first = ingestion.from_csv(str(path))
+        second = ingestion.from_csv(str(path))
+        assert len(reads) == 1
+        pd.testing.assert_frame_equal(first._df, second._df)
+
+        # A changed source is read again
+        df.iloc[:4].to_csv(path, index=False)
+        os.utime(path, ns=(0, 10**18))
+        assert ingestion.from_csv(str(path)).observations == 4
+        assert len(reads) == 2
+
+        cache.invalidate(path)
+        ingestion.from_csv(str(path))
+        assert len(reads) == 3
+
+        cache.max_bytes = cache.nbytes
+        ingestion.from_csv(str(path), ingestion_kwargs={"usecols": ["factor 1"]})
+        assert cache.nbytes <= cache.max_bytes
+        assert len(cache.entries) == 1
+    finally:
+        ingestion.set_ingestion_cache(None)
+
+
+@pytest.mark.parametrize('profiling', ['early_stop', 'sample'])
+def test_infer_var_categories_profiling(df, profiling):
+    df = pd.concat([df] * 300, ignore_index=True)
+    df["factor 3"] = np.arange(len(df))
+    df["segmentor 4"] = np.where(np.arange(len(df)) % 5 == 0, np.nan, np.arange(len(df)) % 11)
+    expected = infer_var_categories(df, profiling='exact')
+    assert "segmentor 4" in expected[1] and "factor 3" not in expected[1]
+    assert infer_var_categories(df, profiling=profiling, sample_size=1000) == expected
+
+
+def test_parquet_out_of_core_dataset(df, tmp_path):
+    df = pd.concat([df] * 5, ignore_index=True)
+    df.loc[3, "factor 2"] = np.nan
+    path = tmp_path.joinpath("data.parquet")
+    df.to_parquet(path, index=False, row_group_size=7)
+
+    out_of_core = from_parquet_out_of_core(str(path), "dataset")
+    in_memory = DataSet("dataset", df)
+    assert out_of_core.observations == len(df)
+    assert len(list(out_of_core.iter_chunks(["factor 2"]))) == 6
+
+    segments = zip(out_of_core.segment(by="segmentor 3", method=Temporal(frequency="yearly")),
+                   in_memory.segment(by="segmentor 3", method=Temporal(frequency="yearly")))
+    for streamed, materialised in segments:
+        assert streamed.segment_id == materialised.segment_id
+        np.testing.assert_array_equal(streamed["factor 2"], materialised["factor 2"])
+        assert streaming.missing(streamed, "factor 2")["value"] == simple.missing(materialised["factor 2"])["value"]
+        np.testing.assert_allclose(streaming.mean_value(streamed, "factor 2")["value"].value,
+                                   simple.mean_value(materialised["factor 2"])["value"].value)
+
+    privat, erhverv = out_of_core.segment(by="segmentor 1", method=ByGroup())["PRIVAT"], \
+        out_of_core.segment(by="segmentor 1", method=ByGroup())["ERHVERV"]
+    assert streaming.psi_numerical(privat, erhverv, "factor 1")["value"] == \
+        metric.psi_numerical(privat["factor 1"], erhverv["factor 1"])["value"]
+    assert streaming.migration_matrix(out_of_core, "segmentor 1", "target 1").to_dataframe().equals(
+        metric.migration_matrix(in_memory["segmentor 1"], in_memory["target 1"]).to_dataframe())
@@ -2,6 +2,12 @@ import pytest
 from cr.testing.result import *
 import plotly.express as px
 import numpy as np
+import pandas as pd
+from cr.testing.serialization import read_results, write_results
+from cr.data import DataSet
+from cr.testing.output import SourceReference, OutputCache, set_output_cache
+from cr.testing.metric.data_quality import (
+    _apply_metrics, aggregate_rag_result_table, data_quality_result_table)
 
 def test_Result():
     result = Result().add_outputs({
@@ -46,4 +52,177 @@ def test_ScalarRAGResult(scalar, red, amber, color):
     elif result.color == "AMBER":
         assert result.is_critical == False
         assert result.is_problematic == True
-        assert result.passed == False
\ No newline at end of file
+        assert result.passed == False
+
+def test_ResultTable_from_columns():
+    values = np.array([[0.1, 0.5], [0.3, np.nan]])
+    table = ResultTable.from_columns(
+        "TABLE", ["a", "b"], ["x", "y"],
+        columns={"name": "ENTRY", "value": values, "count": np.array([[1, 5], [3, 0]])},
+        cell=lambda outputs: ScalarResult(outputs.pop("name"), outputs.pop("value")).add_outputs(outputs))
+
+    assert table["results"]._output_type == OutputType.UNRESOLVED
+    assert table.to_dataframe("count", True)["y"].tolist() == [5, 0]
+    assert table.get_column_results("x", value=True).tolist() == [[0.1], [0.3]]
+    assert table["results"]._output_type == OutputType.UNRESOLVED
+
+    cell = table.get_result_subset("a", "y")[0, 0]
+    assert isinstance(cell, ScalarResult)
+    assert cell.value == 0.5 and cell["count"] == 5
+    assert table.to_dataframe("value", False).loc["b", "x"].value == 0.3
+
+    # A subset of the table slices the columns, without creating the Result of every cell
+    table = ResultTable.from_columns("TABLE", ["a", "b"], ["x", "y"], columns={"value": values})
+    subset = table.subset(["b"], ["x", "y"])
+    assert subset.row_names.value == ["b"] and subset.column_names.value == ["x", "y"]
+    assert subset["results"]._output_type == OutputType.UNRESOLVED
+    np.testing.assert_array_equal(subset.attribute_values("value"), [[0.3, np.nan]])
+    assert table.get_result_subset("b", "x")[0, 0]["value"].value == 0.3
+    assert table["results"]._output_type == OutputType.UNRESOLVED
+
+
+def _color(result):
+    return result["color"].value if result["color"] is not None else None
+
+
+def test_data_quality_result_table():
+    rng = np.random.default_rng(0)
+    a = rng.normal(size=200)
+    a[:30] = np.nan
+    dataset = DataSet("d", pd.DataFrame({
+        "a": a,
+        "b": rng.integers(0, 5, size=200).astype(float),
+        "c": np.full(200, np.nan),
+        "d": np.append(rng.normal(size=190), np.full(10, 50.0)),
+    }))
+    names = ["a", "b", "c", "d"]
+    vectors = [dataset[name] for name in names]
+    table = data_quality_result_table(vectors, names)
+    assert table["results"]._output_type == OutputType.UNRESOLVED
+
+    # The aggregate counts the colors of the cells, as those of the results of the metrics
+    baseline = np.array([_apply_metrics(table._metric_functions, v) for v in vectors])
+    for split_on_column in [True, False]:
+        aggregate = aggregate_rag_result_table(table, split_on_column)
+        cells = baseline if split_on_column else baseline.reshape(-1, 1)
+        names = table.column_names.value if split_on_column else ["ALL"]
+        expected = {}
+        for j, name in enumerate(names):
+            column = cells[:, j]
+            counted = [r for r in column if pd.notna(r["value"].value)]
+            if counted and any(_color(r) is not None for r in column):
+                expected[name] = [sum(_color(r) == color for r in counted)
+                                  for color in ["GREEN", "AMBER", "RED"]]
+                expected[name] += [len(column) - len(counted), len(column)]
+        assert aggregate["results"]._output_type == OutputType.UNRESOLVED
+        assert aggregate.column_names.value == list(expected)
+        assert aggregate.attribute_values("value").T.tolist() == list(expected.values())
+    assert aggregate_rag_result_table(table).attribute_values("value")[:, 0].tolist() == [2, 1, 1, 0, 4]
+
+    # The cells are the results of the metrics
+    assert table["results"]._output_type == OutputType.UNRESOLVED
+    for result, expected in zip(table.results.value.ravel(), baseline.ravel()):
+        assert type(result) is type(expected)
+        assert result.outputs == expected.outputs
+        assert _color(result) == _color(expected)
+        np.testing.assert_equal(result["value"].value, expected["value"].value)
+    assert table["histogram d"].value is not None
+
+
+def test_ScalarRAGResult_is_light():
+    result = ScalarRAGResult("TEST", 0.7, 0.5, 0.8)
+
+    assert not hasattr(result, "__dict__")
+    assert not hasattr(result["value"], "__dict__")
+    assert result["value"]._output_type is None
+    assert result["reasoning"]._output_type == OutputType.UNRESOLVED
+    assert result["reasoning"].value == "Value (0.7000) above amber threshold (0.5)"
+    assert result.scalar_to_color(0.3, 0.5, 0.2) == ("AMBER", "Value (0.3000) below amber threshold (0.5)")
+
+
+def test_SourceReference():
+    dataset = DataSet("d", pd.DataFrame({"x": [0.5, np.nan, 1.5, 2.5]}))
+    mask = np.isfinite(dataset["x"])
+    reference = SourceReference.of(dataset["x"], mask)
+    result = Result().add_outputs({"x": reference})
+
+    assert isinstance(reference, SourceReference) and len(reference) == 3
+    assert result["x"].output_type == OutputType.VECTOR
+    assert result["x"].value.tolist() == [0.5, 1.5, 2.5]
+    # Vectors not taken from a dataset are kept as is
+    assert SourceReference.of(np.array([1.0, 2.0]), np.array([True, False])).tolist() == [1.0]
+    # Vectors derived from a column are kept as is, not as a reference to the column
+    derived = SourceReference.of(1 - dataset["x"], mask)
+    assert not isinstance(derived, SourceReference)
+    assert np.asarray(derived).tolist() == [0.5, -0.5, -1.5]
+
+
+def test_OutputCache():
+    calls = []
+
+    def compute(i):
+        calls.append(i)
+        return np.zeros(1000)
+
+    result = Result().add_outputs({f"lazy {i}": lambda i=i: compute(i) for i in range(3)})
+    cache = OutputCache(max_bytes=16000)
+    set_output_cache(cache)
+    try:
+        for i in range(3):
+            assert result[f"lazy {i}"].value.shape == (1000,)
+        # The least recently read output is evicted and recomputed when read again
+        assert cache.evictions == 1 and len(cache) == 2
+        assert cache.nbytes == 16000
+        assert result["lazy 0"]._output_type == OutputType.UNRESOLVED
+        assert result.memory_usage()["lazy 0"] == 0
+        assert result["lazy 0"].value.shape == (1000,)
+        assert calls == [0, 1, 2, 0]
+        assert cache.evictions == 2 and cache.nbytes == 16000
+        assert result.memory_usage().sum() == 16000
+    finally:
+        set_output_cache(None)
+
+
+def test_serialization_round_trip(tmp_path):
+    rag = ScalarRAGResult("TEST", 0.7, 0.5, 0.8).add_outputs({
+        "vector": np.arange(5),
+        "labels": ["a", "b"],
+        "figure": lambda: px.scatter(x=[1, 2], y=[3, 4]),
+    })
+    rag._recording_uid = "uid-1"
+    table = ResultTable.from_columns(
+        "TABLE", ["a", "b"], ["x"], columns={"name": "ENTRY", "value": np.array([[0.1], [0.2]])},
+        cell=lambda outputs: ScalarResult(**outputs)).add_outputs({"rag": rag})
+
+    write_results(tmp_path / "results.parquet", {"rag": rag, "table": table})
+    results = read_results(tmp_path / "results.parquet")
+
+    assert isinstance(results["rag"], ScalarRAGResult)
+    assert results["rag"]._recording_uid == "uid-1"
+    assert results["rag"].color == "AMBER" and results["rag"].value == 0.7
+    assert results["rag"]["vector"].value.tolist() == [0, 1, 2, 3, 4]
+    assert results["rag"]["labels"].value == ["a", "b"]
+    assert results["rag"]["figure"]._output_type == OutputType.UNRESOLVED
+    assert results["rag"]["figure"].output_type == OutputType.FIGURE
+    assert results["table"]["rag"].value is results["rag"]
+    assert isinstance(results["table"].results.value[1, 0], ScalarResult)
+    assert results["table"].to_dataframe("value", True)["x"].tolist() == [0.1, 0.2]
+    assert ScalarRAGResult.from_arrow(rag.to_arrow())["reasoning"] == rag["reasoning"]
+
+
+def test_serialization_without_pickle(tmp_path):
+    result = Result().add_outputs({
+        "curves": [np.arange(3), np.linspace(0, 1, 5)],
+        "pair": (np.array([1.5]), np.array([[1, 2], [3, 4]])),
+    })
+    write_results(tmp_path / "arrays.parquet", {"result": result})
+    read = read_results(tmp_path / "arrays.parquet")["result"]
+    assert isinstance(read["curves"].value, list) and isinstance(read["pair"].value, tuple)
+    np.testing.assert_array_equal(read["curves"].value[1], np.linspace(0, 1, 5))
+    np.testing.assert_array_equal(read["pair"].value[1], [[1, 2], [3, 4]])
+
+    pickled = Result().add_outputs({"set": {1, 2}})
+    write_results(tmp_path / "pickled.parquet", {"result": pickled})
+    with pytest.raises(ValueError):
+        read_results(tmp_path / "pickled.parquet")
+    assert read_results(tmp_path / "pickled.parquet", allow_pickle=True)["result"]["set"].value == {1, 2}
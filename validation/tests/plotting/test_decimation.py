@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from cr.plotting.plotly.decimation import decimate, get_decimation, set_decimation
+
+
+def _errors(x, y, kept):
+    """ The vertical distance of every point to the curve drawn through the points kept """
+    errors = np.zeros(y.size)
+    for a, b in zip(kept[:-1], kept[1:]):
+        if x[b] != x[a]:
+            t = (x[a:b + 1] - x[a]) / (x[b] - x[a])
+        else:
+            t = np.linspace(0, 1, b - a + 1)
+        errors[a:b + 1] = np.abs(y[a:b + 1] - (y[a] + t * (y[b] - y[a])))
+    return errors
+
+
+def _kept(y, y_kept):
+    # The curves below are strictly increasing in y, so the points kept are found by y
+    return np.searchsorted(y, y_kept)
+
+
+@pytest.fixture
+def roc():
+    x = np.linspace(0, 1, 100_000)
+    return x, np.sqrt(x) + x * 1e-9
+
+
+def test_decimate_within_tolerance(roc):
+    x, y = roc
+    x_kept, y_kept = decimate(x, y, max_points=10_000, tolerance=1e-3)
+    assert 2 < x_kept.size < 1000
+    assert x_kept[0] == x[0] and x_kept[-1] == x[-1]
+    assert np.max(_errors(x, y, _kept(y, y_kept))) <= 1e-3 * (y.max() - y.min())
+
+
+def test_decimate_max_points(roc):
+    x, y = roc
+    x_kept, y_kept = decimate(x, y, max_points=20, tolerance=0)
+    assert x_kept.size == 20
+    assert x_kept[0] == x[0] and x_kept[-1] == x[-1]
+    assert np.all(np.diff(x_kept) > 0)
+
+
+def test_decimate_vertical_runs():
+    # A CAP curve of scores with ties rises vertically at each score
+    x = np.repeat(np.arange(100), 50).astype(float)
+    y = np.arange(x.size, dtype=float) ** 1.5
+    x_kept, y_kept = decimate(x, y, max_points=1000, tolerance=1e-3)
+    kept = _kept(y, y_kept)
+    assert x_kept.size < 1000
+    assert kept[0] == 0 and kept[-1] == x.size - 1
+    np.testing.assert_array_equal(x_kept, x[kept])
+    assert np.max(_errors(x, y, kept)) <= 1e-3 * (y.max() - y.min())
+
+
+def test_decimate_keeps_curves_with_nan(roc):
+    x, y = roc
+    y = y.copy()
+    y[10] = np.nan
+    x_kept, y_kept = decimate(x, y, max_points=100)
+    assert x_kept.size == x.size
+    np.testing.assert_array_equal(y_kept, y)
+
+
+def test_set_decimation(roc):
+    x, y = roc
+    default = get_decimation()
+    try:
+        set_decimation(None)
+        assert decimate(x, y)[0].size == x.size
+        set_decimation(50, 0)
+        assert decimate(x, y)[0].size == 50
+    finally:
+        set_decimation(*default)
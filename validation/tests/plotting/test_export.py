@@ -0,0 +1,68 @@
+import json
+import time
+
+import plotly.graph_objects as go
+import pytest
+
+from cr.plotting.plotly import export
+from cr.plotting.plotly.export import _batches, export_figures
+
+
+class StubRenderer(object):
+
+    def __init__(self, seconds=0.0):
+        self.seconds = seconds
+
+    def transform(self, figure, format):
+        time.sleep(self.seconds)
+        return json.dumps({"y": figure["data"][0]["y"], "format": format}).encode()
+
+
+@pytest.fixture
+def renderer(monkeypatch):
+    stub = StubRenderer()
+    monkeypatch.setattr(export, "get_renderer", lambda: stub)
+    return stub
+
+
+def _figures(tmp_path, n):
+    return [(go.Figure(go.Scatter(y=[i])), tmp_path.joinpath(f"{i}.png")) for i in range(n)]
+
+
+def test_batches(tmp_path):
+    batches = list(_batches(_figures(tmp_path, 7), batch_size=3))
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    figure, path = batches[0][0]
+    assert isinstance(figure, dict) and path == str(tmp_path.joinpath("0.png"))
+
+
+@pytest.mark.parametrize("processes", [0, 2])
+def test_export_figures(renderer, tmp_path, processes):
+    paths = export_figures(_figures(tmp_path, 7), format="svg", processes=processes, batch_size=3)
+    assert sorted(paths) == sorted(str(tmp_path.joinpath(f"{i}.png")) for i in range(7))
+    for i in range(7):
+        assert json.loads(tmp_path.joinpath(f"{i}.png").read_text()) == {"y": [i], "format": "svg"}
+
+
+def test_export_no_figures(renderer, monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError("No pool is started without figures")
+
+    monkeypatch.setattr(export, "ProcessPoolExecutor", no_pool)
+    assert export_figures([], processes=0) == []
+    assert export_figures(iter([]), processes=2) == []
+
+
+def test_export_bounds_batches_in_flight(renderer, tmp_path):
+    renderer.seconds = 0.02
+    outstanding = []
+
+    def figures():
+        for i, (figure, path) in enumerate(_figures(tmp_path, 20)):
+            outstanding.append(i - len(list(tmp_path.glob("*.png"))))
+            yield figure, path
+
+    export_figures(figures(), processes=1, batch_size=2)
+    # At most two batches per worker are submitted while the next batch is collected
+    assert max(outstanding) <= (2*1 + 1) * 2
+    assert len(list(tmp_path.glob("*.png"))) == 20
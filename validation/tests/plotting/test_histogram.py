@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from cr.plotting.plotly.data_quality_plots import MAX_NR_OF_BINS, figure_histogram
+
+
+@pytest.fixture
+def continuous():
+    return np.random.default_rng(0).normal(size=100_000)
+
+
+@pytest.fixture
+def discrete():
+    return np.random.default_rng(0).integers(0, 5, size=1000).astype(float) * 0.5
+
+
+def _bars(fig):
+    bar = fig.data[0]
+    width = np.ones(len(bar.x)) if bar.width is None else np.asarray(bar.width)
+    return np.asarray(bar.x), np.asarray(bar.y, dtype=float), width
+
+
+# The norms are those of histnorm of go.Histogram, for the bins drawn
+@pytest.mark.parametrize("norm,total", [["count", 100_000], ["percent", 100], ["probability", 1]])
+def test_histogram_norm_sums(continuous, norm, total):
+    x, y, _ = _bars(figure_histogram(continuous, "x", norm))
+    assert len(x) <= MAX_NR_OF_BINS
+    assert np.sum(y) == pytest.approx(total)
+
+
+@pytest.mark.parametrize("norm,area", [["density", 100_000], ["probability density", 1]])
+def test_histogram_density_areas(continuous, norm, area):
+    x, y, width = _bars(figure_histogram(continuous, "x", norm))
+    assert np.sum(y * width) == pytest.approx(area)
+
+
+@pytest.mark.parametrize("norm", ["count", "percent", "probability", "density", "probability density"])
+def test_histogram_of_values(discrete, norm):
+    x, y, _ = _bars(figure_histogram(discrete, "x", norm))
+    values, counts = np.unique(discrete, return_counts=True)
+    np.testing.assert_array_equal(x, values)
+    # Values drawn as bins are as wide as the values are apart, as plotly bins them
+    expected = {
+        "count": counts,
+        "percent": 100 * counts / counts.sum(),
+        "probability": counts / counts.sum(),
+        "density": counts / 0.5,
+        "probability density": counts / (counts.sum() * 0.5),
+    }[norm]
+    np.testing.assert_allclose(y, expected)
+
+
+def test_histogram_ignores_nan(discrete):
+    values = np.append(discrete, [np.nan, np.nan])
+    x, y, _ = _bars(figure_histogram(values, "x", "probability"))
+    assert np.sum(y) == pytest.approx(1)
@@ -0,0 +1,68 @@
+import json
+import re
+
+import plotly.graph_objects as go
+import pytest
+import yaml
+from plotly.offline import get_plotlyjs_version
+
+from cr.automation import recordable, Runner, set_active_tape, Tape
+from cr.reporting import Chapter, HtmlWriter, Report, Section
+from cr.testing.result import Result
+
+
+@recordable
+def some_figures_function(title):
+    return Result().add_outputs({
+        "value": "<b>&</b>",
+        "figure": go.Figure(go.Scatter(y=[1, 2]), layout={"title": title}),
+        "other figure": go.Figure(go.Bar(y=[3, 4])),
+    })
+
+
+@pytest.fixture
+def runner():
+    tape = Tape()
+    set_active_tape(tape)
+    try:
+        some_figures_function("</script><script>alert(1)</script>", recording_uuid="test")
+    finally:
+        set_active_tape(None)
+    return Runner(yaml.safe_load(tape.to_yaml()))
+
+
+def _report():
+    content = "1 < 2 & !<RES;test.value;>! as in !<REF;test.figure>!\n!<RES;test.figure;>!!<RES;test.other figure;>!"
+    return Report("Report", [
+        Chapter("Chapter", [Section("Same", content), Section("Same", "Again")]),
+        Chapter("Chapter", [Section("Same", "Once more")]),
+    ])
+
+
+def test_html_report(runner, tmp_path):
+    html = HtmlWriter(tmp_path, include_plotlyjs="cdn").write(_report(), runner).read_text(encoding="utf-8")
+
+    assert f'src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"' in html
+    # The text and results are escaped, and the references link to the results
+    assert "1 &lt; 2 &amp; " in html
+    assert '<span class="cr-result" id="res:test.value">&lt;b&gt;&amp;&lt;/b&gt;</span>' in html
+    assert '<a href="#res:test.figure">test.figure</a>' in html
+    assert 'id="res:test.figure"' in html
+
+    # The JSON of a figure does not close its script element
+    scripts = re.findall(r'<script type="application/json" id="([^"]+)">(.*?)</script>', html, re.S)
+    scripts = dict(scripts)
+    assert set(scripts) == {"cr-figure-0", "cr-figure-1", "cr-templates"}
+    assert "alert" not in html.replace(scripts["cr-figure-0"], "")
+    figure = json.loads(scripts["cr-figure-0"])
+    assert figure["layout"]["title"]["text"] == "</script><script>alert(1)</script>"
+    assert "template" not in figure["layout"]
+
+    # Both figures share the default template, which is embedded once
+    assert list(json.loads(scripts["cr-templates"])) == ["0"]
+    assert html.count('data-template="0"') == 2
+
+    # Chapters and sections of the same title get anchors of their own
+    ids = re.findall(r'<(?:h2|section) id="([^"]+)"', html)
+    assert ids == ["Chapter", "Chapter_Same", "Chapter_Same_2", "Chapter_2", "Chapter_Same_3"]
+    assert all(f'href="#{anchor}"' in html for anchor in ids)
@@ -0,0 +1,110 @@
+import os
+
+import plotly.graph_objects as go
+import pytest
+import yaml
+from scipy.stats import norm
+
+from cr.automation import recordable, Runner, set_active_tape, Tape
+from cr.reporting import Chapter, Report, Section
+from cr.reporting.writers.latex import writer as latex_writer
+from cr.reporting.writers.latex.writer import BuildManifest, LatexWriter
+from cr.testing.metric.hypothesis import figure_distribution
+from cr.testing.result import Result
+
+
+@recordable
+def some_figure_function(x):
+    return Result().add_outputs({"value": x, "figure": go.Figure(go.Scatter(y=[x, 2*x]))})
+
+
+@recordable
+def some_density_function(x):
+    figure = figure_distribution(norm.pdf, norm.ppf, x, (0, 0.05, 0.1, 1),
+                                 ("#F8696B", "#FFEB84", "#63BE7B"), ("red", "amber", "green"))
+    return Result().add_outputs({"figure": figure})
+
+
+@pytest.fixture
+def runner():
+    tape = Tape()
+    set_active_tape(tape)
+    try:
+        some_figure_function(1, recording_uuid="test")
+    finally:
+        set_active_tape(None)
+    return Runner(yaml.safe_load(tape.to_yaml()))
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    # The paths exported by each call of the exporter
+    calls = []
+
+    def stub_export(figures, format="png", processes=0):
+        paths = []
+        for figure, path in figures:
+            path.write_bytes(figure.to_json().encode())
+            paths.append(path)
+        calls.append(paths)
+        return paths
+
+    monkeypatch.setattr(latex_writer, "export_figures", stub_export)
+    return calls
+
+
+def _report(first: str, *others: str) -> Report:
+    sections = [Section("First", first)] + [Section(f"Section {i}", content)
+                                            for i, content in enumerate(others)]
+    return Report("Report", [Chapter("Chapter", sections)])
+
+
+def _files(path):
+    return {file: file.stat().st_mtime_ns for file in path.rglob("*") if file.is_file()}
+
+
+def _age(files):
+    for file in files:
+        os.utime(file, ns=(0, 0))
+
+
+def test_incremental_build(runner, exported, tmp_path):
+    path = tmp_path.joinpath("report")
+    report = _report("!<RES;test.figure;>!", "Value !<RES;test.value;>!", "Unchanged")
+    LatexWriter(path, overwrite="incremental").write(report, runner)
+    assert exported == [[path.joinpath("artifacts", "test__figure.png")]]
+    built = _files(path)
+    assert path.joinpath("Chapter", "Section_1.tex") in built
+
+    # Nothing changed, so nothing is written or exported
+    exported.clear()
+    _age(built)
+    LatexWriter(path, overwrite="incremental").write(report, runner)
+    assert exported == []
+    assert set(_files(path).values()) == {0}
+
+    # Only the section changed is rewritten, and the section removed is deleted
+    report = _report("!<RES;test.figure;>!", "Value changed !<RES;test.value;>!")
+    LatexWriter(path, overwrite="incremental").write(report, runner)
+    assert exported == []
+    rewritten = {file for file, mtime in _files(path).items() if mtime != 0}
+    assert rewritten == {path.joinpath("Chapter", "Section_0.tex"),
+                         path.joinpath("structure.tex"),
+                         path.joinpath(BuildManifest.FILE_NAME)}
+    assert not path.joinpath("Chapter", "Section_1.tex").exists()
+
+
+def test_density_figure_not_exported_again(exported, tmp_path):
+    tape = Tape()
+    set_active_tape(tape)
+    try:
+        some_density_function(1.0, recording_uuid="density")
+    finally:
+        set_active_tape(None)
+    path = tmp_path.joinpath("report")
+    report = _report("!<RES;density.figure;>!")
+
+    # The figure is drawn again by each build, and is the same figure every time
+    for _ in range(2):
+        LatexWriter(path, overwrite="incremental").write(report, Runner(yaml.safe_load(tape.to_yaml())))
+    assert exported == [[path.joinpath("artifacts", "density__figure.png")]]